@@ -1,19 +1,117 @@
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.worksheet.datavalidation import DataValidation
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from collections import Counter
 import os
+import sys
 from io import BytesIO
 
 # SharePoint ETL functions import
-from tools.sharepoint import load_env_vars, get_access_token, get_site_id, download_file
+from tools.sharepoint import get_session
+from input_data.period_calendar import PeriodCalendar, parse_period_labels
+from input_data.table_locator import SheetTableIndex
+from input_data.loan_tape import fetch_latest_loan_tape, select_latest_file
 
-def create_assumption_summary_excel():
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Assumption_Summary"
+# -------------------------------
+# Template styles and row-streamed sheets
+# -------------------------------
+_THIN = Side(style='thin')
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_TITLE_FONT = dict(name='Arial', size=12, bold=True)
+_HEADER_FONT = dict(name='Arial', size=10, bold=True)
+_CENTER = dict(horizontal='center', vertical='center')
+_LEFT = dict(horizontal='left', vertical='center')
+_ACCOUNTING_FORMAT = '_-* #,##0.00\\ _€_-;\\-* #,##0.00\\ _€_-;_-* "-"??\\ _€_-;_-@_-'
+
+# Every style the template uses, registered once per workbook as a named style
+TEMPLATE_STYLES = {
+    "lpvp_title": dict(font=_TITLE_FONT, border=True),
+    "lpvp_title_center": dict(font=_TITLE_FONT, alignment=_CENTER, border=True),
+    "lpvp_title_label_wrap": dict(font=_TITLE_FONT, alignment=dict(_LEFT, wrap_text=True), border=True),
+    "lpvp_date_header": dict(font=_HEADER_FONT, alignment=_CENTER, border=True),
+    "lpvp_label": dict(alignment=_LEFT, border=True),
+    "lpvp_label_wrap": dict(alignment=dict(_LEFT, wrap_text=True), border=True),
+    "lpvp_center": dict(alignment=_CENTER, border=True),
+    "lpvp_bordered": dict(border=True),
+    "lpvp_percent": dict(number_format='0.00%', alignment=_CENTER),
+    "lpvp_percent_input": dict(number_format='0.00%', alignment=_CENTER, border=True),
+    "lpvp_percent_whole_input": dict(number_format='0%', alignment=_CENTER, border=True),
+    "lpvp_accounting_input": dict(number_format=_ACCOUNTING_FORMAT, alignment=_CENTER, border=True),
+    "lpvp_date_input": dict(number_format='m/d/yy', alignment=_CENTER, border=True),
+    "lpvp_rate_input": dict(number_format='0.0000', alignment=_CENTER, border=True),
+}
+
+def create_template_workbook():
+    """Write-only workbook with the template named styles registered"""
+    wb = openpyxl.Workbook(write_only=True)
+    for name, spec in TEMPLATE_STYLES.items():
+        style = NamedStyle(name=name)
+        style.font = Font(**spec['font']) if 'font' in spec else DEFAULT_FONT
+        if 'alignment' in spec:
+            style.alignment = Alignment(**spec['alignment'])
+        if spec.get('border'):
+            style.border = _BORDER
+        if 'number_format' in spec:
+            style.number_format = spec['number_format']
+        wb.add_named_style(style)
+    return wb
+
+class TemplateSheet:
+    """
+    A row-streamed sheet of a write-only template workbook.
+
+    Rows go out once, top to bottom: write(row, cells) pads blank rows up to row.
+    Column widths must be known before the first row. cell() returns one shared cell
+    per (value, style), so a row of identical input cells costs one object.
+    """
+
+    def __init__(self, workbook, title, widths=None):
+        self.ws = workbook.create_sheet(title=title)
+        for col_letter, width in (widths or {}).items():
+            self.ws.column_dimensions[col_letter].width = width
+        self.last_row = 0
+        self._cells = {}
+
+    def cell(self, value=None, style=None):
+        key = (value, style)
+        if key not in self._cells:
+            cell = WriteOnlyCell(self.ws, value=value)
+            if style:
+                cell.style = style
+            self._cells[key] = cell
+        return self._cells[key]
+
+    def write(self, row, cells):
+        if row <= self.last_row:
+            raise ValueError(f"Row {row} of '{self.ws.title}' was already written (at row {self.last_row})")
+        for _ in range(self.last_row + 1, row):
+            self.ws.append([])
+        self.ws.append(cells)
+        self.last_row = row
+
+    def input_cells(self, row_values, keys, style, shared, default=""):
+        """Input cells of one row: the shared blank cells, or carried-over values by column key"""
+        if not row_values:
+            return shared
+        return [self.cell(row_values.get(key, default), style) for key in keys]
+
+    def merge(self, cell_range):
+        self.ws.merged_cells.add(cell_range)
+
+    def add_validation(self, validation, *cells):
+        self.ws.data_validations.append(validation)
+        for cell in cells:
+            validation.add(cell)
+
+def create_assumption_summary_excel(workbook=None, values=None):
+    wb = workbook or create_template_workbook()
+    inputs = (values or {}).get("summary", {})
+    sheet = TemplateSheet(wb, "Assumption_Summary", widths={'A': 60, 'B': 25, 'C': 25})
     
     data_structure = [
         ("Assumption Summary", "Input", "Accepted Format"),
@@ -39,242 +137,176 @@ def create_assumption_summary_excel():
         ("Sensitivity Table: Discount Rate Sensitivity Range", "", "%")
     ]
     
-    for i, (label, value, format) in enumerate(data_structure, 1):
-        ws[f'A{i}'] = label
-        ws[f'B{i}'] = value
-        ws[f'C{i}'] = format
-    
-    title_font = Font(name='Arial', size=12, bold=True)
-    for col in ['A', 'B', 'C']:
-        ws[f'{col}1'].font = title_font
+    # Input column formats by row
+    input_styles = {3: "lpvp_date_input", 4: "lpvp_date_input", 10: "lpvp_percent_whole_input",
+                    11: "lpvp_percent_input", 12: "lpvp_accounting_input", 13: "lpvp_accounting_input",
+                    14: "lpvp_accounting_input", 16: "lpvp_percent_whole_input", 17: "lpvp_percent_input",
+                    18: "lpvp_percent_input", 19: "lpvp_percent_input"}
     
-    ws.column_dimensions['A'].width = 60
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 25
+    for i, (label, value, format) in enumerate(data_structure, 1):
+        if i == 1:
+            cells = [sheet.cell(label, "lpvp_title_label_wrap"), sheet.cell(value, "lpvp_title_center"),
+                     sheet.cell(format, "lpvp_title_center")]
+        else:
+            cells = [sheet.cell(label, "lpvp_label_wrap"), sheet.cell(inputs.get(_label_key(label), {}).get("Input", value), input_styles.get(i, "lpvp_center")),
+                     sheet.cell(format, "lpvp_center")]
+        sheet.write(i, cells)
     
     yes_no_validation = DataValidation(type="list", formula1='"Yes,No"', allow_blank=False)
-    ws.add_data_validation(yes_no_validation)
-    yes_no_validation.add(ws['B7'])
-    yes_no_validation.add(ws['B9'])
-    
-    ws['B10'].number_format = '0%'
-    ws['B11'].number_format = '0.00%'
-    
-    for row in [12, 13, 14]:
-        ws[f'B{row}'].number_format = '_-* #,##0.00\\ _€_-;\\-* #,##0.00\\ _€_-;_-* "-"??\\ _€_-;_-@_-'
+    sheet.add_validation(yes_no_validation, 'B7', 'B9')
     
     curve_validation = DataValidation(type="list", 
                                     formula1='"Linear Curve,Exponential Curve,S-Curve"', 
                                     allow_blank=False)
-    ws.add_data_validation(curve_validation)
-    curve_validation.add(ws['B15'])
-    
-    ws['B16'].number_format = '0%'
-    
-    for row in [17, 18, 19]:
-        ws[f'B{row}'].number_format = '0.00%'
-    
-    date_format = 'm/d/yy'
-    ws['B3'].number_format = date_format
-    ws['B4'].number_format = date_format
-    
-    for row in range(1, 22):
-        for col in ['A', 'B', 'C']:
-            cell = ws[f'{col}{row}']
-            cell.alignment = Alignment(vertical='center', wrap_text=True)
-    
-    for row in range(1, 22):
-        ws[f'A{row}'].alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-        ws[f'B{row}'].alignment = Alignment(horizontal='center', vertical='center')
-        ws[f'C{row}'].alignment = Alignment(horizontal='center', vertical='center')
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    for row in range(1, 22):
-        for col in ['A', 'B', 'C']:
-            ws[f'{col}{row}'].border = thin_border
+    sheet.add_validation(curve_validation, 'B15')
     
     return wb
 
-def load_loans_dataframe_from_stream(file_stream, sheet_name='Loans'):
-    """Load loans dataframe from BytesIO stream instead of file path"""
-    try:
-        file_stream.seek(0)
-        df = pd.read_excel(file_stream, sheet_name=sheet_name, header=0)
-        return df
-    except Exception as e:
-        print(f"Error loading Loans DataFrame: {str(e)}")
-        return None
+# Valuation date of the templates (the tape carries no as-of date)
+TEMPLATE_VALUATION_DATE = pd.Timestamp('2020-09-05')
 
-def find_data_tape_file(downloaded_files):
-    """Find the data tape file from downloaded files"""
-    for file_stream, filename in downloaded_files:
-        if any(keyword in filename.lower() for keyword in ['data', 'datatape', 'simple', 'loan']):
-            return file_stream, filename
-    
-    for file_stream, filename in downloaded_files:
-        if filename.lower().endswith(('.xlsx', '.xls')):
-            return file_stream, filename
-    
-    return None, None
+DEFAULT_LOAN_TYPES = (
+    "Medium / Long Term Loan", "RE Leasing", "Overdraft", "Syndicated Loan",
+    "Called Bank Guarantee", "Uncalled Bank Guarantee", "Factoring", 
+    "Residential Mortgage", "Credit Card", "Corporate/ Development Loan",
+    "Current Account", "Non RE Leasing", "Discounted Bill/ Note", 
+    "Consumer Loan", "Other", "Trade Finance", "Restructured Loan"
+)
+DEFAULT_CURRENCIES = ('EUR', 'USD', 'GBP')
 
-def get_valuation_and_max_maturity_dates(loans_df):
-    valuation_date = pd.to_datetime('2020-09-05')
-    
-    max_maturity_date = None
-    if loans_df is not None and 'Maturity Date' in loans_df.columns:
-        maturity_dates = pd.to_datetime(loans_df['Maturity Date'], errors='coerce')
-        max_maturity_date = maturity_dates.max()
-    return valuation_date, max_maturity_date
-
-def generate_month_end_dates_list(valuation_date, max_maturity_date):
-    dates = []
-    dates.append(valuation_date)
-    
-    current = valuation_date.replace(day=1)
-    current = current + pd.DateOffset(months=1) - pd.DateOffset(days=1)
-    
-    if current <= valuation_date:
-        current = current + pd.DateOffset(months=1)
-        current = current.replace(day=1) + pd.DateOffset(months=1) - pd.DateOffset(days=1)
-    
-    while current.year < max_maturity_date.year or (current.year == max_maturity_date.year and current.month <= max_maturity_date.month):
-        dates.append(current)
-        current = current + pd.DateOffset(months=1)
-        current = current.replace(day=1) + pd.DateOffset(months=1) - pd.DateOffset(days=1)
-    
-    return dates
-
-def create_date_columns_with_percentage_format(worksheet, date_list, start_col=2, start_row=1):
-    for i, date in enumerate(date_list):
-        col_num = start_col + i
-        cell = worksheet.cell(row=start_row, column=col_num, value=date.strftime('%m/%d/%Y'))
-        cell.font = Font(name='Arial', size=10, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        col_letter = openpyxl.utils.get_column_letter(col_num)
-        worksheet.column_dimensions[col_letter].width = 12
-    
-    return len(date_list)
+LOAN_TYPE_COLUMNS = ['Type of Loan', 'Loan Type', 'type of loan', 'loan type']
+GUARANTEE_TYPE_COLUMNS = ['Type of Guarantees', 'Type of Guarantee', 'Guarantees Type', 'Guarantee Type']
+
+class TapeProfile:
+    """
+    Everything the template sheets need from a data tape, computed once by
+    profile_data_tape() and read-only afterwards:
+
+    - loan_types, guarantee_types, currencies: sorted distinct values (tuples)
+    - index_counts: ((index, loans), ...) most used first; None when the tape has no Index column
+    - valuation_date / max_maturity_date: the template horizon
+    - columns: which tape column each field came from
+    """
+
+    __slots__ = ('rows', 'loan_types', 'index_counts', 'index_nulls', 'currencies',
+                 'guarantee_types', 'valuation_date', 'max_maturity_date', 'columns')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"TapeProfile is immutable (tried to set {name})")
+
+    @property
+    def indices(self):
+        return None if self.index_counts is None else tuple(index for index, _ in self.index_counts)
+
+    def calendar(self):
+        return PeriodCalendar.from_horizon(self.valuation_date, self.max_maturity_date)
 
-def analyze_loan_types(loans_df):
+    def replace(self, **fields):
+        """Copy with some fields changed"""
+        return TapeProfile(**{name: fields.get(name, getattr(self, name)) for name in self.__slots__})
+
+    def template_loan_types(self):
+        """Loan types for the curve tables; the standard list when the tape has none"""
+        return self.loan_types or DEFAULT_LOAN_TYPES
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'loan_types': len(self.loan_types),
+            'indices': None if self.index_counts is None else len(self.index_counts),
+            'currencies': len(self.currencies),
+            'guarantee_types': len(self.guarantee_types),
+            'valuation_date': str(self.valuation_date.date()),
+            'max_maturity_date': None if pd.isna(self.max_maturity_date) else str(self.max_maturity_date.date()),
+            'columns': dict(self.columns),
+        }
+
+    def __repr__(self):
+        return f"TapeProfile({self.summary()!r})"
+
+def _distinct(values):
+    # Distinct first, then drop NaN from the (small) set of uniques
+    return [value for value in values.unique() if not pd.isna(value)]
+
+def profile_data_tape(loans_df):
+    """
+    One pass over the tape: locate the columns once (names stripped once, the frame
+    is not modified), then take each column's distinct values / counts / range.
+    """
     if loans_df is None:
-        return []
-    
-    loan_type_column = None
-    possible_columns = ['Type of Loan', 'Loan Type', 'type of loan', 'loan type']
-    
-    for col_name in possible_columns:
-        if col_name in loans_df.columns:
-            loan_type_column = col_name
-            break
-    
-    if loan_type_column:
-        loan_types = loans_df[loan_type_column].dropna().unique()
-        loan_types = sorted([str(lt) for lt in loan_types])
-        return loan_types
-    else:
-        return []
+        loans_df = pd.DataFrame()
+    names = {str(col).strip(): col for col in reversed(list(loans_df.columns)) if pd.notna(col)}
+    stripped = list(dict.fromkeys(str(col).strip() for col in loans_df.columns if pd.notna(col)))
 
-def create_assumption_loans_sheet(workbook, loans_df, date_list):
-    ws_loans = workbook.create_sheet(title="Assumption_Loans")
-    
-    loan_types = analyze_loan_types(loans_df)
-    
-    if not loan_types:
-        loan_types = [
-            "Medium / Long Term Loan", "RE Leasing", "Overdraft", "Syndicated Loan",
-            "Called Bank Guarantee", "Uncalled Bank Guarantee", "Factoring", 
-            "Residential Mortgage", "Credit Card", "Corporate/ Development Loan",
-            "Current Account", "Non RE Leasing", "Discounted Bill/ Note", 
-            "Consumer Loan", "Other", "Trade Finance", "Restructured Loan"
-        ]
-    
-    ws_loans['A1'] = "Cost of Risk - Loan with Guarantee"
-    ws_loans['A1'].font = Font(name='Arial', size=12, bold=True)
-    
-    create_date_columns_with_percentage_format(ws_loans, date_list, start_col=2, start_row=1)
-    
-    for i, loan_type in enumerate(loan_types, 2):
-        ws_loans.cell(row=i, column=1, value=loan_type)
-        ws_loans.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
-        
-        for col_idx in range(2, len(date_list) + 2):
-            cell = ws_loans.cell(row=i, column=col_idx, value="")
-            cell.number_format = '0.00%'
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    def first_of(candidates):
+        return next((names[name] for name in candidates if name in names), None)
+
+    loan_type_col = first_of(LOAN_TYPE_COLUMNS)
+    index_col = first_of(['Index'])
+    maturity_col = first_of(['Maturity Date'])
+    currency_col = first_of(['Currency'])
+    if currency_col is None:
+        currency_like = [name for name in stripped if 'currency' in name.lower() or 'curr' in name.lower()]
+        currency_col = names[currency_like[0]] if currency_like else None
+    guarantee_col = first_of(GUARANTEE_TYPE_COLUMNS)
+    if guarantee_col is None:
+        guarantee_like = [name for name in stripped if 'guarantee' in name.lower()]
+        guarantee_col = names[guarantee_like[-1]] if guarantee_like else None
+
+    loan_types = ()
+    if loan_type_col is not None:
+        loan_types = tuple(sorted(str(value) for value in _distinct(loans_df[loan_type_col])))
+
+    index_counts, index_nulls = None, 0
+    if index_col is not None:
+        counts = loans_df[index_col].value_counts(dropna=False)
+        missing = counts.index.isna()
+        index_nulls = int(counts[missing].sum())
+        counts = counts[~missing].sort_values(ascending=False)
+        index_counts = tuple((index, int(count)) for index, count in counts.items())
+
+    currencies = ()
+    if currency_col is not None:
+        currencies = tuple(sorted(_distinct(loans_df[currency_col])))
+
+    guarantee_types = ()
+    if guarantee_col is not None:
+        guarantee_types = tuple(sorted(str(value).strip() for value in _distinct(loans_df[guarantee_col])))
+
+    max_maturity_date = None
+    if maturity_col is not None:
+        max_maturity_date = pd.to_datetime(loans_df[maturity_col], errors='coerce').max()
+
+    return TapeProfile(
+        rows=len(loans_df),
+        loan_types=loan_types,
+        index_counts=index_counts,
+        index_nulls=index_nulls,
+        currencies=currencies or DEFAULT_CURRENCIES,
+        guarantee_types=guarantee_types,
+        valuation_date=TEMPLATE_VALUATION_DATE,
+        max_maturity_date=max_maturity_date,
+        columns={'loan_type': loan_type_col, 'index': index_col, 'maturity': maturity_col,
+                 'currency': currency_col, 'guarantee_type': guarantee_col},
     )
-    
-    first_table_rows = len(loan_types) + 1
-    first_table_cols = len(date_list) + 1
-    
-    for row in range(1, first_table_rows + 1):
-        for col in range(1, first_table_cols + 1):
-            ws_loans.cell(row=row, column=col).border = thin_border
-    
-    second_table_start_row = first_table_rows + 4
-    
-    ws_loans.cell(row=second_table_start_row, column=1, value="Prepayment Risk - Loan with Guarantee")
-    ws_loans.cell(row=second_table_start_row, column=1).font = Font(name='Arial', size=12, bold=True)
-    
-    for i, date in enumerate(date_list):
-        col_num = i + 2
-        cell = ws_loans.cell(row=second_table_start_row, column=col_num, value=date.strftime('%m/%d/%Y'))
-        cell.font = Font(name='Arial', size=10, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for i, loan_type in enumerate(loan_types, second_table_start_row + 1):
-        ws_loans.cell(row=i, column=1, value=loan_type)
-        ws_loans.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
-        
-        for col_idx in range(2, len(date_list) + 2):
-            cell = ws_loans.cell(row=i, column=col_idx, value="")
-            cell.number_format = '0.00%'
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    second_table_rows = len(loan_types) + 1
-    
-    for row in range(second_table_start_row, second_table_start_row + second_table_rows):
-        for col in range(1, first_table_cols + 1):
-            ws_loans.cell(row=row, column=col).border = thin_border
-    
-    third_table_start_row = second_table_start_row + second_table_rows + 4
-    
-    third_table_headers = ["Types of Loans", "Discount Rate", "Non-interest fees (over undrawn commitment)", "Non-interest fees (over outstanding balance)", "Servicing Fee"]
-    
-    for col, header in enumerate(third_table_headers, 1):
-        cell = ws_loans.cell(row=third_table_start_row, column=col, value=header)
-        cell.font = Font(name='Arial', size=12, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for i, loan_type in enumerate(loan_types, third_table_start_row + 1):
-        ws_loans.cell(row=i, column=1, value=loan_type)
-        ws_loans.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
-        
-        for col_idx in range(2, 6):
-            cell = ws_loans.cell(row=i, column=col_idx, value="")
-            cell.number_format = '0.00%'
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    third_table_rows = len(loan_types) + 1
-    third_table_cols = 5
-    
-    for row in range(third_table_start_row, third_table_start_row + third_table_rows):
-        for col in range(1, third_table_cols + 1):
-            ws_loans.cell(row=row, column=col).border = thin_border
-    
-    fourth_table_start_row = third_table_start_row + third_table_rows + 4
+
+def date_header_cells(sheet, calendar):
+    return [sheet.cell(label, "lpvp_date_header") for label in calendar.template_labels]
+
+def create_assumption_loans_sheet(workbook, profile, calendar, values=None):
+    """
+    Assumption_Loans: Cost of Risk and Prepayment Risk curves (loan type x month-end),
+    rates & fees, recovery rate per vintage and, when the tape has any, the guarantee
+    recovery table. Rows are streamed top to bottom, so the guarantee table is written here as well.
+    values: inputs carried over from an existing template (read_existing_template).
+    Returns (number of loan types, last row of the recovery table).
+    """
+    values = values or {}
+    loan_types = profile.template_loan_types()
     
     fourth_table_headers = [
         "Types of Loans", 
@@ -306,179 +338,102 @@ def create_assumption_loans_sheet(workbook, loans_df, date_list):
         "30"
     ]
     
-    ws_loans.cell(row=fourth_table_start_row, column=1, value="Recovery Rate per Vintage")
-    ws_loans.cell(row=fourth_table_start_row, column=1).font = Font(name='Arial', size=12, bold=True)
-    ws_loans.cell(row=fourth_table_start_row, column=1).alignment = Alignment(horizontal='center', vertical='center')
-    
-    ws_loans.merge_cells(start_row=fourth_table_start_row, start_column=1, 
-                        end_row=fourth_table_start_row + 1, end_column=1)
-    
-    for col, header in enumerate(fourth_table_headers[1:], 2):
-        cell = ws_loans.cell(row=fourth_table_start_row, column=col, value=header)
-        cell.font = Font(name='Arial', size=10, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        col_letter = openpyxl.utils.get_column_letter(col)
-        ws_loans.column_dimensions[col_letter].width = 15
-    
-    for col, day_value in enumerate(day_values[1:], 2):
-        cell = ws_loans.cell(row=fourth_table_start_row + 1, column=col, value=day_value)
-        cell.font = Font(name='Arial', size=10, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    data_start_row = fourth_table_start_row + 2
-    
-    for i, loan_type in enumerate(loan_types, data_start_row):
-        ws_loans.cell(row=i, column=1, value=loan_type)
-        ws_loans.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
-        
-        for col_idx in range(2, len(fourth_table_headers) + 1):
-            cell = ws_loans.cell(row=i, column=col_idx, value="")
-            cell.number_format = '0.00%'
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    fourth_table_rows = len(loan_types) + 2
-    fourth_table_cols = len(fourth_table_headers)
+    # Widths: date columns 12, vintage columns 15, then A and B-E
+    widths = {openpyxl.utils.get_column_letter(col): 12 for col in range(2, calendar.n_periods + 2)}
+    widths.update({openpyxl.utils.get_column_letter(col): 15 for col in range(2, len(fourth_table_headers) + 1)})
+    widths.update({'A': 35, 'B': 18, 'C': 18, 'D': 18, 'E': 18})
+    sheet = TemplateSheet(workbook, "Assumption_Loans", widths=widths)
     
-    for row in range(fourth_table_start_row, fourth_table_start_row + fourth_table_rows):
-        for col in range(1, fourth_table_cols + 1):
-            ws_loans.cell(row=row, column=col).border = thin_border
+    dates = date_header_cells(sheet, calendar)
+    percent_inputs = [sheet.cell("", "lpvp_percent_input")] * calendar.n_periods
     
-    ws_loans.column_dimensions['A'].width = 35
+    date_keys = calendar.iso_labels
     
-    for col_letter in ['B', 'C', 'D', 'E']:
-        ws_loans.column_dimensions[col_letter].width = 18
-    
-    return len(loan_types), fourth_table_start_row + fourth_table_rows
-
-def analyze_index_column_from_df(loans_df):
-    try:
-        if loans_df is None:
-            return None
-        
-        valuation_date, max_maturity_date = get_valuation_and_max_maturity_dates(loans_df)
-        
-        if 'Index' in loans_df.columns:
-            index_column = loans_df['Index']
-            non_null_values = index_column.dropna()
-            value_counts = non_null_values.value_counts().sort_values(ascending=False)
-                
-            return {
-                'total_rows': len(loans_df),
-                'total_index_values': len(non_null_values),
-                'null_values': index_column.isnull().sum(),
-                'unique_count': len(value_counts),
-                'value_counts': value_counts.to_dict(),
-                'value_counts_series': value_counts,
-                'valuation_date': valuation_date,
-                'max_maturity_date': max_maturity_date,
-                'loans_df': loans_df
-            }
-        else:
-            return None
-            
-    except Exception as e:
-        print(f"Index analysis error: {str(e)}")
-        return None
-
-def create_index_analysis_sheet(workbook, analysis_result):
-    if not analysis_result:
-        return
-    
-    ws_analysis = workbook.create_sheet(title="Index_Analysis")
+    # Cost of Risk
+    sheet.write(1, [sheet.cell("Cost of Risk - Loan with Guarantee", "lpvp_title")] + dates)
+    carried = values.get("cost_risk", {})
+    for i, loan_type in enumerate(loan_types, 2):
+        sheet.write(i, [sheet.cell(loan_type, "lpvp_label")]
+                    + sheet.input_cells(carried.get(_label_key(loan_type)), date_keys, "lpvp_percent_input", percent_inputs))
     
-    ws_analysis['A1'] = "Index Type"
-    ws_analysis['A1'].font = Font(name='Arial', size=12, bold=True)
+    first_table_rows = len(loan_types) + 1
+    second_table_start_row = first_table_rows + 4
     
-    valuation_date = analysis_result['valuation_date']
-    max_maturity_date = analysis_result['max_maturity_date']
-    month_end_dates = generate_month_end_dates_list(valuation_date, max_maturity_date)
+    # Prepayment Risk
+    sheet.write(second_table_start_row, [sheet.cell("Prepayment Risk - Loan with Guarantee", "lpvp_title")] + dates)
+    carried = values.get("prepayment_risk", {})
+    for i, loan_type in enumerate(loan_types, second_table_start_row + 1):
+        sheet.write(i, [sheet.cell(loan_type, "lpvp_label")]
+                    + sheet.input_cells(carried.get(_label_key(loan_type)), date_keys, "lpvp_percent_input", percent_inputs))
     
-    total_columns = len(month_end_dates) + 10
+    second_table_rows = len(loan_types) + 1
+    third_table_start_row = second_table_start_row + second_table_rows + 4
     
-    create_date_columns_with_percentage_format(ws_analysis, month_end_dates, start_col=2, start_row=1)
+    # Rates & fees
+    third_table_headers = ["Types of Loans", "Discount Rate", "Non-interest fees (over undrawn commitment)", "Non-interest fees (over outstanding balance)", "Servicing Fee"]
+    sheet.write(third_table_start_row, [sheet.cell(header, "lpvp_title_center") for header in third_table_headers])
+    rates_fees_inputs = [sheet.cell("", "lpvp_percent_input")] * 4
+    carried = values.get("rates_fees", {})
+    for i, loan_type in enumerate(loan_types, third_table_start_row + 1):
+        sheet.write(i, [sheet.cell(loan_type, "lpvp_label")]
+                    + sheet.input_cells(carried.get(_label_key(loan_type)), third_table_headers[1:], "lpvp_percent_input", rates_fees_inputs))
     
-    value_counts = analysis_result['value_counts_series']
+    third_table_rows = len(loan_types) + 1
+    fourth_table_start_row = third_table_start_row + third_table_rows + 4
     
-    for i, (index_type, count) in enumerate(value_counts.items(), 2):
-        ws_analysis.cell(row=i, column=1, value=index_type)
-        ws_analysis.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
+    # Recovery Rate per Vintage: two header rows, A merged over both
+    sheet.write(fourth_table_start_row, [sheet.cell("Recovery Rate per Vintage", "lpvp_title_center")]
+                + [sheet.cell(header, "lpvp_date_header") for header in fourth_table_headers[1:]])
+    sheet.write(fourth_table_start_row + 1, [sheet.cell(None, "lpvp_bordered")]
+                + [sheet.cell(day_value, "lpvp_date_header") for day_value in day_values[1:]])
+    sheet.merge(f"A{fourth_table_start_row}:A{fourth_table_start_row + 1}")
     
-    ws_analysis.column_dimensions['A'].width = 35
+    data_start_row = fourth_table_start_row + 2
+    vintage_inputs = [sheet.cell("", "lpvp_percent_input")] * (len(fourth_table_headers) - 1)
+    carried = values.get("recovery_vintage", {})
+    for i, loan_type in enumerate(loan_types, data_start_row):
+        sheet.write(i, [sheet.cell(loan_type, "lpvp_label")]
+                    + sheet.input_cells(carried.get(_label_key(loan_type)), fourth_table_headers[1:], "lpvp_percent_input", vintage_inputs))
     
-    for i in range(len(month_end_dates), len(month_end_dates) + 10):
-        col_letter = openpyxl.utils.get_column_letter(i + 2)
-        ws_analysis.column_dimensions[col_letter].width = 12
-        
-        for row in range(2, len(value_counts) + 2):
-            cell = ws_analysis.cell(row=row, column=i + 2)
-            cell.number_format = '0.00%'
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    fourth_table_rows = len(loan_types) + 2
+    last_table_end = fourth_table_start_row + fourth_table_rows
     
-    total_rows = len(value_counts) + 1
+    if profile.guarantee_types:
+        add_guarantee_recovery_table_to_loans_sheet(sheet, profile.guarantee_types, last_table_end,
+                                                    values.get("guarantee_recovery"))
     
-    for row in range(1, total_rows + 1):
-        for col_idx in range(1, total_columns + 1):
-            ws_analysis.cell(row=row, column=col_idx).border = thin_border
+    return len(loan_types), last_table_end
 
-def analyze_currencies_from_df(loans_df, filename=""):
-    try:
-        filename = filename.lower()
-        loans_currencies = set()
-        
-        if loans_df is not None:
-            loans_df.columns = loans_df.columns.str.strip()
-            
-            if 'Currency' in loans_df.columns:
-                loans_currencies = set(loans_df['Currency'].dropna().unique())
-            else:
-                currency_like_columns = [col for col in loans_df.columns if 'currency' in str(col).lower() or 'curr' in str(col).lower()]
-                if currency_like_columns:
-                    currency_col = currency_like_columns[0]
-                    loans_currencies = set(loans_df[currency_col].dropna().unique())
-        
-        all_currencies = sorted(list(loans_currencies)) if loans_currencies else ['EUR', 'USD', 'GBP']
-        return all_currencies
-        
-    except Exception as e:
-        print(f"Currency analysis error: {str(e)}")
-        return ['EUR', 'USD', 'GBP']
-
-def analyze_guarantee_types_from_df(loans_df, filename=""):
-    try:
-        filename = filename.lower()
-        guarantee_types = []
-        
-        if loans_df is not None:
-            loans_df.columns = [str(col).strip() if pd.notna(col) else col for col in loans_df.columns]
-
-            possible_columns = ['Type of Guarantees', 'Type of Guarantee', 'Guarantees Type', 'Guarantee Type']
-            
-            for col_name in possible_columns:
-                if col_name in loans_df.columns:
-                    guarantee_types = loans_df[col_name].dropna().unique()
-                    guarantee_types = sorted([str(gt).strip() for gt in guarantee_types])
-                    break
-            
-            if not guarantee_types:
-                guarantee_cols = [col for col in loans_df.columns if pd.notna(col) and 'guarantee' in str(col).lower()]
-                if guarantee_cols:
-                    col_name = guarantee_cols[-1]
-                    guarantee_types = loans_df[col_name].dropna().unique()
-                    guarantee_types = sorted([str(gt).strip() for gt in guarantee_types])
-        
-        return guarantee_types
-        
-    except Exception as e:
-        print(f"Guarantee types analysis error: {str(e)}")
-        return []
+def create_index_analysis_sheet(workbook, profile, calendar=None, values=None):
+    if profile.index_counts is None:
+        return
+    
+    calendar = calendar or profile.calendar()
+    n_dates = calendar.n_periods
+    
+    # Bordered grid: A + dates + 9 spare columns; the 10 columns after the dates take % inputs
+    total_columns = n_dates + 10
+    widths = {openpyxl.utils.get_column_letter(col): 12 for col in range(2, n_dates + 12)}
+    widths['A'] = 35
+    sheet = TemplateSheet(workbook, "Index_Analysis", widths=widths)
+    
+    bordered = sheet.cell(None, "lpvp_bordered")
+    sheet.write(1, [sheet.cell("Index Type", "lpvp_title")] + date_header_cells(sheet, calendar)
+                + [bordered] * (total_columns - n_dates - 1))
+    
+    spare_inputs = [sheet.cell(None, "lpvp_percent_input")] * (total_columns - n_dates - 1) + [sheet.cell(None, "lpvp_percent")]
+    date_keys = calendar.iso_labels
+    spare_keys = [f"+{k}" for k in range(len(spare_inputs))]  # spare columns have no header: keyed by offset
+    carried = (values or {}).get("index_type", {})
+    for i, index_type in enumerate(profile.indices, 2):
+        row_values = carried.get(_label_key(index_type))
+        if row_values:
+            cells = (sheet.input_cells(row_values, date_keys, "lpvp_bordered", None, None)
+                     + sheet.input_cells(row_values, spare_keys[:-1], "lpvp_percent_input", None, None)
+                     + [sheet.cell(row_values.get(spare_keys[-1]), "lpvp_percent")])
+        else:
+            cells = [bordered] * n_dates + spare_inputs
+        sheet.write(i, [sheet.cell(index_type, "lpvp_label")] + cells)
 
 def generate_currency_pairs(currencies):
     currency_pairs = []
@@ -490,271 +445,387 @@ def generate_currency_pairs(currencies):
     
     return currency_pairs
 
-def add_guarantee_recovery_table_to_loans_sheet(ws_loans, guarantee_types, start_row):
+def add_guarantee_recovery_table_to_loans_sheet(loans_sheet, guarantee_types, start_row, values=None):
+    """Guarantee recovery table three rows below start_row of the Assumption_Loans TemplateSheet"""
+    values = values or {}
     table_start_row = start_row + 3
 
     headers = ["Types of Guarantee", "Recovery Rate", "Accepted Format"]
-    for col, header in enumerate(headers, 1):
-        cell = ws_loans.cell(row=table_start_row, column=col, value=header)
-        cell.font = Font(name='Arial', size=12, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
+    loans_sheet.write(table_start_row, [loans_sheet.cell(header, "lpvp_title_center") for header in headers])
     
     for i, guarantee_type in enumerate(guarantee_types, table_start_row + 1):
-        ws_loans.cell(row=i, column=1, value=guarantee_type)
-        ws_loans.cell(row=i, column=1).alignment = Alignment(horizontal='left', vertical='center')
-        
-        rate_cell = ws_loans.cell(row=i, column=2, value="")
-        rate_cell.number_format = '0.00%'
-        rate_cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        ws_loans.cell(row=i, column=3, value="%")
-        ws_loans.cell(row=i, column=3).alignment = Alignment(horizontal='center', vertical='center')
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    table_rows = len(guarantee_types) + 1
-    for row in range(table_start_row, table_start_row + table_rows):
-        for col in range(1, 4):
-            ws_loans.cell(row=row, column=col).border = thin_border
+        loans_sheet.write(i, [loans_sheet.cell(guarantee_type, "lpvp_label"),
+                              loans_sheet.cell(values.get(_label_key(guarantee_type), {}).get("Recovery Rate", ""), "lpvp_percent_input"),
+                              loans_sheet.cell("%", "lpvp_center")])
     
     return len(guarantee_types)
 
-def create_assumption_currency_sheet(workbook, currencies, loans_df=None):
-    ws_currency = workbook.create_sheet(title="Assumption_Currency")
+def create_assumption_currency_sheet(workbook, profile, values=None):
+    values = values or {}
+    sheet = TemplateSheet(workbook, "Assumption_Currency", widths={'A': 30, 'B': 18, 'C': 25})
     
-    currency_pairs = generate_currency_pairs(currencies)
+    currency_pairs = generate_currency_pairs(profile.currencies)
     
     headers = ["Quote Currency", "Base Currency", "Exchange Rate at Valuation Date"]
-    for col, header in enumerate(headers, 1):
-        cell = ws_currency.cell(row=1, column=col, value=header)
-        cell.font = Font(name='Arial', size=12, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
+    sheet.write(1, [sheet.cell(header, "lpvp_title_center") for header in headers])
     
+    rates = values.get("fx_rates", {})
     for row, (quote_currency, base_currency) in enumerate(currency_pairs, 2):
-        ws_currency.cell(row=row, column=1, value=quote_currency)
-        ws_currency.cell(row=row, column=2, value=base_currency)
-        
-        rate_cell = ws_currency.cell(row=row, column=3, value="")
-        rate_cell.number_format = '0.0000'
-        rate_cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+        rate = rates.get((_label_key(quote_currency), _label_key(base_currency)), "")
+        sheet.write(row, [sheet.cell(quote_currency, "lpvp_bordered"), sheet.cell(base_currency, "lpvp_bordered"),
+                          sheet.cell(rate, "lpvp_rate_input")])
     
     first_table_rows = len(currency_pairs) + 1
-    for row in range(1, first_table_rows + 1):
-        for col in range(1, 4):
-            ws_currency.cell(row=row, column=col).border = thin_border
-    
     second_table_start_row = first_table_rows + 4
     
-    loans_currencies = []
-    if loans_df is not None:
-        if 'Currency' in loans_df.columns:
-            loans_currencies = sorted(loans_df['Currency'].dropna().unique().tolist())
-        else:
-            currency_like_columns = [col for col in loans_df.columns if 'currency' in str(col).lower() or 'curr' in str(col).lower()]
-            if currency_like_columns:
-                currency_col = currency_like_columns[0]
-                loans_currencies = sorted(loans_df[currency_col].dropna().unique().tolist())
-    
-    if not loans_currencies:
-        loans_currencies = currencies[:8] if len(currencies) >= 8 else currencies
+    # Tax table: the tape's own currencies (the profile falls back to the defaults)
+    loans_currencies = profile.currencies
     
     second_table_headers = ["Local Currency (Performing Loans only)", "Corporate Tax"]
+    sheet.write(second_table_start_row, [sheet.cell(header, "lpvp_title_center") for header in second_table_headers])
     
-    for col, header in enumerate(second_table_headers, 1):
-        cell = ws_currency.cell(row=second_table_start_row, column=col, value=header)
-        cell.font = Font(name='Arial', size=12, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
+    taxes = values.get("corporate_tax", {})
     for i, currency in enumerate(loans_currencies, second_table_start_row + 1):
-        ws_currency.cell(row=i, column=1, value=currency)
-        ws_currency.cell(row=i, column=1).alignment = Alignment(horizontal='center', vertical='center')
-        
-        cell = ws_currency.cell(row=i, column=2, value="")
-        cell.number_format = '0.00%'
-        cell.alignment = Alignment(horizontal='center', vertical='center')
+        tax = taxes.get(_label_key(currency), {}).get("Corporate Tax", "")
+        sheet.write(i, [sheet.cell(currency, "lpvp_center"), sheet.cell(tax, "lpvp_percent_input")])
+    
+    return len(currency_pairs)
+
+def build_assumption_template(loans_df=None, data_tape_filename="", profile=None, calendar=None, values=None):
+    """
+    Whole Phase 2 template for a loans tape in one write-only workbook:
+    Assumption_Summary, Assumption_Loans (+ guarantee recovery table), Index_Analysis
+    and Assumption_Currency. Without a tape (or profile) only the summary sheet is built.
+    calendar overrides the profile horizon; values pre-fill inputs carried over from an
+    existing template (see update_assumption_template).
+    """
+    wb = create_assumption_summary_excel(values=values)
+    if profile is None:
+        if loans_df is None:
+            return wb
+        profile = profile_data_tape(loans_df)
+    print(f"Data tape profile{f' ({data_tape_filename})' if data_tape_filename else ''}: {profile.summary()}")
     
-    second_table_rows = len(loans_currencies) + 1
+    calendar = calendar or profile.calendar()
     
-    for row in range(second_table_start_row, second_table_start_row + second_table_rows):
-        for col in range(1, 3):
-            ws_currency.cell(row=row, column=col).border = thin_border
+    loan_count, last_table_end = create_assumption_loans_sheet(wb, profile, calendar, values)
+    print(f"Created Assumption_Loans sheet with {loan_count} loan types")
+    if profile.guarantee_types:
+        print(f"Added guarantee recovery table with {len(profile.guarantee_types)} guarantee types")
     
-    ws_currency.column_dimensions['A'].width = 30
-    ws_currency.column_dimensions['B'].width = 18
-    ws_currency.column_dimensions['C'].width = 25
+    if profile.index_counts is not None:
+        create_index_analysis_sheet(wb, profile, calendar, values)
+        print(f"Created Index_Analysis sheet with {len(profile.index_counts)} index types")
     
-    return len(currency_pairs)
+    create_assumption_currency_sheet(wb, profile, values)
+    print(f"Created Assumption_Currency sheet with {len(profile.currencies)} currencies")
+    
+    print(f"Template sheets: {[sheet.title for sheet in wb.worksheets]}")
+    return wb
+
+# -------------------------------
+# Incremental regeneration
+# -------------------------------
+TEMPLATE_KEYWORDS = ['assumption', 'template', 'complex']
+
+# table key: (sheet, label in column A, header rows before the data)
+TEMPLATE_TABLES = {
+    "summary": ("Assumption_Summary", "Assumption Summary", 1),
+    "cost_risk": ("Assumption_Loans", "Cost of Risk - Loan with Guarantee", 1),
+    "prepayment_risk": ("Assumption_Loans", "Prepayment Risk - Loan with Guarantee", 1),
+    "rates_fees": ("Assumption_Loans", "Types of Loans", 1),
+    "recovery_vintage": ("Assumption_Loans", "Recovery Rate per Vintage", 2),
+    "guarantee_recovery": ("Assumption_Loans", "Types of Guarantee", 1),
+    "index_type": ("Index_Analysis", "Index Type", 1),
+    "fx_rates": ("Assumption_Currency", "Quote Currency", 1),
+    "corporate_tax": ("Assumption_Currency", "Local Currency (Performing Loans only)", 1),
+}
+DATE_TABLES = ("cost_risk", "prepayment_risk", "index_type")
+
+def _label_key(label):
+    return str(label).strip()
+
+def _cell_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+class ExistingTemplate:
+    """
+    What a filled Phase 2 template already holds, read back with read_existing_template():
+    the categories it has rows for, its month-end axis, and every non-empty input as
+    values[table][row label][column key]. Date columns are keyed by ISO date, other
+    columns by header text, spare Index_Analysis columns by offset ('+0', '+1', ...).
+    """
+
+    def __init__(self, values, loan_types, indices, currencies, guarantee_types, calendar, name=None):
+        self.values = values
+        self.loan_types = loan_types
+        self.indices = indices
+        self.currencies = currencies
+        self.guarantee_types = guarantee_types
+        self.calendar = calendar
+        self.name = name
+
+    def input_count(self):
+        return sum(len(row) if isinstance(row, dict) else 1 for table in self.values.values() for row in table.values())
+
+def _read_table(df_sheet, table_index, table_key):
+    """(row labels, {row label: {column key: value}}) of one template table"""
+    _, table_name, header_rows = TEMPLATE_TABLES[table_key]
+    location = table_index.find(table_name)
+    if location is None:
+        return None, {}
+    header_row, end = location
+    header = df_sheet.iloc[header_row, 1:].tolist()
+
+    if table_key in DATE_TABLES:
+        dates = parse_period_labels([value if pd.notna(value) else "" for value in header])
+        last_date = int(np.flatnonzero(~np.isnat(dates))[-1]) if (~np.isnat(dates)).any() else -1
+        keys = [np.datetime_as_string(date, unit="D") if not np.isnat(date) else f"+{pos - last_date - 1}"
+                for pos, date in enumerate(dates)]
+    else:
+        keys = [_label_key(value) if pd.notna(value) else None for value in header]
+
+    labels, rows = [], {}
+    for r in range(header_row + header_rows, end):
+        label = df_sheet.iat[r, 0]
+        if pd.isna(label):
+            continue
+        if table_key == "fx_rates":
+            row_key = (_label_key(label), _label_key(df_sheet.iat[r, 1]))
+            cells = {"Exchange Rate at Valuation Date": df_sheet.iat[r, 2]} if df_sheet.shape[1] > 2 else {}
+        else:
+            row_key = _label_key(label)
+            cells = dict(zip(keys, df_sheet.iloc[r, 1:].tolist()))
+        labels.append(label if table_key != "fx_rates" else row_key)
+        rows[row_key] = {key: _cell_value(value) for key, value in cells.items() if key is not None and pd.notna(value)}
+    return labels, rows
+
+def read_existing_template(file_stream, name=None):
+    """Read the categories, horizon and filled inputs of an existing Phase 2 template"""
+    file_stream.seek(0)
+    sheets = pd.read_excel(file_stream, sheet_name=None, header=None)
+
+    values, labels = {}, {}
+    indexes = {sheet_name: SheetTableIndex(df_sheet) for sheet_name, df_sheet in sheets.items()}
+    for table_key, (sheet_name, _, _) in TEMPLATE_TABLES.items():
+        if sheet_name not in sheets:
+            labels[table_key] = None
+            continue
+        labels[table_key], rows = _read_table(sheets[sheet_name], indexes[sheet_name], table_key)
+        values[table_key] = {key: row for key, row in rows.items() if row}
+    # Only the input column of the summary and guarantee tables; "Accepted Format" is template text
+    for table_key, column in (("summary", "Input"), ("guarantee_recovery", "Recovery Rate")):
+        values[table_key] = {key: {column: row[column]} for key, row in values.get(table_key, {}).items() if column in row}
+    values["fx_rates"] = {key: row["Exchange Rate at Valuation Date"] for key, row in values.get("fx_rates", {}).items()}
+
+    axis = []
+    for table_key in DATE_TABLES:
+        sheet_name, table_name, _ = TEMPLATE_TABLES[table_key]
+        location = indexes[sheet_name].find(table_name) if sheet_name in indexes else None
+        if location is not None:
+            axis.extend(sheets[sheet_name].iloc[location[0], 1:].dropna().tolist())
+
+    return ExistingTemplate(
+        values=values,
+        loan_types=tuple(labels.get("cost_risk") or ()),
+        indices=None if labels.get("index_type") is None else tuple(labels["index_type"]),
+        currencies=tuple(labels.get("corporate_tax") or ()),
+        guarantee_types=tuple(labels.get("guarantee_recovery") or ()),
+        calendar=PeriodCalendar.from_labels(axis),
+        name=name,
+    )
+
+def _append_new(existing, new):
+    """Existing rows keep their order; new categories are appended"""
+    seen = {_label_key(value) for value in existing}
+    return tuple(existing) + tuple(value for value in new if _label_key(value) not in seen)
 
-def upload_excel_to_sharepoint(workbook, output_folder_path):
-    """Upload Excel workbook to SharePoint Phase 2 folder"""
+def merge_template_profile(profile, existing):
+    """
+    Merge a new tape profile into an existing template. Categories only grow (rows the
+    template already has are kept even when the new tape no longer uses them) and the
+    horizon only extends. Returns (merged profile, calendar, changes); changes is empty
+    when the existing template already covers the tape.
+    """
+    calendar = profile.calendar()
+    merged_calendar = PeriodCalendar(np.union1d(existing.calendar.dates, calendar.dates))
+
+    loan_types = _append_new(existing.loan_types, profile.template_loan_types())
+    currencies = _append_new(existing.currencies, profile.currencies)
+    guarantee_types = _append_new(existing.guarantee_types, profile.guarantee_types)
+
+    index_counts = None
+    if existing.indices is not None or profile.index_counts is not None:
+        counts = dict(profile.index_counts or ())
+        indices = _append_new(existing.indices or (), profile.indices or ())
+        index_counts = tuple((index, counts.get(index, 0)) for index in indices)
+
+    changes = {}
+    for field, before, after in (("loan_types", existing.loan_types, loan_types),
+                                 ("indices", existing.indices or (), index_counts and tuple(i for i, _ in index_counts) or ()),
+                                 ("currencies", existing.currencies, currencies),
+                                 ("guarantee_types", existing.guarantee_types, guarantee_types)):
+        if len(after) > len(before):
+            changes[field] = list(after[len(before):])
+    if existing.indices is None and index_counts is not None:
+        changes["index_sheet"] = True
+    added_periods = merged_calendar.n_periods - existing.calendar.n_periods
+    if added_periods:
+        changes["periods"] = {"added": added_periods,
+                              "last_date": str(merged_calendar.iso_labels[-1]) if merged_calendar.n_periods else None}
+
+    merged = profile.replace(loan_types=loan_types, currencies=currencies,
+                             guarantee_types=guarantee_types, index_counts=index_counts)
+    return merged, merged_calendar, changes
+
+def update_assumption_template(loans_df=None, existing_stream=None, profile=None, existing_name=None):
+    """
+    Incremental regeneration: diff the tape profile against an existing filled template
+    and rebuild only if rows or periods were added, carrying every filled input over.
+
+    Returns (workbook or None, changes). None means the existing template already
+    covers the tape and nothing needs uploading.
+    """
+    profile = profile or profile_data_tape(loans_df)
+    existing = read_existing_template(existing_stream, existing_name)
+    merged, calendar, changes = merge_template_profile(profile, existing)
+
+    if not changes:
+        print(f"Existing template {existing_name or ''} already covers the data tape; nothing to update")
+        return None, changes
+
+    print(f"Updating template {existing_name or ''}: {changes} ({existing.input_count()} filled inputs carried over)")
+    wb = build_assumption_template(profile=merged, calendar=calendar, values=existing.values)
+    return wb, changes
+
+TEMPLATE_PHASE = "Phase 2"
+TEMPLATE_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def find_existing_template(session, phase=TEMPLATE_PHASE):
+    """Latest modified template workbook in a SharePoint phase folder as (BytesIO, name), else (None, None)"""
     try:
-        # Convert workbook to BytesIO
-        output_buffer = BytesIO()
-        workbook.save(output_buffer)
-        output_buffer.seek(0)
-        
-        # Get SharePoint connection
-        env_vars = load_env_vars()
-        access_token = get_access_token(env_vars)
-        site_id = get_site_id(access_token, env_vars['site_name'])
+        files = session.list_files(phase, extensions=(".xlsx",))
+    except Exception as e:
+        print(f"Could not list {phase}: {str(e)}")
+        return None, None
+
+    templates = [item for item in files if any(keyword in item["name"].lower() for keyword in TEMPLATE_KEYWORDS)]
+    latest = select_latest_file(templates)
+    if latest is None:
+        return None, None
+
+    data = session.download(phase, latest["name"])
+    if data is None:
+        return None, None
+    return BytesIO(data), latest["name"]
+
+def template_incremental_enabled(flag=None):
+    """Explicit flag wins, otherwise LPVP_TEMPLATE_INCREMENTAL"""
+    value = flag if flag is not None else os.getenv("LPVP_TEMPLATE_INCREMENTAL", "")
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def workbook_bytes(workbook):
+    """Serialise a workbook to xlsx bytes"""
+    output_buffer = BytesIO()
+    workbook.save(output_buffer)
+    return output_buffer.getvalue()
+
+def upload_excel_to_sharepoint(workbook, session=None, phase=TEMPLATE_PHASE):
+    """Upload an Excel workbook (or its xlsx bytes) to SharePoint Phase 2 as a timestamped template"""
+    try:
+        data = workbook if isinstance(workbook, (bytes, bytearray)) else workbook_bytes(workbook)
+        session = session or get_session()
         
         # Create filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"Assumption_Summary_Template_{timestamp}.xlsx"
         
-        # Build output path for Phase 2 - now using full path
-        item_path = f"{output_folder_path}/{filename}"
-        
-        # Upload
-        size = len(output_buffer.getvalue())
-        
-        if size <= 4 * 1024 * 1024:  # <= 4MB -> simple upload
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{item_path}:/content"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            }
-            import requests
-            resp = requests.put(url, headers=headers, data=output_buffer.getvalue())
-            resp.raise_for_status()
-            return resp.json()
-        
-        # For larger files, use chunked upload
-        session_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{item_path}:/createUploadSession"
-        session_headers = {"Authorization": f"Bearer {access_token}"}
-        session_body = {
-            "item": {
-                "@microsoft.graph.conflictBehavior": "replace",
-                "name": filename,
-            }
-        }
-        session_resp = requests.post(session_url, headers=session_headers, json=session_body)
-        session_resp.raise_for_status()
-        upload_url = session_resp.json().get("uploadUrl")
-
-        chunk_size = 5 * 1024 * 1024  # 5 MB
-        start = 0
-        data = output_buffer.getvalue()
-        last_resp = None
-
-        while start < size:
-            end = min(start + chunk_size, size) - 1
-            chunk = data[start : end + 1]
-            headers = {
-                "Content-Length": str(end - start + 1),
-                "Content-Range": f"bytes {start}-{end}/{size}",
-            }
-            put_resp = requests.put(upload_url, headers=headers, data=chunk)
-            put_resp.raise_for_status()
-            last_resp = put_resp
-            start = end + 1
-
-        return last_resp.json()
+        # Simple upload up to 4MB, upload session above
+        return session.upload_bytes(phase, filename, data, TEMPLATE_CONTENT_TYPE)
         
     except Exception as e:
         print(f"Error uploading Excel to SharePoint: {str(e)}")
         return None
 
-def process_sharepoint_assumption_template():
+def generate_assumption_template(session, tape=None, incremental=None):
+    """
+    Phase 1 tape -> Phase 2 template on an open SharePointSession.
+
+    tape: LoanTape of the run (fetched from Phase 1 when None). Its parsed frame is shared,
+    so a valuation in the same process does not parse the tape again.
+
+    Returns a dict:
+    - status: "created" (new blank template), "updated" (existing template extended,
+      filled values kept), "unchanged" (existing template already covers the tape) or "failed"
+    - name: name of the template now current in Phase 2
+    - data: its xlsx bytes (None when failed), so a caller can value against it without
+      downloading it again
+    - changes: what the tape added to an existing template
+    """
+    tape = tape if tape is not None else fetch_latest_loan_tape(session)
+    
+    loans_df = None
+    if tape is None:
+        print("No data tape file found in Phase 1. Creating basic template only...")
+    else:
+        print(f"Found data tape file: {tape.name}")
+        try:
+            loans_df = tape.frame
+        except Exception as e:
+            print(f"Could not load loans data ({str(e)}). Creating basic template only...")
+    
+    if loans_df is None:
+        wb, status, changes = create_assumption_summary_excel(), "created", {}
+    else:
+        print("Analyzing loans data...")
+        
+        # Analyse the tape and stream every sheet of the template in one pass
+        existing_stream, existing_name = None, None
+        if template_incremental_enabled(incremental):
+            existing_stream, existing_name = find_existing_template(session)
+            if existing_stream is None:
+                print("No existing template in Phase 2, building a new one")
+        
+        if existing_stream is not None:
+            wb, changes = update_assumption_template(loans_df, existing_stream, existing_name=existing_name)
+            if wb is None:
+                print(f"SKIPPED: {existing_name} is up to date, nothing uploaded")
+                return {"status": "unchanged", "name": existing_name, "changes": changes,
+                        "data": existing_stream.getvalue()}
+            status = "updated"
+        else:
+            wb, status, changes = build_assumption_template(loans_df, tape.name), "created", {}
+        print("Assumption template created with all analyzed data")
+    
+    # Upload Excel workbook to SharePoint Phase 2
+    data = workbook_bytes(wb)
+    print(f"Uploading assumption template to: {session.folder(TEMPLATE_PHASE)}")
+    result = upload_excel_to_sharepoint(data, session)
+    if not result:
+        print("ERROR: Failed to upload assumption template")
+        return {"status": "failed", "name": None, "changes": changes, "data": None}
+    
+    print("SUCCESS: Assumption template successfully uploaded to SharePoint Phase 2!")
+    print(f"File location: {session.folder(TEMPLATE_PHASE)}")
+    return {"status": status, "name": result.get("name"), "changes": changes, "data": data, "item": result}
+
+def process_sharepoint_assumption_template(incremental=None, session=None, tape=None):
     """
-    Main function to download from Phase 1, create assumption template, and upload to Phase 2
+    Main function to download from Phase 1, create assumption template, and upload to Phase 2.
+    incremental (or LPVP_TEMPLATE_INCREMENTAL=1): update the latest Phase 2 template in place
+    of a fresh one, keeping its filled values, and upload only when the tape adds something.
+    session / tape: SharePointSession and LoanTape to reuse (see orchestrator.run_full_cycle).
     """
     print("Starting SharePoint integrated assumption template generation...")
     
     try:
-        # 1. Load environment variables and authenticate
-        env_vars = load_env_vars()
-        access_token = get_access_token(env_vars)
-        site_id = get_site_id(access_token, env_vars["site_name"])
-        
-        # 2. Define folder paths - using full path like your friend's example
-        input_folder_path = f"{env_vars['base_path']}/Phase 1"
-        output_folder_path = f"{env_vars['base_path']}/Phase 2"
-        
-        # 3. Download files from SharePoint Phase 1
-        print(f"Downloading files from: {input_folder_path}")
-        downloaded_files = download_file(access_token, site_id, input_folder_path)
-        
-        # 4. Find the data tape file
-        data_tape_stream, data_tape_filename = find_data_tape_file(downloaded_files)
-        
-        if not data_tape_stream:
-            print("No data tape file found in Phase 1. Creating basic template only...")
-            wb = create_assumption_summary_excel()
-            
-        else:
-            print(f"Found data tape file: {data_tape_filename}")
-            
-            # 5. Load and analyze the data
-            loans_df = load_loans_dataframe_from_stream(data_tape_stream)
-            
-            if loans_df is None:
-                print("Could not load loans data. Creating basic template only...")
-                wb = create_assumption_summary_excel()
-            else:
-                print("Analyzing loans data...")
-                
-                # 6. Perform all analyses
-                valuation_date, max_maturity_date = get_valuation_and_max_maturity_dates(loans_df)
-                date_list = generate_month_end_dates_list(valuation_date, max_maturity_date)
-                
-                analysis_result = analyze_index_column_from_df(loans_df)
-                currencies = analyze_currencies_from_df(loans_df, data_tape_filename)
-                guarantee_types = analyze_guarantee_types_from_df(loans_df, data_tape_filename)
-                
-                # 7. Create Excel workbook with all sheets
-                wb = create_assumption_summary_excel()
-                print(f"Base workbook created with sheets: {[sheet.title for sheet in wb.worksheets]}")
-                
-                # Add Assumption_Loans sheet
-                if loans_df is not None and date_list:
-                    loan_count, last_table_end = create_assumption_loans_sheet(wb, loans_df, date_list)
-                    print(f"Created Assumption_Loans sheet with {loan_count} loan types")
-                    print(f"Current sheets after Assumption_Loans: {[sheet.title for sheet in wb.worksheets]}")
-                    
-                    # Add guarantee recovery table if guarantee types found
-                    if guarantee_types:
-                        ws_loans = wb["Assumption_Loans"]
-                        add_guarantee_recovery_table_to_loans_sheet(ws_loans, guarantee_types, last_table_end)
-                        print(f"Added guarantee recovery table with {len(guarantee_types)} guarantee types")
-                
-                # Add Index_Analysis sheet
-                if analysis_result:
-                    create_index_analysis_sheet(wb, analysis_result)
-                    print(f"Created Index_Analysis sheet with {analysis_result['unique_count']} index types")
-                    print(f"Current sheets after Index_Analysis: {[sheet.title for sheet in wb.worksheets]}")
-                
-                # Add Assumption_Currency sheet
-                if currencies:
-                    create_assumption_currency_sheet(wb, currencies, loans_df)
-                    print(f"Created Assumption_Currency sheet with {len(currencies)} currencies")
-                    print(f"Final sheets before upload: {[sheet.title for sheet in wb.worksheets]}")
-                
-                print("Assumption template created with all analyzed data")
-        
-        # 8. Upload Excel workbook to SharePoint Phase 2
-        print(f"Uploading assumption template to: {output_folder_path}")
-        result = upload_excel_to_sharepoint(wb, output_folder_path)
-        
-        if result:
-            print("SUCCESS: Assumption template successfully uploaded to SharePoint Phase 2!")
-            print(f"File location: {output_folder_path}")
-            return result
-        else:
-            print("ERROR: Failed to upload assumption template")
+        session = session or get_session()
+        result = generate_assumption_template(session, tape, incremental)
+        if result["status"] == "failed":
             return None
+        if result["status"] == "unchanged":
+            return {"status": "unchanged", "name": result["name"], "changes": result["changes"]}
+        return result["item"]
         
     except Exception as e:
         print(f"Error in SharePoint assumption template process: {str(e)}")
@@ -767,10 +838,11 @@ if __name__ == "__main__":
     print("- Input folder: base_path/Phase 1")
     print("- Output folder: base_path/Phase 2")
     print("- Base path from .env: LGG Guides/Teneo-Testing")
+    print(f"- Incremental update: {template_incremental_enabled('--incremental' in sys.argv or None)}")
     print("=" * 60)
     
     # Process with SharePoint Phase 1 -> Phase 2 workflow
-    result = process_sharepoint_assumption_template()
+    result = process_sharepoint_assumption_template(incremental='--incremental' in sys.argv or None)
     
     if result:
         print("\n" + "=" * 60)
@@ -0,0 +1,198 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+# -------------------------------
+# Batch runs: many client projects (each its own BASE_PATH with Phase 1/2/3) in one invocation
+# -------------------------------
+# mode -> what runs per project
+#   valuation: Phase 1 tape + Phase 2 assumptions -> Phase 3 (loan_input.run_phase3_processing)
+#   cycle:     template update + valuation on one tape (orchestrator.run_full_cycle)
+BATCH_MODES = ("valuation", "cycle")
+
+# Per-project statuses that count as done
+SUCCESS_STATUSES = ("success", "awaiting_assumptions")
+
+
+def batch_projects():
+    """Projects run at the same time (LPVP_BATCH_PROJECTS, default 4)"""
+    try:
+        return max(int(os.getenv("LPVP_BATCH_PROJECTS", 4)), 1)
+    except ValueError:
+        logging.warning(f"Ignoring LPVP_BATCH_PROJECTS={os.getenv('LPVP_BATCH_PROJECTS')!r}: not an integer, using 4")
+        return 4
+
+
+def load_project_roots(path):
+    """Project base paths from a text file: one per line, blank lines and # comments skipped"""
+    with open(path, encoding="utf-8") as fh:
+        lines = (line.split("#", 1)[0].strip() for line in fh)
+        return [line for line in lines if line]
+
+
+def run_batch(projects, mode="valuation", max_projects=None, diagnostics=None, output_format=None,
+              template=True, incremental=True, session=None, report_dir=None, progress=None):
+    """
+    Run every project root through the valuation (or the full cycle) concurrently.
+
+    All projects share one authenticated SharePoint session (SharePointSession.for_project)
+    and the pooled Graph client of this process; Graph calls of all projects go through its
+    adaptive concurrency limit, which backs off on 429 / Retry-After answers and grows
+    again while calls succeed. CPU work stays bounded by the executor budget.
+
+    projects: base paths on the site, e.g. ["Clients/Acme", "Clients/Globex"].
+    max_projects: projects in flight at once (default LPVP_BATCH_PROJECTS).
+    template / incremental: cycle mode only (see run_full_cycle).
+    progress: optional callable(step) told "<done>/<total> projects".
+
+    Writes batch_report_<timestamp>_<batch id>.json (per-project status, seconds, Phase 3
+    output, run report and the Graph throttling seen) and returns the same dict; its
+    "status" is "success", "partial" or "failed". Raises ValueError on a bad mode or list.
+    """
+    from tools.sharepoint import get_session, graph_limiter
+
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown batch mode: {mode!r} (expected one of {list(BATCH_MODES)})")
+    if isinstance(projects, str) or not all(isinstance(root, str) and root.strip("/ ") for root in projects):
+        raise ValueError("projects must be a list of non-empty base paths")
+    projects = list(dict.fromkeys(root.strip("/ ") for root in projects))
+    if not projects:
+        raise ValueError("No projects to run")
+
+    batch_id = uuid.uuid4().hex[:12]
+    progress = progress or (lambda step: None)
+    started = time.perf_counter()
+    report = {
+        "batch_id": batch_id,
+        "mode": mode,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "status": "failed",
+        "projects": [],
+    }
+
+    # A handed-in session is used as is; otherwise the warm session, re-checked per project
+    # so a long batch picks up a fresh token once the current one is about to expire
+    session_for = (lambda: session) if session is not None else get_session
+    try:
+        session_for()
+    except Exception as e:
+        logging.error(f"SharePoint authentication failed: {e}", exc_info=True)
+        report["error"] = f"SharePoint authentication failed: {e}"
+        return _write_report(report, started, report_dir)
+
+    throttle_before = graph_limiter().stats()
+    workers = min(max_projects or batch_projects(), len(projects))
+    logging.info(f"Batch {batch_id}: {len(projects)} projects ({mode}), {workers} at a time")
+    options = {"diagnostics": diagnostics, "output_format": output_format,
+               "template": template, "incremental": incremental}
+
+    results = {}
+    progress(f"0/{len(projects)} projects")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lpvp-batch") as executor:
+        futures = {
+            executor.submit(_run_project, session_for, root, mode, options, f"{batch_id}-{index}"): root
+            for index, root in enumerate(projects)
+        }
+        for future in as_completed(futures):
+            root = futures[future]
+            results[root] = future.result()
+            logging.info(f"Batch {batch_id}: {root} {results[root]['status']} in {results[root]['seconds']}s")
+            progress(f"{len(results)}/{len(projects)} projects")
+
+    report["projects"] = [results[root] for root in projects]
+    succeeded = [entry for entry in report["projects"] if entry["status"] in SUCCESS_STATUSES]
+    failed = [entry["project"] for entry in report["projects"] if entry["status"] not in SUCCESS_STATUSES]
+    report["status"] = "success" if not failed else ("partial" if succeeded else "failed")
+    report["counts"] = {"projects": len(projects), "succeeded": len(succeeded), "failed": len(failed)}
+    if failed:
+        report["error"] = f"{len(failed)} of {len(projects)} projects failed: {failed}"
+    report["graph"] = _throttle_delta(throttle_before, graph_limiter().stats())
+    return _write_report(report, started, report_dir)
+
+
+def _run_project(session_for, root, mode, options, run_id):
+    from tools.instrumentation import RunReport
+
+    started = time.perf_counter()
+    run_report = RunReport(run_id=run_id, project=root, batch_mode=mode)
+    try:
+        session = session_for().for_project(root)
+        if mode == "cycle":
+            from orchestrator import run_full_cycle
+            result = run_full_cycle(template=options["template"], incremental=options["incremental"],
+                                    diagnostics=options["diagnostics"], output_format=options["output_format"],
+                                    session=session, run_report=run_report)
+        else:
+            from loan_input import run_phase3_processing
+            result = run_phase3_processing(diagnostics=options["diagnostics"],
+                                           output_format=options["output_format"],
+                                           session=session, run_report=run_report)
+    except Exception as e:
+        logging.error(f"Project {root} failed: {e}", exc_info=True)
+        result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+    return {
+        "project": root,
+        "status": result.get("status", "failed"),
+        "seconds": round(time.perf_counter() - started, 3),
+        "error": result.get("error"),
+        "run_report": run_report.path,
+        "result": result,
+    }
+
+
+def _throttle_delta(before, after):
+    """Graph calls, throttled answers and pause time of this batch (the limiter is process-wide)"""
+    delta = {key: round(after[key] - before[key], 3) for key in ("calls", "throttled", "wait_seconds", "pause_seconds")}
+    delta.update({key: after[key] for key in ("limit", "max_limit", "lowest_limit", "peak_in_flight")})
+    return delta
+
+
+def _write_report(report, started, report_dir=None):
+    from tools.instrumentation import default_report_dir
+
+    report["wall_seconds"] = round(time.perf_counter() - started, 3)
+    directory = report_dir or default_report_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(directory, f"batch_report_{timestamp}_{report['batch_id']}.json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, default=str)
+        report["report"] = path
+        logging.info(f"Batch report written: {path}")
+    except OSError as e:
+        logging.error(f"Could not write batch report: {e}")
+    logging.info(f"Batch {report['batch_id']} finished: {report['status']} in {report['wall_seconds']}s")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run many LPVP projects in one invocation")
+    parser.add_argument("projects", nargs="*", help="project base paths on the SharePoint site")
+    parser.add_argument("--file", help="text file with one project base path per line")
+    parser.add_argument("--mode", choices=BATCH_MODES, default="valuation")
+    parser.add_argument("--max-projects", type=int, help="projects in flight at once (default LPVP_BATCH_PROJECTS)")
+    parser.add_argument("--format", dest="output_format", help="Phase 3 writer: xlsx / parquet / csv")
+    parser.add_argument("--fresh-template", action="store_true", help="cycle mode: create new templates")
+    args = parser.parse_args()
+
+    roots = list(args.projects) + (load_project_roots(args.file) if args.file else [])
+    try:
+        report = run_batch(roots, mode=args.mode, max_projects=args.max_projects,
+                           output_format=args.output_format, incremental=not args.fresh_template)
+        for entry in report["projects"]:
+            logging.info(f"  {entry['project']}: {entry['status']} ({entry['seconds']}s)")
+        if report["status"] != "success":
+            sys.exit(1)
+
+    except Exception as e:
+        logging.error(f"Batch run failed: {e}", exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,83 @@
+"""
+Enrichment benchmark: single concatenated pass vs the 4-thread per-type pool.
+
+    python benchmarks/enrichment_benchmark.py               # 10k, 100k, 1M loans
+    python benchmarks/enrichment_benchmark.py 50000 200000  # custom sizes
+
+Synthetic loans are split over the four calculation types; both modes run through
+enrich_loans_with_fixed_assumptions_parallel and their outputs are compared.
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_data.compiled_assumptions import CompiledAssumptions
+from input_data.fixed_dfs import RATES_FEES_FIELDS, enrich_loans_with_fixed_assumptions_parallel
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+CURRENCIES = ["EUR", "USD", "GBP", "TRY", "CHF"]
+LOAN_TYPES = ["Corporate", "SME", "Mortgage", "Consumer", "Other"]
+
+
+def synthetic_assumptions():
+    fx_table = pd.DataFrame({
+        "Base Currency": ["EUR", "EUR", "EUR", "EUR"],
+        "Quote Currency": ["USD", "GBP", "TRY", "CHF"],
+        "Exchange Rate at Valuation Date": [1.08, 0.85, 35.2, 0.95],
+    })
+    tax_table = pd.DataFrame({
+        "Local Currency (Performing Loans only)": CURRENCIES,
+        "Corporate Tax": [25.0, 21.0, 19.0, 25.0, 18.0],
+    })
+    rates_fees_dict = {
+        type_id: {field: {loan_type: float(type_id + i) for i, loan_type in enumerate(LOAN_TYPES)}
+                  for field in RATES_FEES_FIELDS}
+        for type_id in range(1, 5)
+    }
+    summary = {"output_currency": "EUR", "global_tax": 25.0, "cor_spread": 0.0, "dr_sensitivity_range": 1.0}
+    return CompiledAssumptions(None, rates_fees_dict, fx_table, tax_table, summary)
+
+
+def synthetic_loans(n_loans, seed=42):
+    rng = np.random.default_rng(seed)
+    loans = pd.DataFrame({
+        "Loan ID": np.arange(n_loans),
+        "Currency": rng.choice(CURRENCIES, n_loans),
+        "Type of Loan": rng.choice(LOAN_TYPES, n_loans),
+        "Interest Rate (%)": rng.uniform(0.01, 0.15, n_loans),
+        "Outstanding Balance After Adjustments (€)": rng.uniform(1e4, 1e6, n_loans),
+        "Maturity Date": pd.Timestamp("2025-01-31") + pd.to_timedelta(rng.integers(30, 3650, n_loans), unit="D"),
+    })
+    calc_type = rng.integers(1, 5, n_loans)
+    return {f"type_{type_id}": loans[calc_type == type_id].reset_index(drop=True) for type_id in range(1, 5)}
+
+
+def run_mode(loans_dict, assumptions, mode):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = enrich_loans_with_fixed_assumptions_parallel(
+            loans_dict, assumptions, debug_percentage=False, fix_percentage=True, mode=mode
+        )
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    assumptions = synthetic_assumptions()
+    print(f"{'loans':>10} {'threaded (s)':>14} {'concat (s)':>12} {'speedup':>9}  equal")
+    for n_loans in sizes:
+        loans_dict = synthetic_loans(n_loans)
+        threaded, threaded_time = run_mode(loans_dict, assumptions, "threaded")
+        concat, concat_time = run_mode(loans_dict, assumptions, "concat")
+        equal = all(threaded[key].equals(concat[key]) for key in threaded)
+        print(f"{n_loans:>10,} {threaded_time:>14.3f} {concat_time:>12.3f} {threaded_time / concat_time:>8.2f}x  {equal}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,212 @@
+"""
+Pipeline benchmark suite on synthetic tapes.
+
+    python benchmarks/pipeline_benchmark.py                         # 1k, 10k, 100k, 1M loans
+    python benchmarks/pipeline_benchmark.py --sizes 1000 10000      # subset
+    python benchmarks/pipeline_benchmark.py --update-baseline       # store current numbers
+    python benchmarks/pipeline_benchmark.py --tolerance 0.3         # allowed slowdown vs baseline
+
+Every size runs main_processing_pipeline_from_streams in a fresh interpreter (so peak RSS
+is per size) with the stage cache off and an empty compiled-assumptions cache (so
+load_assumptions always compiles), and reads per-stage wall time, rows and memory from
+its RunReport. Results are compared with benchmarks/baselines.json: any stage or total
+slower than baseline * (1 + tolerance), or peak RSS above baseline * (1 + memory tolerance),
+is printed as a REGRESSION and the script exits with status 1. Before timing anything,
+the compiled-assumptions artifact of the synthetic workbook must round-trip exactly
+(check_artifact_roundtrip), so cold and warm runs value on identical assumptions.
+
+Inputs come from benchmarks/synthetic_data.py and are cached in --data-dir, since writing
+a 1M-row tape to xlsx takes minutes.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baselines.json")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "lpvp_benchmark_data")
+# Differences below this many seconds are noise, never a regression
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def run_single(n_loans, data_dir, seed):
+    """Run the pipeline once for n_loans in this process and return its measurements"""
+    from io import BytesIO
+
+    from benchmarks.synthetic_data import write_synthetic_inputs
+
+    tape_path, assumptions_path = write_synthetic_inputs(n_loans, data_dir, seed=seed)
+
+    os.environ["LPVP_STAGE_CACHE_ENTRIES"] = "0"
+    os.environ.setdefault("LPVP_RUN_REPORT_DIR", os.path.join(data_dir, "reports"))
+    import loan_input
+    from tools.instrumentation import RunReport
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with open(tape_path, "rb") as fh:
+        loans_stream = BytesIO(fh.read())
+    with open(assumptions_path, "rb") as fh:
+        assumptions_stream = BytesIO(fh.read())
+
+    report = RunReport(benchmark_loans=n_loans)
+    # Fresh artifact cache: load_assumptions always compiles, whatever earlier runs left behind
+    with tempfile.TemporaryDirectory(prefix="lpvp_benchmark_assumptions_") as artifact_dir:
+        os.environ["LPVP_ASSUMPTIONS_CACHE_DIR"] = artifact_dir
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            combined, _, _ = loan_input.main_processing_pipeline_from_streams(
+                loans_stream, assumptions_stream, os.path.basename(tape_path), run_report=report
+            )
+        seconds = time.perf_counter() - start
+    if combined is None:
+        raise RuntimeError(f"Pipeline failed for {n_loans} loans")
+
+    result = report.to_dict()
+    stages = {}
+    for stage in result["stages"]:
+        rows = stage["rows_in"] or stage["rows_out"]
+        stages[stage["stage"]] = {
+            "seconds": stage["wall_seconds"],
+            "cpu_seconds": stage["cpu_seconds"],
+            "rows_in": stage["rows_in"],
+            "rows_out": stage["rows_out"],
+            "rows_per_second": round(rows / stage["wall_seconds"]) if rows and stage["wall_seconds"] else None,
+            "rss_delta_mb": stage["rss_delta_mb"],
+        }
+    return {
+        "loans": n_loans,
+        "seconds": round(seconds, 4),
+        "loans_per_second": round(n_loans / seconds),
+        "peak_rss_mb": result["peak_rss_mb"],
+        "stages": stages,
+    }
+
+
+def check_assumptions_artifact(n_loans, data_dir, seed):
+    """None when the synthetic workbook's artifact round-trips exactly, else the mismatch"""
+    from benchmarks.synthetic_data import write_synthetic_inputs
+    from input_data.compiled_assumptions import check_artifact_roundtrip
+
+    _, assumptions_path = write_synthetic_inputs(n_loans, data_dir, seed=seed)
+    with open(assumptions_path, "rb") as fh:
+        workbook_bytes = fh.read()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_artifact_roundtrip(workbook_bytes)
+    except AssertionError as e:
+        return str(e)
+    return None
+
+
+def run_isolated(n_loans, data_dir, seed):
+    """run_single in a child interpreter so memory figures do not carry over between sizes"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--single", str(n_loans), "--data-dir", data_dir, "--seed", str(seed)],
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark for {n_loans} loans failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baselines, tolerance, memory_tolerance):
+    """Regression messages for results against baselines ({str(size): result})"""
+    regressions = []
+    for result in results:
+        baseline = baselines.get(str(result["loans"]))
+        if not baseline:
+            continue
+        checks = [("total", result["seconds"], baseline.get("seconds"))]
+        checks += [(name, stage["seconds"], baseline.get("stages", {}).get(name, {}).get("seconds"))
+                   for name, stage in result["stages"].items()]
+        for name, seconds, expected in checks:
+            if expected is None or seconds is None:
+                continue
+            if seconds > expected * (1 + tolerance) and seconds - expected > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{result['loans']:,} loans / {name}: {seconds:.3f}s vs baseline {expected:.3f}s "
+                                   f"(+{(seconds / expected - 1) * 100:.0f}%)")
+
+        expected_rss = baseline.get("peak_rss_mb")
+        if expected_rss and result["peak_rss_mb"] and result["peak_rss_mb"] > expected_rss * (1 + memory_tolerance):
+            regressions.append(f"{result['loans']:,} loans / peak RSS: {result['peak_rss_mb']:.0f} MB "
+                               f"vs baseline {expected_rss:.0f} MB")
+    return regressions
+
+
+def print_results(results):
+    for result in results:
+        print(f"\n{result['loans']:,} loans: {result['seconds']:.2f}s total, "
+              f"{result['loans_per_second']:,} loans/s, peak RSS {result['peak_rss_mb']} MB")
+        print(f"  {'stage':<20} {'seconds':>9} {'rows/s':>12} {'rss Δ MB':>9}")
+        for name, stage in result["stages"].items():
+            rows_per_second = f"{stage['rows_per_second']:,}" if stage["rows_per_second"] else "-"
+            print(f"  {name:<20} {stage['seconds']:>9.3f} {rows_per_second:>12} {stage['rss_delta_mb'] or 0:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LPVP pipeline benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown per stage")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative peak RSS growth")
+    parser.add_argument("--output", help="write the raw results as JSON")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args.data_dir, args.seed)))
+        return 0
+
+    mismatch = check_assumptions_artifact(min(args.sizes), args.data_dir, args.seed)
+    if mismatch:
+        print(f"REGRESSION: compiled assumptions artifact does not round-trip: {mismatch}")
+        return 1
+
+    results = [run_isolated(n_loans, args.data_dir, args.seed) for n_loans in args.sizes]
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baselines = json.load(fh)
+
+    if args.update_baseline:
+        baselines.update({str(result["loans"]): result for result in results})
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True)
+        print(f"\nBaselines updated: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance, args.memory_tolerance)
+    if regressions:
+        print("\n" + "!" * 60)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        print("!" * 60)
+        return 1
+    if baselines:
+        print("\nNo regressions against baseline.")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to store one.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark: import cost of the Function entry modules and first vs warm run.
+
+    python benchmarks/startup_benchmark.py                          # import report + cold/warm run (10k loans)
+    python benchmarks/startup_benchmark.py --modules loan_input jobs
+    python benchmarks/startup_benchmark.py --budget 0.8             # exit 1 when an import exceeds 0.8s
+    python benchmarks/startup_benchmark.py --no-run                 # imports only
+
+Imports are measured with `python -X importtime` in a fresh interpreter per module, so
+nothing is already loaded; the report lists the slowest top-level packages by their own
+(self) import time. The run part calls main_processing_pipeline_from_streams twice in one
+process with the stage cache off: the second run shows what the warm process caches
+(compiled assumptions, Graph session, process pool) save on repeat invocations.
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+DEFAULT_MODULES = ["jobs", "orchestrator", "loan_input", "assumption"]
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "lpvp_benchmark_data")
+
+
+def measure_import(module):
+    """(total seconds, {top-level package: self seconds}) of importing module in a fresh interpreter"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    packages = defaultdict(float)
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+        if name == module:
+            total = int(cumulative_us) / 1e6
+    return total, dict(packages)
+
+
+def run_cold_and_warm(n_loans, data_dir, seed=0):
+    """Seconds of the first and second pipeline run on the same inputs in this process"""
+    from io import BytesIO
+
+    from benchmarks.synthetic_data import write_synthetic_inputs
+
+    tape_path, assumptions_path = write_synthetic_inputs(n_loans, data_dir, seed=seed)
+    os.environ["LPVP_STAGE_CACHE_ENTRIES"] = "0"
+    os.environ.setdefault("LPVP_RUN_REPORT_DIR", os.path.join(data_dir, "reports"))
+
+    import loan_input
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with open(tape_path, "rb") as fh:
+        tape = fh.read()
+    with open(assumptions_path, "rb") as fh:
+        assumptions = fh.read()
+
+    timings = []
+    # Empty artifact cache: the first run compiles the assumptions like a fresh host would
+    with tempfile.TemporaryDirectory(prefix="lpvp_startup_assumptions_") as artifact_dir:
+        os.environ["LPVP_ASSUMPTIONS_CACHE_DIR"] = artifact_dir
+        for _ in range(2):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                loan_input.main_processing_pipeline_from_streams(BytesIO(tape), BytesIO(assumptions),
+                                                                 os.path.basename(tape_path))
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LPVP cold-start benchmark")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=8, help="slowest packages listed per module")
+    parser.add_argument("--budget", type=float, help="import budget in seconds per module")
+    parser.add_argument("--loans", type=int, default=10_000)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--no-run", action="store_true")
+    args = parser.parse_args()
+
+    over_budget = []
+    print(f"{'module':<14} {'import s':>9}   slowest packages (self time)")
+    for module in args.modules:
+        try:
+            total, packages = measure_import(module)
+        except RuntimeError as e:
+            print(f"{module:<14} {'n/a':>9}   {e}")
+            continue
+        slowest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        print(f"{module:<14} {total:>9.3f}   " + ", ".join(f"{name} {seconds:.3f}" for name, seconds in slowest))
+        if args.budget is not None and total > args.budget:
+            over_budget.append((module, total))
+
+    if not args.no_run:
+        cold, warm = run_cold_and_warm(args.loans, args.data_dir)
+        print(f"\n{args.loans:,} loans: first run {cold:.3f}s, warm run {warm:.3f}s")
+
+    for module, total in over_budget:
+        print(f"OVER BUDGET: import {module} took {total:.3f}s (budget {args.budget:.3f}s)")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
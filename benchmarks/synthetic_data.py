@@ -0,0 +1,255 @@
+"""
+Synthetic data tape + filled assumptions workbook generator.
+
+    python benchmarks/synthetic_data.py 10000 --out-dir /tmp/lpvp_synthetic
+    python benchmarks/synthetic_data.py 5000 --npl-share 0.2 --floating-share 0.7 --seed 3
+
+Writes Synthetic_Tape_<n>.xlsx (Loans sheet, the columns the pipeline reads) and
+Assumption_Synthetic_<n>.xlsx (the assumption.py template for that tape, with every
+input cell filled), so the full pipeline runs end to end without SharePoint.
+"""
+import argparse
+import hashlib
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assumption import build_assumption_template, profile_data_tape
+
+# Share of each loan type in the tape (same names as datatape_segmentation / fixed_dfs)
+DEFAULT_LOAN_TYPE_MIX = {
+    "Medium / Long Term Loan": 0.22,
+    "Residential Mortgage": 0.18,
+    "Consumer Loan": 0.12,
+    "Corporate/ Development Loan": 0.08,
+    "Discounted Bill/ Note": 0.06,
+    "Overdraft": 0.05,
+    "Credit Card": 0.05,
+    "Current Account": 0.04,
+    "Syndicated Loan": 0.03,
+    "RE Leasing": 0.03,
+    "Non RE Leasing": 0.03,
+    "Factoring": 0.02,
+    "Trade Finance": 0.02,
+    "Restructured Loan": 0.02,
+    "Uncalled Bank Guarantee": 0.02,
+    "Called Bank Guarantee": 0.01,
+    "Other": 0.02,
+}
+DEFAULT_INDEX_MIX = {
+    "EUR EURIBOR ACT/360 3 MONTHS": 0.45,
+    "EUR EURIBOR ACT/360 6 MONTHS": 0.30,
+    "EUR EURIBOR ACT/360 12 MONTHS": 0.10,
+    "GBP SONIA": 0.10,
+    "PRIME RATE": 0.05,
+}
+DEFAULT_CURRENCY_MIX = {"EUR": 0.7, "GBP": 0.12, "USD": 0.1, "MAD": 0.05, "CHF": 0.03}
+DEFAULT_GUARANTEE_MIX = {
+    "RE Secured": 0.45,
+    "Personal/ Corporate Guarantee": 0.25,
+    "Financial Pledges": 0.15,
+    "RE Secured, Personal/ Corporate Guarantee": 0.1,
+    "Other Guarantees": 0.05,
+}
+# Units of each currency per EUR, used to fill a consistent FX table
+EUR_RATES = {"EUR": 1.0, "GBP": 0.91, "USD": 1.18, "MAD": 10.6, "CHF": 1.08, "TRY": 9.1, "PLN": 4.5}
+
+
+def _choice(rng, mix, n):
+    labels = list(mix)
+    weights = np.array([mix[label] for label in labels], dtype=float)
+    return rng.choice(labels, size=n, p=weights / weights.sum())
+
+
+def generate_loan_tape(n_loans, seed=0, loan_type_mix=None, floating_share=0.5, index_mix=None,
+                       currency_mix=None, npl_share=0.1, guarantee_share=0.6, guarantee_mix=None,
+                       problematic_share=0.0, valuation_date="2020-09-05", max_years=30):
+    """
+    Loans sheet with the columns the pipeline reads. All mixes are {label: weight}.
+
+    - floating_share: share of 'Floating' Interest Rate Type (others are 'Fixed')
+    - npl_share: share with a Past Due Date (non-performing)
+    - guarantee_share: share with a positive Guarantee current value
+    - problematic_share: share of performing loans with no maturity and a zero balance
+    """
+    rng = np.random.default_rng(seed)
+    valuation_date = pd.Timestamp(valuation_date)
+
+    floating = rng.random(n_loans) < floating_share
+    has_guarantee = rng.random(n_loans) < guarantee_share
+    npl = rng.random(n_loans) < npl_share
+    problematic = ~npl & (rng.random(n_loans) < problematic_share)
+
+    maturity_days = rng.integers(30, 365 * max_years, n_loans)
+    maturities = pd.Series(valuation_date + pd.to_timedelta(maturity_days, unit="D"))
+    balances = rng.lognormal(mean=11, sigma=1.2, size=n_loans).round(2)
+
+    tape = pd.DataFrame({
+        "Unique Loan ID": np.char.add("L", np.char.zfill(np.arange(n_loans).astype(str), 8)),
+        "Type of Loan": _choice(rng, loan_type_mix or DEFAULT_LOAN_TYPE_MIX, n_loans),
+        "Interest Rate Type": np.where(floating, "Floating", "Fixed"),
+        "Index": np.where(floating, _choice(rng, index_mix or DEFAULT_INDEX_MIX, n_loans), None),
+        "Interest Rate Margin (%)": np.where(floating, rng.uniform(0.5, 4.5, n_loans).round(3), np.nan),
+        "Interest Rate (%)": rng.uniform(0.8, 9.5, n_loans).round(3),
+        "Maturity Date": maturities.where(~problematic),
+        "Currency": _choice(rng, currency_mix or DEFAULT_CURRENCY_MIX, n_loans),
+        "Outstanding Balance After Adjustments": np.where(problematic, 0.0, balances),
+        "Guarantee current value": np.where(has_guarantee, (balances * rng.uniform(0.2, 1.5, n_loans)).round(2), 0.0),
+        "Type of Guarantees": np.where(has_guarantee, _choice(rng, guarantee_mix or DEFAULT_GUARANTEE_MIX, n_loans), None),
+    })
+    past_due = valuation_date - pd.to_timedelta(rng.integers(91, 1500, n_loans), unit="D")
+    tape["Past Due Date"] = pd.Series(past_due).where(npl)
+    return tape
+
+
+# ---------- Filled assumptions workbook ----------
+def _label_rows(ws):
+    """{column A label: row} for the first occurrence of each label"""
+    rows = {}
+    for row in range(1, ws.max_row + 1):
+        value = ws.cell(row=row, column=1).value
+        if value is not None:
+            rows.setdefault(str(value).strip(), row)
+    return rows
+
+
+def _table_rows(ws, header_row, skip=1):
+    """Data rows under header_row, up to the first empty column A cell"""
+    row = header_row + skip
+    while ws.cell(row=row, column=1).value not in (None, ""):
+        yield row
+        row += 1
+
+
+def _fill_curve_table(ws, header_row, n_dates, rng, level, spread):
+    for row in _table_rows(ws, header_row):
+        base = level + rng.uniform(-spread, spread)
+        drift = rng.uniform(-0.00002, 0.00004)
+        for i in range(n_dates):
+            ws.cell(row=row, column=2 + i, value=round(base + drift * i, 6))
+
+
+def fill_assumptions_workbook(wb, date_count, seed=0, output_currency="EUR"):
+    """Fill every input cell of an assumption.py template in place (decimal format, 0.05 = 5%)"""
+    rng = np.random.default_rng(seed)
+
+    summary = wb["Assumption_Summary"]
+    summary_inputs = {
+        "Project Name": "Synthetic Benchmark",
+        "Data Tape with financials as of date:": "31/08/2020",
+        "Valuation Date": pd.Timestamp("2020-09-05").to_pydatetime(),
+        "Output conclusions display currency": output_currency,
+        "Data Tape currency - override": "EUR",
+        "Detailed Guarantees Data Tape?": "No",
+        "Guarantee Currency - override": "EUR",
+        "Global Tax Flag (Performing Loans only)": "Yes",
+        "Global Tax (Performing Loans only)": 0.25,
+        "CoR Spread on Non-Collateralised loans": 0.02,
+        "Assumed Maturities: Current Account": 36,
+        "Assumed Maturities: Overdraft": 36,
+        "Assumed Maturities: Credit Card": 24,
+        "Type of Credit Card Curve Repayment to be used": "Exponential Curve",
+        "Assumption: % of the initial debt to be repaid - minimum Credit Card Monthly Payment": 0.03,
+        "Cost of Risk Sensitivity Variance": 0.2,
+        "Discount Rate Sensitivity Variance": 0.2,
+        "Recovery Rate Sensitivity Variance": 0.2,
+        "Sensitivity Table: Cost of Risk Sensitivity Range": 0.05,
+        "Sensitivity Table: Discount Rate Sensitivity Range": 0.05,
+    }
+    for label, row in _label_rows(summary).items():
+        if label in summary_inputs:
+            summary.cell(row=row, column=2, value=summary_inputs[label])
+
+    loans = wb["Assumption_Loans"]
+    labels = _label_rows(loans)
+    _fill_curve_table(loans, labels["Cost of Risk - Loan with Guarantee"], date_count, rng, 0.01, 0.008)
+    _fill_curve_table(loans, labels["Prepayment Risk - Loan with Guarantee"], date_count, rng, 0.03, 0.02)
+    for row in _table_rows(loans, labels["Types of Loans"]):
+        loans.cell(row=row, column=2, value=round(rng.uniform(0.03, 0.12), 4))  # Discount Rate
+        loans.cell(row=row, column=3, value=round(rng.uniform(0.0, 0.01), 4))
+        loans.cell(row=row, column=4, value=round(rng.uniform(0.0, 0.01), 4))
+        loans.cell(row=row, column=5, value=round(rng.uniform(0.001, 0.005), 4))  # Servicing Fee
+    if "Recovery Rate per Vintage" in labels:
+        recovery_by_vintage = np.linspace(0.01, 0.6, 11)
+        for row in _table_rows(loans, labels["Recovery Rate per Vintage"], skip=2):
+            for col, rate in enumerate(recovery_by_vintage, 2):
+                loans.cell(row=row, column=col, value=round(float(rate), 4))
+    if "Types of Guarantee" in labels:
+        for row in _table_rows(loans, labels["Types of Guarantee"]):
+            loans.cell(row=row, column=2, value=round(rng.uniform(0.6, 0.95), 2))
+
+    if "Index_Analysis" in wb.sheetnames:
+        index_sheet = wb["Index_Analysis"]
+        index_dates = sum(1 for col in range(2, index_sheet.max_column + 1)
+                          if index_sheet.cell(row=1, column=col).value not in (None, ""))
+        _fill_curve_table(index_sheet, 1, index_dates, rng, 0.0, 0.005)
+
+    currency = wb["Assumption_Currency"]
+    for row in _table_rows(currency, 1):
+        quote, base = currency.cell(row=row, column=1).value, currency.cell(row=row, column=2).value
+        rate = EUR_RATES.get(quote, 1.0) / EUR_RATES.get(base, 1.0)
+        currency.cell(row=row, column=3, value=round(rate, 6))
+    tax_header = _label_rows(currency).get("Local Currency (Performing Loans only)")
+    if tax_header:
+        for row in _table_rows(currency, tax_header):
+            currency.cell(row=row, column=2, value=round(rng.uniform(0.15, 0.3), 3))
+    return wb
+
+
+def build_filled_assumptions(loans_df, seed=0, output_currency="EUR"):
+    """Phase 2 template for loans_df built with assumption.py, then filled"""
+    profile = profile_data_tape(loans_df)
+
+    # The template is write-only (streamed); reload it to fill the input cells
+    buffer = BytesIO()
+    build_assumption_template(profile=profile).save(buffer)
+    buffer.seek(0)
+    wb = openpyxl.load_workbook(buffer)
+
+    return fill_assumptions_workbook(wb, profile.calendar().n_periods, seed, output_currency)
+
+
+def write_synthetic_inputs(n_loans, out_dir, seed=0, **tape_options):
+    """Write (or reuse) the tape and filled assumptions for n_loans; returns (tape_path, assumptions_path)"""
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = f"{n_loans}_s{seed}"
+    if tape_options:
+        suffix += "_" + hashlib.sha1(repr(sorted(tape_options.items())).encode()).hexdigest()[:8]
+    tape_path = os.path.join(out_dir, f"Synthetic_Tape_{suffix}.xlsx")
+    assumptions_path = os.path.join(out_dir, f"Assumption_Synthetic_{suffix}.xlsx")
+
+    if not (os.path.exists(tape_path) and os.path.exists(assumptions_path)):
+        tape = generate_loan_tape(n_loans, seed=seed, **tape_options)
+        tape.to_excel(tape_path, sheet_name="Loans", index=False)
+        build_filled_assumptions(tape, seed=seed).save(assumptions_path)
+    return tape_path, assumptions_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic data tape and filled assumptions workbook")
+    parser.add_argument("n_loans", type=int)
+    parser.add_argument("--out-dir", default=os.path.join(os.getcwd(), "synthetic_data"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--floating-share", type=float, default=0.5)
+    parser.add_argument("--npl-share", type=float, default=0.1)
+    parser.add_argument("--guarantee-share", type=float, default=0.6)
+    parser.add_argument("--problematic-share", type=float, default=0.0)
+    args = parser.parse_args()
+
+    tape_path, assumptions_path = write_synthetic_inputs(
+        args.n_loans, args.out_dir, seed=args.seed,
+        floating_share=args.floating_share, npl_share=args.npl_share,
+        guarantee_share=args.guarantee_share, problematic_share=args.problematic_share,
+    )
+    print(f"Tape:        {tape_path}")
+    print(f"Assumptions: {assumptions_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,213 @@
-import azure.functions as func
-import logging
-
-app = func.FunctionApp(http_auth_level=func.AuthLevel.ADMIN)
-
-@app.route(route="lpvp_etl_dev")
-def lpvp_etl_dev(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
-    name = req.params.get('name')
-    if not name:
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            pass
-        else:
-            name = req_body.get('name')
-
-    if name:
-        return func.HttpResponse(f"Hello, {name}. This HTTP triggered function executed successfully.")
-    else:
-        return func.HttpResponse(
-             "This HTTP triggered function executed successfully. Pass a name in the query string or in the request body for a personalized response.",
-             status_code=200
-        )
\ No newline at end of file
+import azure.functions as func
+import logging
+
+from tools import startup
+
+# Keep module load light: the pipeline modules (pandas, numpy, openpyxl, requests) are
+# imported on first use, or ahead of the first request by the prewarm thread (LPVP_PREWARM)
+app = func.FunctionApp(http_auth_level=func.AuthLevel.ADMIN)
+if startup.prewarm_enabled():
+    startup.prewarm()
+
+@app.route(route="lpvp_etl_dev")
+def lpvp_etl_dev(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request.')
+
+    name = req.params.get('name')
+    if not name:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            pass
+        else:
+            name = req_body.get('name')
+
+    if name:
+        return func.HttpResponse(f"Hello, {name}. This HTTP triggered function executed successfully.")
+    else:
+        return func.HttpResponse(
+             "This HTTP triggered function executed successfully. Pass a name in the query string or in the request body for a personalized response.",
+             status_code=200
+        )
+
+@app.route(route="lpvp_process")
+def lpvp_process(req: func.HttpRequest) -> func.HttpResponse:
+    """Run Phase 1 + Phase 2 -> Phase 3 processing.
+    ?profile=1 captures profiler artifacts next to the output; ?diagnostics=debug switches
+    structured diagnostics on for this run; ?format=xlsx|parquet|csv picks the Phase 3 writer."""
+    import json
+    startup.mark_request("lpvp_process")
+    run_phase3_processing = startup.timed_import("loan_input").run_phase3_processing
+
+    profile = req.params.get('profile')
+    diagnostics = req.params.get('diagnostics')
+    output_format = req.params.get('format')
+    logging.info(f"lpvp_process triggered (profile={profile}, diagnostics={diagnostics}, format={output_format})")
+    try:
+        summary = run_phase3_processing(profile=profile, diagnostics=diagnostics, output_format=output_format)
+    except Exception as e:
+        logging.error(f"lpvp_process failed: {e}", exc_info=True)
+        return func.HttpResponse(json.dumps({"status": "failed", "error": str(e)}),
+                                 status_code=500, mimetype="application/json")
+
+    status_code = 500 if summary["status"] == "failed" else 200
+    return func.HttpResponse(json.dumps(summary, default=str), status_code=status_code, mimetype="application/json")
+
+@app.route(route="lpvp_cycle")
+def lpvp_cycle(req: func.HttpRequest) -> func.HttpResponse:
+    """Run template generation and valuation in one process on one tape download.
+    ?template=0 / ?valuation=0 skip a step; ?incremental=0 builds a fresh template.
+    profile / diagnostics / format as for lpvp_process."""
+    import json
+    startup.mark_request("lpvp_cycle")
+    run_full_cycle = startup.timed_import("orchestrator").run_full_cycle
+
+    def flag(name):
+        return req.params.get(name, "1").strip().lower() not in ("0", "false", "no", "off")
+
+    logging.info(f"lpvp_cycle triggered ({dict(req.params)})")
+    try:
+        summary = run_full_cycle(template=flag('template'), valuation=flag('valuation'),
+                                 incremental=flag('incremental'), profile=req.params.get('profile'),
+                                 diagnostics=req.params.get('diagnostics'), output_format=req.params.get('format'))
+    except Exception as e:
+        logging.error(f"lpvp_cycle failed: {e}", exc_info=True)
+        return func.HttpResponse(json.dumps({"status": "failed", "error": str(e)}),
+                                 status_code=500, mimetype="application/json")
+
+    status_code = 500 if summary["status"] == "failed" else 200
+    return func.HttpResponse(json.dumps(summary, default=str), status_code=status_code, mimetype="application/json")
+
+@app.route(route="lpvp_jobs", methods=["GET", "POST"])
+def lpvp_jobs(req: func.HttpRequest) -> func.HttpResponse:
+    """Background runs for valuations that outlast the HTTP timeout.
+    POST {"kind": "valuation" | "cycle", "options": {"tape": ..., "assumptions": ..., "format": ...}}
+    or {"kind": "batch", "options": {"projects": ["Clients/A", "Clients/B"], "mode": "cycle"}}
+    -> 202 with the job record and a Location to poll. GET lists recent jobs."""
+    import json
+    from jobs import submit_job, list_jobs
+    startup.mark_request("lpvp_jobs")
+
+    if req.method == "GET":
+        try:
+            limit = int(req.params.get('limit', 50))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return func.HttpResponse(json.dumps({"error": "limit must be a positive integer"}),
+                                     status_code=400, mimetype="application/json")
+        return func.HttpResponse(json.dumps(list_jobs(limit), default=str), status_code=200, mimetype="application/json")
+
+    try:
+        body = req.get_json() if req.get_body() else {}
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        return func.HttpResponse(json.dumps({"error": "Request body must be a JSON object"}),
+                                 status_code=400, mimetype="application/json")
+    try:
+        job = submit_job(body.get("kind", "valuation"), body.get("options"))
+    except ValueError as e:
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=400, mimetype="application/json")
+
+    return func.HttpResponse(json.dumps(job, default=str), status_code=202, mimetype="application/json",
+                             headers={"Location": f"{req.url.split('?')[0].rstrip('/')}/{job['job_id']}"})
+
+@app.route(route="lpvp_jobs/{job_id}", methods=["GET"])
+def lpvp_job_status(req: func.HttpRequest) -> func.HttpResponse:
+    """Status, current step, per-stage progress and (when finished) result locations of a job"""
+    import json
+    from jobs import get_job
+    startup.mark_request("lpvp_job_status")
+
+    try:
+        job = get_job(req.route_params.get('job_id'))
+    except ValueError as e:
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=400, mimetype="application/json")
+    if job is None:
+        return func.HttpResponse(json.dumps({"error": "Unknown job"}), status_code=404, mimetype="application/json")
+    return func.HttpResponse(json.dumps(job, default=str), status_code=200, mimetype="application/json")
+
+@app.route(route="lpvp_warm", methods=["GET", "DELETE"])
+def lpvp_warm(req: func.HttpRequest) -> func.HttpResponse:
+    """GET: start-up report (uptime, cold import timings, warm process caches).
+    DELETE ?cache=graph_session,graph_client,compiled_assumptions,stage_cache,process_pool (default all)
+    drops warm caches, e.g. after rotating credentials or replacing an assumptions workbook."""
+    import json
+
+    if req.method == "DELETE":
+        names = req.params.get('cache')
+        dropped = startup.invalidate_warm_caches(names.split(",") if names else None)
+        return func.HttpResponse(json.dumps({"invalidated": dropped}), status_code=200, mimetype="application/json")
+    return func.HttpResponse(json.dumps(startup.startup_report(), default=str), status_code=200,
+                             mimetype="application/json")
+
+# Raw-body Content-Type -> tape format for lpvp_whatif
+WHATIF_TAPE_CONTENT_TYPES = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/octet-stream": None,  # sniffed from the content
+}
+
+@app.route(route="lpvp_whatif", methods=["POST"])
+def lpvp_whatif(req: func.HttpRequest) -> func.HttpResponse:
+    """In-memory what-if run, no SharePoint round trip (cached tape and compiled assumptions).
+    Body, one of:
+      - multipart/form-data: file "tape" (xlsx/csv/parquet/json), file "assumptions" (xlsx),
+        field "overrides" (JSON)
+      - application/json: {"loans": [records], "overrides": {...}, "assumptions_key": "..."}
+      - the tape itself as xlsx / text/csv / parquet (?tape_format= when the type is generic)
+    Query: ?output=json|parquet, ?curves=1 keeps per-loan curves, ?assumptions_key=, ?diagnostics=."""
+    import json
+    startup.mark_request("lpvp_whatif")
+    whatif = startup.timed_import("whatif")
+
+    def error(message, status_code):
+        return func.HttpResponse(json.dumps({"status": "failed", "error": message}),
+                                 status_code=status_code, mimetype="application/json")
+
+    content_type = (req.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+    tape = tape_name = assumptions = None
+    tape_format = req.params.get('tape_format')
+    overrides = None
+    assumptions_key = req.params.get('assumptions_key')
+    try:
+        if content_type == "multipart/form-data":
+            if "tape" in req.files:
+                tape_file = req.files["tape"]
+                tape, tape_name = tape_file.read(), tape_file.filename
+            if "assumptions" in req.files:
+                assumptions = req.files["assumptions"].read()
+            overrides = json.loads(req.form["overrides"]) if req.form.get("overrides") else None
+        elif content_type == "application/json":
+            body = req.get_json()
+            if not isinstance(body, dict):
+                return error("JSON body must be an object", 400)
+            if body.get("loans") is not None:
+                tape, tape_format = json.dumps(body["loans"]).encode("utf-8"), "json"
+            overrides = body.get("overrides")
+            assumptions_key = body.get("assumptions_key") or assumptions_key
+        elif req.get_body():
+            if content_type not in WHATIF_TAPE_CONTENT_TYPES:
+                return error(f"Unsupported Content-Type: {content_type}", 415)
+            tape = req.get_body()
+            tape_format = tape_format or WHATIF_TAPE_CONTENT_TYPES[content_type]
+    except ValueError as e:
+        return error(f"Could not read request body: {e}", 400)
+
+    try:
+        payload, mimetype, summary = whatif.run_whatif(
+            tape=tape, tape_name=tape_name, tape_format=tape_format, assumptions=assumptions,
+            assumptions_key=assumptions_key, overrides=overrides, output=req.params.get('output'),
+            curves=req.params.get('curves', '0').strip().lower() in ("1", "true", "yes"),
+            diagnostics=req.params.get('diagnostics'),
+        )
+    except whatif.WhatIfError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logging.error(f"lpvp_whatif failed: {e}", exc_info=True)
+        return error(str(e), 500)
+
+    headers = {"X-LPVP-Seconds": str(summary["seconds"]), "X-LPVP-Assumptions-Key": summary["assumptions_key"]}
+    return func.HttpResponse(payload, status_code=200, mimetype=mimetype, headers=headers)
@@ -0,0 +1,167 @@
+import pandas as pd
+import numpy as np
+import logging
+
+from input_data.assumption_tables import ExcelTableLoader
+from input_data.period_calendar import PeriodCalendar, parse_period_labels
+
+# alias: (sheet name, table name in column A)
+CURVE_TABLES = {
+    "Cost_Risk": ("Assumption_Loans", "Cost of Risk - Loan with Guarantee"),
+    "Prepayment_Risk": ("Assumption_Loans", "Prepayment Risk - Loan with Guarantee"),
+    "Index_Type": ("Index_Analysis", "Index Type"),
+}
+
+
+class AssumptionCurves:
+    """
+    Cost of Risk, Prepayment Risk and Index Type tables compiled onto one month-end axis.
+
+    - calendar: PeriodCalendar of the axis shared by every table (dates: its datetime64[ns])
+    - loan_types / indices: {category: row} maps into the dense arrays
+    - cost_risk / prepay_risk: float arrays [loan type row, period], 0 for blank cells,
+      NaN where the table has no such loan type or date
+    - index_rates: float array [index row, period], NaN where no input
+
+    Values are kept in percentage format (10.0 = 10%), same as ExcelTableLoader.
+    Consumers address periods and categories by integer index only.
+    """
+
+    def __init__(self, dates, loan_types, indices, cost_risk, prepay_risk, index_rates):
+        self.calendar = dates if isinstance(dates, PeriodCalendar) else PeriodCalendar(dates)
+        self.loan_types = dict(loan_types)
+        self.indices = dict(indices)
+        self.cost_risk = np.asarray(cost_risk, dtype=np.float64)
+        self.prepay_risk = np.asarray(prepay_risk, dtype=np.float64)
+        self.index_rates = np.asarray(index_rates, dtype=np.float64)
+
+    @property
+    def dates(self):
+        return self.calendar.dates
+
+    @property
+    def n_periods(self):
+        return self.calendar.n_periods
+
+    @property
+    def date_strings(self):
+        """ISO date labels of the axis, formatted once and only for export payloads"""
+        return self.calendar.iso_labels
+
+    def cut_offs(self, maturities):
+        """Number of axis periods on or before each maturity; missing maturities keep the whole axis"""
+        return self.calendar.cut_offs(maturities)
+
+    def loan_type_rows(self, values):
+        """Row of each loan type in cost_risk / prepay_risk, -1 when unknown"""
+        return _category_rows(self.loan_types, values)
+
+    def index_rows(self, values):
+        """Row of each index in index_rates, -1 when unknown"""
+        return _category_rows(self.indices, values)
+
+    def summary(self):
+        return {
+            'periods': self.n_periods,
+            'first_date': str(self.date_strings[0]) if self.n_periods else None,
+            'last_date': str(self.date_strings[-1]) if self.n_periods else None,
+            'loan_types': len(self.loan_types),
+            'indices': len(self.indices),
+        }
+
+
+def _category_rows(category_map, values):
+    codes, uniques = pd.factorize(pd.Series(values).astype(object), use_na_sentinel=True)
+    unique_rows = np.array([category_map.get(value, -1) for value in uniques], dtype=np.int64)
+    rows = np.full(len(codes), -1, dtype=np.int64)
+    known = codes >= 0
+    rows[known] = unique_rows[codes[known]]
+    return rows
+
+
+def _table_to_frame(table):
+    """
+    Normalise one curve table to a frame indexed by category with datetime columns.
+    Accepts ExcelTableLoader frames, legacy {category: {date: value}} dicts and
+    DataFrames with a "Type of Loan" column.
+    """
+    if table is None:
+        return pd.DataFrame()
+    if isinstance(table, dict):
+        frame = pd.DataFrame.from_dict(table, orient="index")
+    else:
+        frame = table
+        if "Type of Loan" in frame.columns:
+            frame = frame.set_index("Type of Loan")
+
+    if frame.empty:
+        return pd.DataFrame()
+
+    columns = parse_period_labels(frame.columns)
+    frame = frame.loc[:, ~np.isnat(columns)]
+    frame.columns = pd.DatetimeIndex(columns[~np.isnat(columns)])
+    frame = frame.T.groupby(level=0).last().T  # duplicate headers: last one wins
+    frame.index = [str(label).strip() for label in frame.index]
+    return frame.apply(pd.to_numeric, errors="coerce")
+
+
+def compile_assumption_curves(cost_risk=None, prepayment_risk=None, index_type=None):
+    """
+    Compile the three curve tables into one AssumptionCurves bundle on the union of
+    their date headers. Loan type rows are shared by Cost of Risk and Prepayment Risk.
+    """
+    cost_frame = _table_to_frame(cost_risk)
+    prepay_frame = _table_to_frame(prepayment_risk)
+    index_frame = _table_to_frame(index_type)
+
+    axis = pd.DatetimeIndex([])
+    for frame in (cost_frame, prepay_frame, index_frame):
+        if not frame.empty:
+            axis = axis.union(frame.columns)
+
+    loan_types = list(dict.fromkeys(list(cost_frame.index) + list(prepay_frame.index)))
+    indices = list(index_frame.index)
+
+    def _dense(frame, rows, blank=np.nan):
+        if frame.empty:
+            return np.full((len(rows), len(axis)), np.nan)
+        return frame.fillna(blank).reindex(index=rows, columns=axis).to_numpy(dtype=np.float64)
+
+    curves = AssumptionCurves(
+        dates=PeriodCalendar(axis.to_numpy(dtype="datetime64[ns]")),
+        loan_types={loan_type: row for row, loan_type in enumerate(loan_types)},
+        indices={index_name: row for row, index_name in enumerate(indices)},
+        # Blank risk cells read as 0 (a period of the table, no input); NaN stays for
+        # dates / loan types the table doesn't have
+        cost_risk=_dense(cost_frame, loan_types, blank=0.0),
+        prepay_risk=_dense(prepay_frame, loan_types, blank=0.0),
+        index_rates=_dense(index_frame, indices),
+    )
+    logging.info(f"Compiled assumption curves: {curves.summary()}")
+    return curves
+
+
+def load_assumption_curves_from_stream(file_stream, logger=None):
+    """
+    Read the Cost of Risk, Prepayment Risk and Index Type tables from an assumptions
+    workbook stream and compile them into an AssumptionCurves bundle.
+    """
+    loader = ExcelTableLoader(logger)
+
+    sheet_tables = {}
+    for alias, (sheet_name, table_name) in CURVE_TABLES.items():
+        sheet_tables.setdefault(sheet_name, []).append(table_name)
+
+    frames = {}
+    for sheet_name, table_names in sheet_tables.items():
+        frames[sheet_name] = loader.load_table_frames_from_stream(file_stream, sheet_name, table_names)
+
+    tables = {
+        alias: frames[sheet_name].get(table_name)
+        for alias, (sheet_name, table_name) in CURVE_TABLES.items()
+    }
+    return compile_assumption_curves(
+        cost_risk=tables["Cost_Risk"],
+        prepayment_risk=tables["Prepayment_Risk"],
+        index_type=tables["Index_Type"],
+    )
@@ -1,7 +1,10 @@
 import pandas as pd
+import numpy as np
 import logging
 from io import BytesIO
 
+from input_data.table_locator import SheetTableIndex
+
 class ExcelTableLoader:
     def __init__(self, logger=None):
         self.logger = logger or logging.getLogger(__name__)
@@ -16,11 +19,12 @@ class ExcelTableLoader:
         """
         self.logger.info(f"📥 Loading sheet '{sheet_name}' with tables: {table_names}")
         df_sheet = pd.read_excel(excel_file_path, sheet_name=sheet_name, header=None)
+        table_index = SheetTableIndex(df_sheet)
         sheet_dict = {}
 
         for table_name in table_names:
             self.logger.info(f"Reading table '{table_name}' from sheet '{sheet_name}'")
-            table_dict = self._read_single_table(df_sheet, table_name)
+            table_dict = self._read_single_table(table_index, table_name)
             sheet_dict[table_name] = table_dict
 
         return sheet_dict
@@ -38,11 +42,12 @@ class ExcelTableLoader:
         try:
             file_stream.seek(0)
             df_sheet = pd.read_excel(file_stream, sheet_name=sheet_name, header=None)
+            table_index = SheetTableIndex(df_sheet)
             sheet_dict = {}
 
             for table_name in table_names:
                 self.logger.info(f"Reading table '{table_name}' from sheet '{sheet_name}'")
-                table_dict = self._read_single_table(df_sheet, table_name)
+                table_dict = self._read_single_table(table_index, table_name)
                 sheet_dict[table_name] = table_dict
 
             return sheet_dict
@@ -51,44 +56,88 @@ class ExcelTableLoader:
             self.logger.error(f"Error loading tables from stream: {str(e)}")
             return {}
 
-    def _read_single_table(self, df_sheet: pd.DataFrame, table_name: str):
+    def load_table_frames_from_stream(self, file_stream, sheet_name: str, table_names: list):
+        """
+        Reads multiple tables from a sheet as frames instead of nested dicts.
+        :param file_stream: BytesIO stream of Excel file
+        :param sheet_name: Sheet name
+        :param table_names: List of table names to find in column A
+        :return: dict with {table_name: DataFrame indexed by row label, columns = header}
+        """
+        self.logger.info(f"📥 Loading sheet '{sheet_name}' frames with tables: {table_names}")
+
+        try:
+            file_stream.seek(0)
+            df_sheet = pd.read_excel(file_stream, sheet_name=sheet_name, header=None)
+            table_index = SheetTableIndex(df_sheet)
+            return {table_name: self._read_table_frame(table_index, table_name) for table_name in table_names}
+
+        except Exception as e:
+            self.logger.error(f"Error loading table frames from stream: {str(e)}")
+            return {}
+
+    def _read_single_table(self, table_index: SheetTableIndex, table_name: str):
         """
         Reads a single table in a sheet using table_name in column A.
         Returns dict: {loan_type: {date_col: rate_value, ...}, ...}
         """
-        # Bulunan satırı tespit et
-        start_idx = None
-        for i, val in enumerate(df_sheet.iloc[:, 0]):
-            if str(val).strip() == table_name:
-                start_idx = i
-                break
-
-        if start_idx is None:
+        df_table = self._read_table_frame(table_index, table_name)
+
+        # Dict'e çevir
+        table_dict = {}
+        for loan_type, row in df_table.iterrows():
+            table_dict[loan_type] = {str(col): val for col, val in row.items() if pd.notna(val)}
+
+        return table_dict
+
+    def _read_table_frame(self, table_index: SheetTableIndex, table_name: str):
+        """
+        Reads a single table in a sheet using table_name in column A.
+        Returns DataFrame: index = row labels (loan type / index), columns = stripped
+        header values, cells converted with _safe_convert_value (NaN when empty).
+        """
+        # Tablo konumu tek geçişte indekslendi
+        location = table_index.find(table_name)
+        if location is None:
             self.logger.warning(f"Table '{table_name}' not found.")
-            return {}
+            return pd.DataFrame()
 
         # Başlık satırı ve veri satırlarını al
+        start_idx, data_end = location
+        df_sheet = table_index.df_sheet
         header = df_sheet.iloc[start_idx].tolist()  # Başlık satırı (date sütunları)
         data_start = start_idx + 1
-        data_end = data_start
 
-        while data_end < len(df_sheet) and not df_sheet.iloc[data_end, :].isnull().all():
-            data_end += 1
+        df_table = df_sheet.iloc[data_start:data_end, 1:]
+        df_table.columns = [str(col).strip() for col in header[1:]]
+        df_table.index = [str(label).strip() for label in df_sheet.iloc[data_start:data_end, 0]]  # İlk sütun loan type
 
-        df_table = df_sheet.iloc[data_start:data_end].reset_index(drop=True)
-        df_table.columns = header
+        # Tekrarlanan satırlarda son satır geçerli (dict davranışı)
+        df_table = df_table[~df_table.index.duplicated(keep='last')]
+        return self._safe_convert_frame(df_table)
 
-        # Dict'e çevir
-        table_dict = {}
-        for _, row in df_table.iterrows():
-            loan_type = str(row.iloc[0]).strip()  # İlk sütun loan type
-            table_dict[loan_type] = {}
-            for col in df_table.columns[1:]:
-                val = row[col]
-                if pd.notna(val):
-                    table_dict[loan_type][str(col).strip()] = self._safe_convert_value(val)
+    @staticmethod
+    def _safe_convert_frame(df_table: pd.DataFrame):
+        """
+        Vectorized _safe_convert_value over a whole table; empty cells stay NaN.
+        """
+        cells = pd.Series(df_table.to_numpy(dtype=object).ravel())
+        converted = np.where(cells.isna(), np.nan, 0.0)
 
-        return table_dict
+        cell_types = cells.map(type)
+        is_str = (cell_types == str).to_numpy()
+        is_num = cell_types.map(lambda t: issubclass(t, (int, float))).to_numpy() & cells.notna().to_numpy()
+
+        # Strings: % işaretini kaldır, değeri olduğu gibi bırak
+        str_values = pd.to_numeric(cells[is_str].str.replace('%', '', regex=False).str.strip(), errors='coerce')
+        converted[is_str] = str_values.fillna(0.0).to_numpy()
+
+        # Numbers: decimal olarak geldiyse (0.1 = 10%) percentage'a çevir
+        num_values = cells[is_num].astype(float).to_numpy()
+        scale = (num_values > -1) & (num_values < 1) & (num_values != 0)
+        converted[is_num] = np.where(scale, num_values * 100, num_values)
+
+        return pd.DataFrame(converted.reshape(df_table.shape), index=df_table.index, columns=df_table.columns)
 
     @staticmethod
     def _safe_convert_value(rate_value):
@@ -0,0 +1,554 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+
+from input_data.assumption_curves import AssumptionCurves, load_assumption_curves_from_stream
+from input_data.run_context import RunContext
+from input_data.fixed_dfs import (
+    get_fixed_summary_assumptions,
+    load_assumptions_once,
+    prepare_rates_fees_dict,
+    prepare_rates_fees_dict_with_percentage_fix,
+)
+from tools.startup import register_warm_cache
+
+ARTIFACT_VERSION = 4  # 2: lossless fx / tax tables (column values + dtypes); 3: NaN / NaT kept; 4: blank risk cells 0
+ARTIFACT_MAGIC = b"LPVPASM1"
+ARTIFACT_SUFFIX = ".lpvp"
+_ALIGNMENT = 64
+_CURVE_ARRAYS = ("dates", "cost_risk", "prepay_risk", "index_rates")
+
+
+class CompiledAssumptions:
+    """
+    Everything the valuation pipeline reads from a Phase 2 assumptions workbook:
+    - curves: AssumptionCurves bundle (Cost of Risk, Prepayment Risk, Index Type)
+    - rates_fees_dict: output of prepare_rates_fees_dict(_with_percentage_fix)
+    - fx_table / tax_table: Assumption_Currency tables from load_assumptions_once
+    - summary: get_fixed_summary_assumptions scalars as a dict
+    - key: workbook key the artifact is stored under
+    """
+
+    def __init__(self, curves, rates_fees_dict, fx_table, tax_table, summary, key=None):
+        self.curves = curves
+        self.rates_fees_dict = rates_fees_dict
+        self.fx_table = fx_table
+        self.tax_table = tax_table
+        self.summary = summary
+        self.key = key
+
+    @property
+    def summary_df(self):
+        """Single-row frame in the get_fixed_summary_assumptions layout"""
+        return pd.DataFrame([self.summary])
+
+    @property
+    def run_context(self):
+        """Run-level scalars for the calculation engines and the Phase 3 header sheet"""
+        return RunContext.from_summary(self.summary)
+
+
+def workbook_key(workbook_bytes=None, ctag=None, fix_percentage=True):
+    """
+    Artifact key for a workbook: SharePoint cTag when available, otherwise the
+    SHA-256 of the workbook content. Artifact version and compile options are
+    part of the key so a format change never reads a stale artifact.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{ARTIFACT_VERSION}|fix={bool(fix_percentage)}|".encode())
+    if ctag:
+        digest.update(f"ctag:{ctag}".encode())
+    else:
+        digest.update(workbook_bytes)
+    return digest.hexdigest()
+
+
+def artifact_filename(key):
+    return f"Assumption_Compiled_{key[:32]}{ARTIFACT_SUFFIX}"
+
+
+def default_cache_dir():
+    return os.getenv("LPVP_ASSUMPTIONS_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "lpvp_assumptions")
+
+
+def compile_assumptions(workbook_bytes, fix_percentage=True, debug_mode=False, key=None):
+    """Parse and compile an assumptions workbook (bytes) into CompiledAssumptions"""
+    curves = load_assumption_curves_from_stream(BytesIO(workbook_bytes))
+    summary_df = get_fixed_summary_assumptions(BytesIO(workbook_bytes), fix_percentage, debug_mode)
+    fx_table, tax_table, rates_fees_table = load_assumptions_once(BytesIO(workbook_bytes))
+
+    if fix_percentage:
+        rates_fees_dict = prepare_rates_fees_dict_with_percentage_fix(rates_fees_table, debug_mode)
+    else:
+        rates_fees_dict = prepare_rates_fees_dict(rates_fees_table, debug_mode)
+
+    summary = {field: _to_scalar(value) for field, value in summary_df.iloc[0].items()}
+    return CompiledAssumptions(curves, rates_fees_dict, fx_table, tax_table, summary, key=key)
+
+
+# ---------- Artifact I/O ----------
+def save_compiled_assumptions(compiled, path):
+    """
+    Write a single-file artifact: magic, header length, JSON header, then the curve
+    arrays raw and 64-byte aligned so load_compiled_assumptions_artifact can memory-map them.
+    """
+    curves = compiled.curves
+    arrays = {name: np.ascontiguousarray(getattr(curves, name)) for name in _CURVE_ARRAYS}
+
+    header = {
+        "version": ARTIFACT_VERSION,
+        "key": compiled.key,
+        "loan_types": list(curves.loan_types),
+        "indices": list(curves.indices),
+        "summary": {field: _json_scalar(value) for field, value in compiled.summary.items()},
+        "summary_dates": [field for field, value in compiled.summary.items() if isinstance(value, pd.Timestamp)],
+        "rates_fees_dict": {
+            str(type_id): {field: {loan_type: _json_scalar(value) for loan_type, value in values.items()}
+                           for field, values in fields.items()}
+            for type_id, fields in compiled.rates_fees_dict.items()
+        },
+        "fx_table": _table_to_json(compiled.fx_table),
+        "tax_table": _table_to_json(compiled.tax_table),
+        "arrays": {},
+    }
+
+    # Offsets depend on the header size, so lay out arrays relative to the data section first
+    data_offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": data_offset}
+        data_offset = _align(data_offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(ARTIFACT_MAGIC) + 8 + len(header_bytes))
+
+    with _atomic_write(path) as fh:
+        fh.write(ARTIFACT_MAGIC)
+        fh.write(len(header_bytes).to_bytes(8, "little"))
+        fh.write(header_bytes)
+        for name, array in arrays.items():
+            fh.seek(data_start + header["arrays"][name]["offset"])
+            fh.write(array.tobytes())
+
+    logging.info(f"Compiled assumptions artifact written: {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+    return path
+
+
+def load_compiled_assumptions_artifact(path):
+    """Load an artifact written by save_compiled_assumptions; curve arrays are memory-mapped"""
+    with open(path, "rb") as fh:
+        if fh.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+            raise ValueError(f"Not a compiled assumptions artifact: {path}")
+        header_len = int.from_bytes(fh.read(8), "little")
+        header = json.loads(fh.read(header_len).decode("utf-8"))
+
+    if header.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported artifact version {header.get('version')} in {path}")
+
+    data_start = _align(len(ARTIFACT_MAGIC) + 8 + header_len)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=np.dtype(spec["dtype"]))
+        else:
+            arrays[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r",
+                                     offset=data_start + spec["offset"], shape=shape)
+
+    curves = AssumptionCurves(
+        dates=arrays["dates"],
+        loan_types={loan_type: row for row, loan_type in enumerate(header["loan_types"])},
+        indices={index_name: row for row, index_name in enumerate(header["indices"])},
+        cost_risk=arrays["cost_risk"],
+        prepay_risk=arrays["prepay_risk"],
+        index_rates=arrays["index_rates"],
+    )
+
+    summary = {field: _scalar_from_json(value) for field, value in header["summary"].items()}
+    for field in header.get("summary_dates", []):
+        summary[field] = pd.Timestamp(summary[field])
+
+    rates_fees_dict = {
+        int(type_id): {field: {loan_type: _scalar_from_json(value) for loan_type, value in values.items()}
+                       for field, values in fields.items()}
+        for type_id, fields in header["rates_fees_dict"].items()
+    }
+
+    return CompiledAssumptions(
+        curves=curves,
+        rates_fees_dict=rates_fees_dict,
+        fx_table=_table_from_json(header["fx_table"]),
+        tax_table=_table_from_json(header["tax_table"]),
+        summary=summary,
+        key=header.get("key"),
+    )
+
+
+def load_compiled_assumptions(workbook_bytes, ctag=None, cache_dir=None, fix_percentage=True, debug_mode=False):
+    """
+    Return CompiledAssumptions for a workbook: from the warm in-process cache, else
+    memory-mapping the cached artifact when one exists for its key, else compiling +
+    caching it. The result is shared by every run of the process: treat it as read-only.
+    """
+    key = workbook_key(workbook_bytes, ctag, fix_percentage)
+    compiled = _memory_get(key)
+    if compiled is not None:
+        logging.info(f"Compiled assumptions {key[:12]} served from the warm process cache")
+        return compiled
+
+    path = os.path.join(cache_dir or default_cache_dir(), artifact_filename(key))
+    if os.path.exists(path):
+        try:
+            compiled = load_compiled_assumptions_artifact(path)
+            logging.info(f"Loaded compiled assumptions artifact {os.path.basename(path)}")
+            return _memory_put(key, compiled)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable assumptions artifact {path}: {e}")
+
+    logging.info("No compiled assumptions artifact for this workbook, compiling...")
+    compiled = compile_assumptions(workbook_bytes, fix_percentage, debug_mode, key=key)
+    try:
+        save_compiled_assumptions(compiled, path)
+    except OSError as e:
+        logging.warning(f"Could not write assumptions artifact {path}: {e}")
+    return _memory_put(key, compiled)
+
+
+def compiled_assumptions_for_key(key, cache_dir=None):
+    """
+    CompiledAssumptions stored under key (warm cache, what-if variants, then the artifact
+    on disk); None when unknown
+    """
+    compiled = _memory_get(key) or _variant_get(key)
+    if compiled is not None:
+        return compiled
+    path = os.path.join(cache_dir or default_cache_dir(), artifact_filename(key))
+    if not os.path.exists(path):
+        return None
+    return _memory_put(key, load_compiled_assumptions_artifact(path))
+
+
+# ---------- What-if overrides ----------
+OVERRIDE_SECTIONS = ("summary", "rates_fees", "cost_risk", "prepay_risk", "index_rates")
+
+
+def apply_assumption_overrides(compiled, overrides):
+    """
+    CompiledAssumptions with overrides applied on top of compiled, which is left untouched:
+    - summary: {field: value} run-level scalars (val_date as 'YYYY-MM-DD')
+    - rates_fees: {type_id: {field: {loan type: value}}}
+    - cost_risk / prepay_risk: {loan type: value, or one value per period}
+    - index_rates: {index: value, or one value per period}
+    Values are in compiled units, i.e. as the pipeline reads them after the percentage
+    fix (global_tax 25.0 = 25%, where the workbook holds 0.25). The key derives from
+    the base key and the overrides; the variant is kept in memory under it (see
+    variant_cache_entries), so compiled_assumptions_for_key(key) finds it again.
+    Raises ValueError on unknown sections, fields, types, loan types or indices.
+    """
+    if not overrides:
+        return compiled
+    unknown = sorted(set(overrides) - set(OVERRIDE_SECTIONS))
+    if unknown:
+        raise ValueError(f"Unknown override sections: {unknown} (expected some of {list(OVERRIDE_SECTIONS)})")
+
+    summary = dict(compiled.summary)
+    for field, value in (overrides.get("summary") or {}).items():
+        if field not in summary:
+            raise ValueError(f"Unknown summary assumption: {field!r} (expected one of {sorted(summary)})")
+        summary[field] = pd.Timestamp(value) if isinstance(summary[field], pd.Timestamp) else value
+
+    rates_fees_dict = {type_id: {field: dict(values) for field, values in fields.items()}
+                       for type_id, fields in compiled.rates_fees_dict.items()}
+    for type_id, fields in (overrides.get("rates_fees") or {}).items():
+        type_fields = rates_fees_dict.get(int(type_id))
+        if type_fields is None:
+            raise ValueError(f"Unknown rates/fees type: {type_id!r} (expected one of {sorted(rates_fees_dict)})")
+        for field, values in fields.items():
+            if field not in type_fields:
+                raise ValueError(f"Unknown rates/fees field for type {type_id}: {field!r}")
+            type_fields[field].update(values)
+
+    curves = compiled.curves
+    arrays = {}
+    for name, rows in (("cost_risk", curves.loan_types), ("prepay_risk", curves.loan_types),
+                       ("index_rates", curves.indices)):
+        array = getattr(curves, name)
+        if overrides.get(name):
+            array = np.array(array, dtype=np.float64)  # artifacts are read-only memory maps
+            for category, values in overrides[name].items():
+                if category not in rows:
+                    raise ValueError(f"Unknown {name} category: {category!r}")
+                values = np.asarray(values, dtype=np.float64)
+                if values.ndim and values.shape != (curves.n_periods,):
+                    raise ValueError(f"{name}[{category!r}] needs one value or {curves.n_periods} values, got {values.size}")
+                array[rows[category]] = values
+        arrays[name] = array
+
+    digest = hashlib.sha256(f"{compiled.key}|overrides|".encode())
+    digest.update(json.dumps(overrides, sort_keys=True, default=str).encode())
+    key = digest.hexdigest()
+    variant = _variant_get(key)
+    if variant is not None:
+        return variant
+    return _variant_put(key, CompiledAssumptions(
+        curves=AssumptionCurves(curves.calendar, curves.loan_types, curves.indices, **arrays),
+        rates_fees_dict=rates_fees_dict,
+        fx_table=compiled.fx_table,
+        tax_table=compiled.tax_table,
+        summary=summary,
+        key=key,
+    ))
+
+
+# ---------- Warm process cache ----------
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def memory_cache_entries():
+    """Compiled assumptions kept in memory across invocations (LPVP_ASSUMPTIONS_MEMORY_ENTRIES, default 2, 0 disables)"""
+    return max(int(os.getenv("LPVP_ASSUMPTIONS_MEMORY_ENTRIES", "2")), 0)
+
+
+def _memory_get(key):
+    with _memory_lock:
+        compiled = _memory.get(key)
+        if compiled is not None:
+            _memory.move_to_end(key)
+        return compiled
+
+
+def _memory_put(key, compiled):
+    limit = memory_cache_entries()
+    with _memory_lock:
+        if limit:
+            _memory[key] = compiled
+            _memory.move_to_end(key)
+        while len(_memory) > limit:
+            _memory.popitem(last=False)
+    return compiled
+
+
+# What-if variants (apply_assumption_overrides) live apart from workbooks, so scenario
+# runs never evict a workbook
+_variants = OrderedDict()
+
+
+def variant_cache_entries():
+    """What-if variants kept in memory by key (LPVP_ASSUMPTIONS_VARIANT_ENTRIES, default 8, 0 disables)"""
+    return max(int(os.getenv("LPVP_ASSUMPTIONS_VARIANT_ENTRIES", "8")), 0)
+
+
+def _variant_get(key):
+    with _memory_lock:
+        variant = _variants.get(key)
+        if variant is not None:
+            _variants.move_to_end(key)
+        return variant
+
+
+def _variant_put(key, variant):
+    limit = variant_cache_entries()
+    with _memory_lock:
+        if limit:
+            _variants[key] = variant
+            _variants.move_to_end(key)
+        while len(_variants) > limit:
+            _variants.popitem(last=False)
+    return variant
+
+
+def invalidate_compiled_assumptions(key=None):
+    """Drop one workbook key (or everything, what-if variants included) from the warm cache; artifacts on disk stay"""
+    with _memory_lock:
+        if key is None:
+            _memory.clear()
+            _variants.clear()
+        else:
+            _memory.pop(key, None)
+            _variants.pop(key, None)
+
+
+register_warm_cache(
+    "compiled_assumptions",
+    lambda: {"entries": len(_memory), "limit": memory_cache_entries(), "keys": [key[:12] for key in _memory],
+             "variants": len(_variants), "variant_limit": variant_cache_entries()},
+    invalidate_compiled_assumptions,
+)
+
+
+# ---------- SharePoint ----------
+def upload_compiled_assumptions(compiled, access_token, site_id, folder_path, cache_dir=None):
+    """Upload the artifact for compiled.key next to the template in folder_path"""
+    from tools.sharepoint import upload_bytes
+
+    path = os.path.join(cache_dir or default_cache_dir(), artifact_filename(compiled.key))
+    if not os.path.exists(path):
+        save_compiled_assumptions(compiled, path)
+    with open(path, "rb") as fh:
+        data = fh.read()
+    return upload_bytes(access_token, site_id, f"{folder_path}/{os.path.basename(path)}", data)
+
+
+def fetch_compiled_assumptions(key, access_token, site_id, folder_path, cache_dir=None):
+    """
+    Download the artifact for key from folder_path into the local cache.
+    Returns the local path, or None when SharePoint has no artifact for that key.
+    """
+    from tools.sharepoint import download_bytes
+
+    filename = artifact_filename(key)
+    data = download_bytes(access_token, site_id, f"{folder_path}/{filename}")
+    if data is None:
+        return None
+
+    path = os.path.join(cache_dir or default_cache_dir(), filename)
+    with _atomic_write(path) as fh:
+        fh.write(data)
+    return path
+
+
+def check_artifact_roundtrip(workbook_bytes, fix_percentage=True):
+    """
+    Compile a workbook, write and reload its artifact, and raise AssertionError unless
+    the loaded CompiledAssumptions equals the compiled one exactly (curve arrays, rates
+    and fees, fx / tax tables with their dtypes, summary). A cold run and a warm
+    (artifact) run must see bit-identical assumptions.
+    """
+    compiled = compile_assumptions(workbook_bytes, fix_percentage)
+    with tempfile.TemporaryDirectory() as tmp:
+        loaded = load_compiled_assumptions_artifact(save_compiled_assumptions(compiled, os.path.join(tmp, "check.lpvp")))
+        for name in _CURVE_ARRAYS:
+            if not np.array_equal(getattr(compiled.curves, name), getattr(loaded.curves, name), equal_nan=True):
+                raise AssertionError(f"Curve array {name} differs after the artifact round trip")
+        if (dict(compiled.curves.loan_types), dict(compiled.curves.indices)) != (dict(loaded.curves.loan_types), dict(loaded.curves.indices)):
+            raise AssertionError("Curve loan types / indices differ after the artifact round trip")
+        for name in ("fx_table", "tax_table"):
+            pd.testing.assert_frame_equal(getattr(compiled, name), getattr(loaded, name), check_exact=True,
+                                          check_index_type=True, check_column_type=True, obj=name)
+            for column in getattr(compiled, name).columns:
+                original = [type(value) for value in getattr(compiled, name)[column]]
+                if original != [type(value) for value in getattr(loaded, name)[column]]:
+                    raise AssertionError(f"{name}[{column!r}] value types differ after the artifact round trip")
+        if _plain(compiled.rates_fees_dict) != _plain(loaded.rates_fees_dict):
+            raise AssertionError("rates_fees_dict differs after the artifact round trip")
+        if _plain(compiled.summary) != _plain(loaded.summary):
+            raise AssertionError("summary differs after the artifact round trip")
+    return True
+
+
+# ---------- Helpers ----------
+@contextmanager
+def _atomic_write(path):
+    """
+    Binary file handle whose content replaces path atomically on success. Each writer
+    gets its own temp file (mkstemp), so threads and processes compiling the same
+    workbook never replace path with a file another one is still writing.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            yield fh
+        os.replace(tmp_path, path)  # atomic: concurrent readers never see a partial file
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _plain(value):
+    """Comparable form of nested dicts of scalars (numpy scalars unwrapped, NaN equal to NaN)"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    value = _json_scalar(value)
+    return "nan" if isinstance(value, float) and np.isnan(value) else value
+
+
+def _table_to_json(df):
+    """
+    Lossless JSON form of a small table: per-column values as Python scalars (json keeps
+    float repr and int vs float exact), with column dtypes and the index.
+    """
+    index = df.index
+    if isinstance(index, pd.RangeIndex):
+        index_spec = {"range": [index.start, index.stop, index.step]}
+    else:
+        index_spec = {"values": [_json_cell(value) for value in index], "dtype": str(index.dtype)}
+    return {
+        "columns": [_json_cell(column) for column in df.columns],
+        "columns_dtype": str(df.columns.dtype),
+        "dtypes": [str(dtype) for dtype in df.dtypes],
+        "data": [[_json_cell(value) for value in df.iloc[:, position]] for position in range(df.shape[1])],
+        "index": index_spec,
+    }
+
+
+def _table_from_json(spec):
+    index_spec = spec["index"]
+    if "range" in index_spec:
+        index = pd.RangeIndex(*index_spec["range"])
+    else:
+        index = pd.Index([_cell_from_json(value) for value in index_spec["values"]], dtype=index_spec["dtype"])
+    columns = [
+        pd.Series([_cell_from_json(value) for value in values], dtype=dtype, index=index)
+        for values, dtype in zip(spec["data"], spec["dtypes"])
+    ]
+    frame = pd.concat(columns, axis=1) if columns else pd.DataFrame(index=index)
+    frame.columns = pd.Index([_cell_from_json(column) for column in spec["columns"]], dtype=spec["columns_dtype"])
+    return frame
+
+
+def _json_cell(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is pd.NaT:
+        return {"nat": True}
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, "isoformat"):
+        return {"timestamp": pd.Timestamp(value).isoformat()}
+    return value
+
+
+def _cell_from_json(value):
+    if isinstance(value, dict):
+        return pd.NaT if value.get("nat") else pd.Timestamp(value["timestamp"])
+    return value
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _to_scalar(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, "isoformat"):
+        return pd.Timestamp(value)
+    return value
+
+
+def _json_scalar(value):
+    """JSON form of a summary / rates scalar; NaN stays a float (json writes and reads NaN), NaT is tagged"""
+    if value is pd.NaT:
+        return {"nat": True}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def _scalar_from_json(value):
+    if isinstance(value, dict) and value.get("nat"):
+        return pd.NaT
+    return value
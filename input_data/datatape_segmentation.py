@@ -118,7 +118,8 @@ def split_pls(PL_dataset):
         'optimized': {}  # artık index bazlı grup yok
     }
 
-def process_loans_dataframe_segmentation(datatape_df, excel_file_path):
+def split_performing_npl(datatape_df):
+    """PL / NPL split on Past Due Date; without that column every loan is performing"""
     datatape_df.columns = datatape_df.columns.str.strip()
     if 'Past Due Date' in datatape_df.columns:
         datatape_df['Past Due Date'] = pd.to_datetime(datatape_df['Past Due Date'], errors='coerce').fillna(0)
@@ -128,19 +129,26 @@ def process_loans_dataframe_segmentation(datatape_df, excel_file_path):
     else:
         PL_dataset = datatape_df.copy()
         NPL_dataset = pd.DataFrame()
+    return PL_dataset, NPL_dataset
 
+def segment_npls(NPL_dataset, excel_file_path):
     NPL_with_guarantees = NPL_noguarantees = pd.DataFrame()
     if not NPL_dataset.empty:
         NPL_with_guarantees, NPL_noguarantees = split_npls(NPL_dataset, excel_file_path)
+    return NPL_with_guarantees, NPL_noguarantees
 
+def segment_performing(PL_dataset, excel_file_path):
+    """Problematic loan check + calculation type / rate type split of the performing book"""
     problematic_loans = check_problematic_loans(PL_dataset, excel_file_path)
     if not problematic_loans.empty:
         loan_ids_to_remove = problematic_loans['Unique Loan ID'].tolist()
         PL_dataset = PL_dataset[~PL_dataset['Unique Loan ID'].isin(loan_ids_to_remove)].copy()
 
-    pl_results = split_pls(PL_dataset)
+    return split_pls(PL_dataset), problematic_loans, len(PL_dataset)
 
-    complete_results = {
+def assemble_segmentation(total_loans, pl_results, problematic_loans, performing_count,
+                          NPL_with_guarantees, NPL_noguarantees, non_performing_count):
+    return {
         'performing_loans': pl_results,
         'non_performing_loans': {
             'with_guarantees': NPL_with_guarantees,
@@ -148,16 +156,19 @@ def process_loans_dataframe_segmentation(datatape_df, excel_file_path):
         },
         'problematic_loans': problematic_loans,
         'summary': {
-            'total_loans': len(datatape_df),
-            'performing_count': len(PL_dataset),
-            'non_performing_count': len(NPL_dataset),
+            'total_loans': total_loans,
+            'performing_count': performing_count,
+            'non_performing_count': non_performing_count,
             'npl_with_guarantees': len(NPL_with_guarantees),
             'npl_without_guarantees': len(NPL_noguarantees),
             'problematic_loans_count': len(problematic_loans)
         }
     }
 
-    return complete_results
+def process_loans_dataframe_segmentation(datatape_df, excel_file_path):
+    PL_dataset, NPL_dataset = split_performing_npl(datatape_df)
+    NPL_with_guarantees, NPL_noguarantees = segment_npls(NPL_dataset, excel_file_path)
+    pl_results, problematic_loans, performing_count = segment_performing(PL_dataset, excel_file_path)
 
-if __name__ == "__main__":
-    logging.info("datatape_segmentation.py is meant to be imported; run loan_input.py for main pipeline")
+    return assemble_segmentation(len(datatape_df), pl_results, problematic_loans, performing_count,
+                                 NPL_with_guarantees, NPL_noguarantees, len(NPL_dataset))
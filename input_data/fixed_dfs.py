@@ -1,22 +1,15 @@
 import pandas as pd
+import numpy as np
 import logging
-from concurrent.futures import ThreadPoolExecutor
+
+from input_data.table_locator import SheetTableIndex
+from tools.executor_budget import get_executor_budget
+from tools.diagnostics import get_diagnostics
 
 # ---------- Helper Functions ----------
 def extract_tables_from_sheet(raw_excel_data: pd.DataFrame):
-    raw_excel_data['row_index'] = range(len(raw_excel_data))
-    is_empty = raw_excel_data.drop(columns='row_index').isnull().all(axis=1)
-
-    table_ranges, start = [], None
-    for idx in range(len(raw_excel_data)):
-        row_is_empty = is_empty.iloc[idx]
-        if not row_is_empty and start is None:
-            start = idx
-        elif row_is_empty and start is not None:
-            table_ranges.append((start, idx))
-            start = None
-    if start is not None:
-        table_ranges.append((start, len(raw_excel_data)))
+    # Blocks of non-empty rows, found in one vectorized pass
+    table_ranges = SheetTableIndex(raw_excel_data).blocks()
 
     def drop_trailing_nan_cols(df):
         non_nan_cols = df.columns[~df.isnull().all()]
@@ -27,7 +20,7 @@ def extract_tables_from_sheet(raw_excel_data: pd.DataFrame):
 
     tables = []
     for start, end in table_ranges:
-        chunk = raw_excel_data.iloc[start:end].drop(columns='row_index')
+        chunk = raw_excel_data.iloc[start:end]
         chunk.columns = chunk.iloc[0]
         df = chunk[1:].reset_index(drop=True)
         df.columns.name = None
@@ -37,6 +30,19 @@ def extract_tables_from_sheet(raw_excel_data: pd.DataFrame):
     
     return tables
 
+def _percentage_scale(values):
+    # Excel shows percentages, pandas may read them as decimals (0.14 for 14%)
+    values = pd.Series(values).dropna()
+    if values.empty:
+        return None
+    return "decimal" if values.max() < 1 else "percentage"
+
+def _percentage_column_report(table, columns, sample):
+    return {
+        col: {"sample": sample(table[col]), "max": table[col].max(), "scale": _percentage_scale(table[col])}
+        for col in columns if col in table.columns
+    }
+
 # ---------- Fixed Assumptions Loaders ----------
 def get_fixed_summary_assumptions(assump_path: str, fix_percentage=False, debug_mode=False):
     summary_table = pd.read_excel(assump_path, sheet_name='Assumption_Summary', header=0)
@@ -57,27 +63,25 @@ def get_fixed_summary_assumptions(assump_path: str, fix_percentage=False, debug_
         'cr_sensitivity_range': summary_table.loc[summary_table['Assumption Summary'] == 'Sensitivity Table: Cost of Risk Sensitivity Range', 'Input'].iloc[0]  
     }
     
+    diag = get_diagnostics()
+
     # DEBUG: Summary percentage değerlerini kontrol et
-    if debug_mode:
-        print("\n=== 🔍 DEBUG: SUMMARY PERCENTAGE VALUES ===")
-        for field in percentage_fields:
-            value = data[field]
-            print(f"{field}: {value} (type: {type(value).__name__})")
-            if isinstance(value, (int, float)) and value < 1:
-                print(f"  ⚠️  {field} appears to be in decimal format")
+    diag.emit("summary_percentage_values", force=debug_mode, values=lambda: {
+        field: {"value": data[field], "type": type(data[field]).__name__,
+                "decimal_format": isinstance(data[field], (int, float)) and data[field] < 1}
+        for field in percentage_fields
+    })
     
     # FIX: Summary percentage değerlerini düzelt
     if fix_percentage:
-        print("\n=== 🔧 APPLYING SUMMARY PERCENTAGE FIX ===")
+        converted = {}
         for field in percentage_fields:
             value = data[field]
             if isinstance(value, (int, float)) and value < 1:
-                old_value = value
                 data[field] = value * 100
-                if debug_mode:
-                    print(f"  🔧 Converting {field}: {old_value} -> {data[field]}")
-            elif debug_mode:
-                print(f"  ✅ {field}: Already in percentage format ({value})")
+                converted[field] = [value, data[field]]
+        diag.emit("summary_percentage_fix", force=debug_mode, converted=converted,
+                  already_percentage=[field for field in percentage_fields if field not in converted])
     
     return pd.DataFrame([data])
 
@@ -105,27 +109,11 @@ def prepare_rates_fees_dict(rates_fees_table, debug_mode=False):
     rates_fees_table['Calculation Type'] = rates_fees_table['Types of Loans'].map(calculation_types).fillna('')
 
     # DEBUG: Percentage değerlerini kontrol et
-    if debug_mode:
-        print("\n=== 🔍 DEBUG: PERCENTAGE VALUES ===")
-        percentage_columns = ['Discount Rate', 'Non-interest fees (over undrawn commitment)', 
-                            'Non-interest fees (over outstanding balance)', 'Servicing Fee']
-        
-        for col in percentage_columns:
-            if col in rates_fees_table.columns:
-                sample_values = rates_fees_table[col].dropna().head(3)
-                print(f"\n{col} sample values:")
-                for idx, val in sample_values.items():
-                    print(f"  Row {idx}: {val} (type: {type(val).__name__})")
-                
-                # Percentage format kontrolü
-                non_null_values = rates_fees_table[col].dropna()
-                if len(non_null_values) > 0:
-                    max_val = non_null_values.max()
-                    if max_val < 1:
-                        print(f"  ⚠️  {col}: Values appear to be in decimal format (max: {max_val})")
-                        print(f"  📝 Excel probably shows as percentage but pandas reads as decimal")
-                    else:
-                        print(f"  ✅ {col}: Values appear to be in percentage format (max: {max_val})")
+    diag = get_diagnostics()
+    percentage_columns = ['Discount Rate', 'Non-interest fees (over undrawn commitment)', 
+                        'Non-interest fees (over outstanding balance)', 'Servicing Fee']
+    diag.emit("rates_fees_percentage_values", force=debug_mode,
+              columns=lambda: _percentage_column_report(rates_fees_table, percentage_columns, diag.sample))
 
     rates_fees_dict = {}
     for type_id in range(1,5):
@@ -139,13 +127,9 @@ def prepare_rates_fees_dict(rates_fees_table, debug_mode=False):
             'servicing_fee': dict(zip(filtered_df['Types of Loans'], filtered_df['Servicing Fee']))
         }
         
-        # DEBUG: Dict'e eklenen değerleri göster
-        if debug_mode and type_id == 1:  # Sadece type_1 için göster
-            print(f"\n=== 📊 DEBUG: TYPE_{type_id} DICT VALUES ===")
-            sample_loan_types = list(rates_fees_dict[type_id]['discount_rate'].keys())[:3]
-            for loan_type in sample_loan_types:
-                dr = rates_fees_dict[type_id]['discount_rate'][loan_type]
-                print(f"  {loan_type}: discount_rate = {dr} (type: {type(dr).__name__})")
+    # DEBUG: Dict'e eklenen değerleri göster (sadece type_1)
+    diag.emit("rates_fees_dict_sample", force=debug_mode, type_id=1,
+              discount_rate=lambda: dict(list(rates_fees_dict[1]['discount_rate'].items())[:diag.sample_rows]))
     
     return rates_fees_dict
 
@@ -169,18 +153,17 @@ def prepare_rates_fees_dict_with_percentage_fix(rates_fees_table, debug_mode=Fal
                          'Non-interest fees (over outstanding balance)', 'Servicing Fee']
 
     # Percentage formatını düzelt
-    if debug_mode:
-        print("\n=== 🔧 APPLYING PERCENTAGE FIX ===")
-    
+    diag = get_diagnostics()
+    converted = {}
     for col in percentage_columns:
         if col in rates_fees_table.columns:
             non_null_values = rates_fees_table[col].dropna()
             if len(non_null_values) > 0 and (non_null_values < 1).all():
-                if debug_mode:
-                    print(f"  🔧 Converting {col}: {non_null_values.iloc[0]} -> {non_null_values.iloc[0] * 100}")
+                converted[col] = [non_null_values.iloc[0], non_null_values.iloc[0] * 100]
                 rates_fees_table[col] = rates_fees_table[col] * 100
-            elif debug_mode:
-                print(f"  ✅ {col}: Already in percentage format")
+    diag.emit("rates_fees_percentage_fix", force=debug_mode, converted=converted,
+              already_percentage=[col for col in percentage_columns
+                                  if col in rates_fees_table.columns and col not in converted])
 
     rates_fees_dict = {}
     for type_id in range(1,5):
@@ -194,18 +177,123 @@ def prepare_rates_fees_dict_with_percentage_fix(rates_fees_table, debug_mode=Fal
             'servicing_fee': dict(zip(filtered_df['Types of Loans'], filtered_df['Servicing Fee']))
         }
         
-        # DEBUG: Düzeltilmiş değerleri göster
-        if debug_mode and type_id == 1:
-            print(f"\n=== ✅ DEBUG: FIXED TYPE_{type_id} VALUES ===")
-            sample_loan_types = list(rates_fees_dict[type_id]['discount_rate'].keys())[:3]
-            for loan_type in sample_loan_types:
-                dr = rates_fees_dict[type_id]['discount_rate'][loan_type]
-                print(f"  {loan_type}: discount_rate = {dr} (type: {type(dr).__name__})")
+    # DEBUG: Düzeltilmiş değerleri göster (sadece type_1)
+    diag.emit("rates_fees_dict_sample", force=debug_mode, type_id=1, fixed=True,
+              discount_rate=lambda: dict(list(rates_fees_dict[1]['discount_rate'].items())[:diag.sample_rows]))
     
     return rates_fees_dict
 
+# ---------- Compiled Lookups ----------
+RATES_FEES_FIELDS = ['discount_rate', 'fees_undrawn_commitment', 'fees_outstanding_balance', 'servicing_fee']
+
+class EnrichmentLookups:
+    """
+    FX, tax and rates/fees tables compiled once per run into keyed indexes:
+    - fx: Series currency -> exchange rate to output_currency (direct, inverse or triangulated)
+    - tax: Series currency -> Corporate Tax
+    - rates_fees: DataFrame indexed by (calculation type id, Type of Loan) with RATES_FEES_FIELDS
+    """
+
+    def __init__(self, output_currency, fx, tax, rates_fees):
+        self.output_currency = output_currency
+        self.fx = fx
+        self.tax = tax
+        self.rates_fees = rates_fees
+
+def compile_fx_rates(fx_table, output_currency, pivot_currency='EUR'):
+    """
+    Exchange rate of every known currency against output_currency.
+    Rates are 'Quote per Base'; a missing direct pair falls back to the inverse pair,
+    then to triangulation Quote -> pivot -> output (pivot_currency first, then any other).
+    """
+    matrix = fx_table.pivot_table(index='Quote Currency', columns='Base Currency',
+                                  values='Exchange Rate at Valuation Date', aggfunc='first')
+    currencies = matrix.index.union(matrix.columns)
+    matrix = matrix.reindex(index=currencies, columns=currencies).astype(float)
+    # Inverse pairs fill the gaps: rate(Q, B) = 1 / rate(B, Q)
+    with np.errstate(divide='ignore'):
+        matrix = matrix.fillna(1.0 / matrix.T.replace(0.0, np.nan))
+    for cur in currencies:
+        matrix.loc[cur, cur] = 1.0
+
+    if output_currency not in matrix.columns:
+        return pd.Series(dtype=float)
+
+    rates = matrix[output_currency].copy()
+    pivots = [pivot_currency] if pivot_currency in currencies else []
+    pivots += [cur for cur in currencies if cur not in (pivot_currency, output_currency)]
+    # Repeat while gaps keep closing: rates[pivot] may itself be triangulated
+    missing = rates.isna().sum()
+    while missing:
+        for pivot in pivots:
+            rates = rates.fillna(matrix[pivot] * rates[pivot])
+        if rates.isna().sum() == missing:
+            break
+        missing = rates.isna().sum()
+    return rates.dropna()
+
+def compile_enrichment_lookups(summary_df, fx_table, tax_table, rates_fees_dict, pivot_currency='EUR'):
+    output_currency = summary_df['output_currency'].iloc[0]
+
+    fx = compile_fx_rates(fx_table, output_currency, pivot_currency)
+
+    tax = tax_table.drop_duplicates('Local Currency (Performing Loans only)', keep='first')
+    tax = tax.set_index('Local Currency (Performing Loans only)')['Corporate Tax']
+    try:
+        tax = tax.astype(float)  # workbook cells come as an object column; tax_rate stays numeric
+    except (TypeError, ValueError):
+        pass
+
+    records = [
+        (type_id, loan_type, field, value)
+        for type_id, fields in rates_fees_dict.items()
+        for field, values in fields.items()
+        for loan_type, value in values.items()
+    ]
+    rates_fees = pd.DataFrame(records, columns=['type_id', 'Type of Loan', 'field', 'value'])
+    rates_fees = rates_fees.drop_duplicates(['type_id', 'Type of Loan', 'field'], keep='last')
+    rates_fees = rates_fees.set_index(['type_id', 'Type of Loan', 'field'])['value'].unstack('field')
+    rates_fees = rates_fees.reindex(columns=RATES_FEES_FIELDS)
+
+    return EnrichmentLookups(output_currency, fx, tax, rates_fees)
+
+def apply_enrichment_lookups(loans_df, type_ids, lookups):
+    """
+    Join FX, tax and rates/fees onto loans_df in one vectorized pass.
+    type_ids: scalar or per-row calculation type ids (type-tagged portfolio)
+    Unknown currencies get fx_rate 1.0 and tax_rate 0.0, as before.
+    """
+    currency = loans_df['Currency']
+    fx_rate = currency.map(lookups.fx)
+    tax_rate = currency.map(lookups.tax)
+    loans_df['fx_rate'] = fx_rate.where(currency.isna() | fx_rate.notna(), 1.0)
+    loans_df['tax_rate'] = tax_rate.where(currency.isna() | tax_rate.notna(), 0.0)
+
+    type_ids = np.broadcast_to(np.asarray(type_ids, dtype=int), (len(loans_df),))
+    keys = pd.MultiIndex.from_arrays([type_ids, loans_df['Type of Loan'].to_numpy()])
+    joined = lookups.rates_fees.reindex(keys)
+    for field in RATES_FEES_FIELDS:
+        loans_df[field] = joined[field].to_numpy()
+    return loans_df
+
 # ---------- Type Processing ----------
-def process_type(loans_df, type_id, summary_df, fx_table, tax_table, rates_fees_dict, fix_percentage=False, debug_mode=False):
+ENRICHMENT_COLUMNS = ['fx_rate', 'tax_rate'] + RATES_FEES_FIELDS
+
+# Columns process_type guarantees, with the default used when a frame lacks them
+COLUMN_DEFAULTS = {
+    "Currency": "EUR",
+    "Type of Loan": "Other",
+    "Outstanding Balance After Adjustments (€)": 0.0,
+}
+
+def _interest_rate_diagnostics(loans_df, type_id, force=False):
+    # DEBUG: Interest Rate sütunu kontrol et (bu loans_df'den geliyor); sampled, evaluated only when enabled
+    diag = get_diagnostics()
+    rates = loans_df["Interest Rate (%)"]
+    diag.emit("interest_rate_scale", force=force, type_id=type_id, sample=lambda: diag.sample(rates),
+              max=lambda: rates.max(), scale=lambda: _percentage_scale(rates))
+
+def process_type(loans_df, type_id, summary_df, fx_table, tax_table, rates_fees_dict, fix_percentage=False, debug_mode=False, lookups=None):
     if loans_df is None or loans_df.empty:
         return pd.DataFrame()
 
@@ -217,122 +305,162 @@ def process_type(loans_df, type_id, summary_df, fx_table, tax_table, rates_fees_
         loans_df["Maturity Date"] = loans_df["maturity_date"]
     loans_df["Outstanding Balance After Adjustments (€)"] = loans_df.get("Outstanding Balance After Adjustments (€)", 0.0)
 
-    # DEBUG: Interest Rate sütunu kontrol et (bu loans_df'den geliyor)
-    if debug_mode and "Interest Rate (%)" in loans_df.columns:
-        print(f"\n=== 🔍 DEBUG: TYPE_{type_id} INTEREST RATE VALUES ===")
-        sample_rates = loans_df["Interest Rate (%)"].dropna().head(3)
-        for idx, rate in sample_rates.items():
-            print(f"  Row {idx}: {rate} (type: {type(rate).__name__})")
-        
-        max_rate = loans_df["Interest Rate (%)"].max()
-        if max_rate < 1:
-            print(f"  ⚠️  Interest Rate (%): Values appear to be in decimal format (max: {max_rate})")
-        else:
-            print(f"  ✅ Interest Rate (%): Values appear to be in percentage format (max: {max_rate})")
+    if "Interest Rate (%)" in loans_df.columns:
+        _interest_rate_diagnostics(loans_df, type_id, force=debug_mode)
 
     # FIX: Interest Rate sütunu düzelt
     if fix_percentage and "Interest Rate (%)" in loans_df.columns:
         interest_rates = loans_df["Interest Rate (%)"]
         if interest_rates.notna().any() and (interest_rates[interest_rates.notna()] < 1).all():
-            if debug_mode:
-                old_sample = interest_rates.dropna().iloc[0]
-                print(f"\n=== 🔧 FIXING TYPE_{type_id} INTEREST RATES ===")
-                print(f"  🔧 Converting Interest Rate (%): {old_sample} -> {old_sample * 100}")
+            get_diagnostics().emit("interest_rate_fix", force=debug_mode, type_ids=[type_id],
+                                   example=lambda: [interest_rates.dropna().iloc[0], interest_rates.dropna().iloc[0] * 100])
             loans_df["Interest Rate (%)"] = loans_df["Interest Rate (%)"] * 100
 
-    output_currency = summary_df['output_currency'].iloc[0]
+    # FX / Tax / Rates & Fees: compiled once per run, reused by every type
+    if lookups is None:
+        lookups = compile_enrichment_lookups(summary_df, fx_table, tax_table, rates_fees_dict)
 
-    # FX / Tax mapping
-    fx_dict, tax_dict = {}, {}
-    unique_currencies = loans_df['Currency'].dropna().unique()
-    for cur in unique_currencies:
-        rate_row = fx_table[(fx_table['Quote Currency']==cur) & (fx_table['Base Currency']==output_currency)]
-        fx_dict[cur] = rate_row.iloc[0]['Exchange Rate at Valuation Date'] if not rate_row.empty else 1.0
-        tax_row = tax_table[tax_table['Local Currency (Performing Loans only)']==cur]
-        tax_dict[cur] = tax_row.iloc[0]['Corporate Tax'] if not tax_row.empty else 0.0
-
-    # Add fixed columns (artık düzeltilmiş summary değerleri)
-    loans_df['val_date'] = summary_df['val_date'].iloc[0]
-    loans_df['output_currency'] = output_currency
-    loans_df['global_tax_flag'] = summary_df['global_tax_flag'].iloc[0]
-    loans_df['global_tax'] = summary_df['global_tax'].iloc[0]
-    loans_df['cor_spread'] = summary_df['cor_spread'].iloc[0]
-    loans_df['dr_sensitivity_var'] = summary_df['dr_sensitivity_var'].iloc[0]
-    loans_df['dr_sensitivity_range'] = summary_df['dr_sensitivity_range'].iloc[0]
-    loans_df['cr_sensitivity_var'] = summary_df['cr_sensitivity_var'].iloc[0]
-    loans_df['cr_sensitivity_range'] = summary_df['cr_sensitivity_range'].iloc[0]
-
-    loans_df['fx_rate'] = loans_df['Currency'].map(fx_dict)
-    loans_df['tax_rate'] = loans_df['Currency'].map(tax_dict)
-
-    rates = rates_fees_dict[type_id]
-    loans_df['discount_rate'] = loans_df['Type of Loan'].map(rates['discount_rate'])
-    loans_df['fees_undrawn_commitment'] = loans_df['Type of Loan'].map(rates['fees_undrawn_commitment'])
-    loans_df['fees_outstanding_balance'] = loans_df['Type of Loan'].map(rates['fees_outstanding_balance'])
-    loans_df['servicing_fee'] = loans_df['Type of Loan'].map(rates['servicing_fee'])
+    # Run-level scalars (val_date, global_tax, sensitivities, ...) are not broadcast
+    # per row; they live in RunContext (see input_data/run_context.py)
+    return apply_enrichment_lookups(loans_df, type_id, lookups)
 
-    return loans_df
+def _enrich_type_stage(loans_df, type_key, curves, lookups, fix_percentage=False):
+    # Process pool stage: the percentage fix looks at the whole type, so one task per type
+    type_id = int(type_key.split("_")[-1])
+    return process_type(loans_df, type_id, None, None, None, None, fix_percentage, lookups=lookups)
+
+def enrich_portfolio(loans_dict: dict, lookups, fix_percentage=False, debug_mode=False) -> dict:
+    """
+    Single-pass enrichment over one type-tagged portfolio frame.
+
+    The four type frames are concatenated once; a per-row type id array drives the
+    rates/fees join, the interest rate percentage fix is decided per type with one
+    groupby, and the result is split back into contiguous per-type slices.
+    Output matches process_type for every type.
+    """
+    enriched_loans = {f"type_{type_id}": pd.DataFrame() for type_id in range(1, 5)}
+    parts = [(type_id, loans_dict.get(f"type_{type_id}")) for type_id in range(1, 5)]
+    parts = [(type_id, df) for type_id, df in parts if df is not None and not df.empty]
+    if not parts:
+        return enriched_loans
+
+    portfolio = pd.concat([df for _, df in parts], ignore_index=True)
+    lengths = np.array([len(df) for _, df in parts])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    type_ids = np.repeat([type_id for type_id, _ in parts], lengths)
+
+    # Ensure columns exist: defaults only for the types whose frame lacked the column
+    output_columns = {}
+    for i, (type_id, df) in enumerate(parts):
+        rows = slice(offsets[i], offsets[i + 1])
+        added = [col for col in COLUMN_DEFAULTS if col not in df.columns]
+        for col in added:
+            portfolio.loc[portfolio.index[rows], col] = COLUMN_DEFAULTS[col]
+        if "Maturity Date" not in df.columns and "maturity_date" in df.columns:
+            portfolio.loc[portfolio.index[rows], "Maturity Date"] = portfolio["maturity_date"].iloc[rows]
+            added.append("Maturity Date")
+        output_columns[type_id] = list(dict.fromkeys(list(df.columns) + added + ENRICHMENT_COLUMNS))
+
+        if "Interest Rate (%)" in df.columns:
+            _interest_rate_diagnostics(df, type_id, force=debug_mode)
+
+    # FIX: Interest Rate sütunu, tip bazında tek groupby ile
+    if fix_percentage and "Interest Rate (%)" in portfolio.columns:
+        interest_rates = portfolio["Interest Rate (%)"]
+        per_type = interest_rates.groupby(type_ids)
+        needs_fix = (per_type.count() > 0) & (per_type.max() < 1)
+        if needs_fix.any():
+            get_diagnostics().emit("interest_rate_fix", force=debug_mode,
+                                   type_ids=lambda: needs_fix[needs_fix].index.tolist())
+            portfolio["Interest Rate (%)"] = interest_rates * np.where(needs_fix.reindex(type_ids).to_numpy(), 100, 1)
+
+    apply_enrichment_lookups(portfolio, type_ids, lookups)
+
+    for i, (type_id, _) in enumerate(parts):
+        type_df = portfolio.iloc[offsets[i]:offsets[i + 1]]
+        enriched_loans[f"type_{type_id}"] = type_df[output_columns[type_id]].reset_index(drop=True)
+
+    return enriched_loans
 
 # ---------- Central Function with Debug ----------
-def enrich_loans_with_fixed_assumptions_parallel(loans_dict: dict, assumptions_excel_path: str, 
-                                               debug_percentage=False, fix_percentage=False) -> dict:
+def enrich_loans_with_fixed_assumptions_parallel(loans_dict: dict, assumptions, 
+                                               debug_percentage=False, fix_percentage=False,
+                                               mode="concat", pool=None) -> dict:
     """
     Enhanced version with percentage debugging and fixing options
     
     Args:
         loans_dict: Dictionary of loans by type
-        assumptions_excel_path: Path to assumptions Excel file
-        debug_percentage: Enable percentage format debugging
+        assumptions: CompiledAssumptions, or path / stream of the assumptions Excel file
+        debug_percentage: Force the percentage format diagnostics for this call; otherwise
+                          they follow the diagnostics level (tools/diagnostics.py, off by default)
         fix_percentage: Apply automatic percentage fix (0.14 -> 14)
+        mode: "concat" (default) enriches one type-tagged portfolio frame in a single
+              vectorized pass; "threaded" runs process_type per type on executor budget threads
+        pool: optional tools.process_pool.TypeStagePool; when given, process_type runs
+              per type in the worker processes (overrides mode)
     
     Returns:
         dict: Enriched loans dictionary
     """
-    print(f"\n🚀 Starting loan enrichment with debug_percentage={debug_percentage}, fix_percentage={fix_percentage}")
-    
-    # UPDATED: Summary assumptions'ı da fix parametreleri ile oku
-    summary_df = get_fixed_summary_assumptions(assumptions_excel_path, fix_percentage, debug_percentage)
-    fx_table, tax_table, rates_fees_table = load_assumptions_once(assumptions_excel_path)
+    from input_data.compiled_assumptions import CompiledAssumptions
+
+    logging.info(f"Starting loan enrichment (fix_percentage={fix_percentage}, mode={'pool' if pool else mode})")
+    diag = get_diagnostics()
     
-    if fix_percentage:
-        print("🔧 Using percentage fix version...")
-        rates_fees_dict = prepare_rates_fees_dict_with_percentage_fix(rates_fees_table, debug_percentage)
+    if isinstance(assumptions, CompiledAssumptions):
+        # Already parsed (possibly memory-mapped from the artifact cache)
+        summary_df = assumptions.summary_df
+        fx_table, tax_table = assumptions.fx_table, assumptions.tax_table
+        rates_fees_dict = assumptions.rates_fees_dict
     else:
-        print("📊 Using original version...")
-        rates_fees_dict = prepare_rates_fees_dict(rates_fees_table, debug_percentage)
+        # UPDATED: Summary assumptions'ı da fix parametreleri ile oku
+        summary_df = get_fixed_summary_assumptions(assumptions, fix_percentage, debug_percentage)
+        fx_table, tax_table, rates_fees_table = load_assumptions_once(assumptions)
+        
+        if fix_percentage:
+            logging.info("Using percentage fix version...")
+            rates_fees_dict = prepare_rates_fees_dict_with_percentage_fix(rates_fees_table, debug_percentage)
+        else:
+            logging.info("Using original version...")
+            rates_fees_dict = prepare_rates_fees_dict(rates_fees_table, debug_percentage)
 
     # Final debug: Çıkan değerleri göster
-    if debug_percentage:
-        print(f"\n=== 🎯 FINAL DEBUG: SAMPLE OUTPUT VALUES ===")
-        sample_type = 1
-        sample_loan_type = list(rates_fees_dict[sample_type]['discount_rate'].keys())[0]
-        sample_discount_rate = rates_fees_dict[sample_type]['discount_rate'][sample_loan_type]
-        print(f"Sample: Type {sample_type}, {sample_loan_type}")
-        print(f"Discount Rate: {sample_discount_rate} (type: {type(sample_discount_rate).__name__})")
-        
-        # Summary değerlerini de göster
-        print(f"\nSample Summary Values:")
-        print(f"Global Tax: {summary_df['global_tax'].iloc[0]}")
-        print(f"CoR Spread: {summary_df['cor_spread'].iloc[0]}")
-        print(f"DR Sensitivity Range: {summary_df['dr_sensitivity_range'].iloc[0]}")
-        
-        if isinstance(sample_discount_rate, (int, float)):
-            if sample_discount_rate < 1:
-                print("❌ Still in decimal format (e.g., 0.14 for 14%)")
-            else:
-                print("✅ In percentage format (e.g., 14 for 14%)")
-
-    enriched_loans = {}
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for type_id in range(1,5):
-            type_key = f"type_{type_id}"
-            # UPDATED: process_type'a da debug ve fix parametrelerini geç
-            futures[executor.submit(process_type, loans_dict.get(type_key), type_id, summary_df, fx_table, tax_table, rates_fees_dict, fix_percentage, debug_percentage)] = type_key
-
-        for fut in futures:
-            type_key = futures[fut]
-            enriched_loans[type_key] = fut.result()
-
-    print("✅ Loan enrichment completed!")
+    if debug_percentage or diag.enabled():
+        discount_rates = rates_fees_dict[1]['discount_rate']
+        sample_loan_type = next(iter(discount_rates), None)
+        sample_discount_rate = discount_rates.get(sample_loan_type)
+        diag.emit(
+            "enrichment_sample_output", force=debug_percentage,
+            type_id=1, loan_type=sample_loan_type, discount_rate=sample_discount_rate,
+            discount_rate_scale=(_percentage_scale([sample_discount_rate])
+                                 if isinstance(sample_discount_rate, (int, float)) else None),
+            global_tax=summary_df['global_tax'].iloc[0],
+            cor_spread=summary_df['cor_spread'].iloc[0],
+            dr_sensitivity_range=summary_df['dr_sensitivity_range'].iloc[0],
+        )
+
+    lookups = compile_enrichment_lookups(summary_df, fx_table, tax_table, rates_fees_dict)
+
+    if pool is not None:
+        enriched_loans = pool.map_types(_enrich_type_stage, loans_dict, chunked=False,
+                                        lookups=lookups, fix_percentage=fix_percentage)
+        logging.info("Loan enrichment completed")
+        return enriched_loans
+
+    if mode == "concat":
+        enriched_loans = enrich_portfolio(loans_dict, lookups, fix_percentage, debug_percentage)
+        logging.info("Loan enrichment completed")
+        return enriched_loans
+
+    # Threads come from the process-wide executor budget (caller runs when no slot is free)
+    def _process(type_id):
+        # UPDATED: process_type'a da debug ve fix parametrelerini geç
+        return process_type(loans_dict.get(f"type_{type_id}"), type_id, summary_df, fx_table, tax_table,
+                            rates_fees_dict, fix_percentage, debug_percentage, lookups)
+
+    results = get_executor_budget().map(_process, range(1, 5))
+    enriched_loans = {f"type_{type_id}": result for type_id, result in zip(range(1, 5), results)}
+
+    logging.info("Loan enrichment completed")
     return enriched_loans
\ No newline at end of file
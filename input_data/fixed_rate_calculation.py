@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
 import logging
 
+from input_data.period_calendar import iso_dates
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
@@ -22,54 +25,96 @@ def convert_rate_to_decimal(rate_value):
         return 0.0
 
 
-def process_fixed_loans_dataframe(loans_df, type_key):
+_RATE_PLACEHOLDERS = ['Not available', 'Not applicable', '', 'n/a', 'na']
+
+
+def convert_rates_to_decimal(rate_values):
     """
-    Process a single fixed loan DataFrame and return the same DataFrame with an extra column 'total_rates'
-    total_rates: {maturity_date: fixed_rate_decimal}
+    Vectorized convert_rate_to_decimal over a whole column.
+    Returns a float numpy array; placeholders and unparseable values become 0.0
+    """
+    values = pd.Series(rate_values, dtype=object).reset_index(drop=True)
+    is_str = (values.map(type) == str).to_numpy()
+    is_placeholder = (values.isna() | values.isin(_RATE_PLACEHOLDERS)).to_numpy()
+    text = values[is_str].astype(str)
+    is_pct = np.zeros(len(values), dtype=bool)
+    is_pct[np.flatnonzero(is_str)] = text.str.contains('%', regex=False).to_numpy()
+
+    rates = np.zeros(len(values), dtype=float)
+
+    # '5.25%' -> 0.0525
+    pct_values = pd.to_numeric(values[is_pct & ~is_placeholder].str.replace('%', '', regex=False).str.strip(), errors='coerce')
+    rates[is_pct & ~is_placeholder] = pct_values.to_numpy(dtype=float) / 100
+
+    # 5.25 -> 0.0525, 0.0525 stays
+    plain = ~is_pct & ~is_placeholder
+    plain_values = pd.to_numeric(values[plain], errors='coerce').to_numpy(dtype=float)
+    rates[plain] = np.where(plain_values > 1, plain_values / 100, plain_values)
+
+    failed = ~is_placeholder & np.isnan(rates)
+    if failed.any():
+        logging.warning(f"Failed to convert {int(failed.sum())} rates, e.g. {values[failed].iloc[0]!r}; using 0.0")
+        rates[failed] = 0.0
+    return rates
+
+
+def process_fixed_loans_dataframe(loans_df, type_key, curves=None):
+    """
+    Process a single fixed loan DataFrame column-wise and return it with:
+    - fixed_rate: decimal rate (bulk converted)
+    - maturity_idx: periods on or before maturity on the curves axis (when curves given),
+      same meaning as for floating loans; 0 when maturity is missing
+    - total_rates: {maturity_date: fixed_rate_decimal}, kept for the Phase 3 output
     """
     loans_df = loans_df.copy()
 
     if loans_df.empty:
+        loans_df['fixed_rate'] = pd.Series(dtype=float)
+        if curves is not None:
+            loans_df['maturity_idx'] = pd.Series(dtype=np.int64)
         loans_df['total_rates'] = [{} for _ in range(len(loans_df))]
         logging.info(f"Type {type_key} fixed loans DataFrame is empty, added empty total_rates column")
         return loans_df
 
-    total_rates_list = []
-
     logging.info(f"Starting fixed calculations for Type {type_key} on {len(loans_df)} loans...")
 
-    for _, loan in loans_df.iterrows():
-        interest_rate = loan.get('Interest Rate (%)', 0)
-        maturity_date = loan.get('Maturity Date', None)
-
-        # Convert interest rate to decimal
-        rate_decimal = convert_rate_to_decimal(interest_rate)
+    if 'Interest Rate (%)' in loans_df.columns:
+        fixed_rates = convert_rates_to_decimal(loans_df['Interest Rate (%)'])
+    else:
+        fixed_rates = np.zeros(len(loans_df))
 
-        # Create total_rates dictionary
-        if pd.isna(maturity_date) or maturity_date is None:
-            total_rate_dict = {}
-        else:
-            total_rate_dict = {str(maturity_date): rate_decimal}
+    if 'Maturity Date' in loans_df.columns:
+        maturities = pd.to_datetime(loans_df['Maturity Date'], errors='coerce')
+    else:
+        maturities = pd.Series(pd.NaT, index=loans_df.index, dtype='datetime64[ns]')
+    has_maturity = maturities.notna().to_numpy()
 
-        total_rates_list.append(total_rate_dict)
+    loans_df['fixed_rate'] = fixed_rates
+    if curves is not None:
+        loans_df['maturity_idx'] = np.where(has_maturity, curves.cut_offs(maturities), 0)
 
-    loans_df['total_rates'] = total_rates_list
+    maturity_keys = iso_dates(maturities).tolist()
+    loans_df['total_rates'] = [
+        {key: rate} if present else {}
+        for key, rate, present in zip(maturity_keys, fixed_rates.tolist(), has_maturity)
+    ]
 
     logging.info(f"Completed fixed calculations for Type {type_key}")
     return loans_df
 
 
-def process_fixed_calculations(fixed_dfs):
+def process_fixed_calculations(fixed_dfs, curves=None):
     """
     Process all fixed loans grouped by type.
-    Input: dict of DataFrames by type_key (e.g., {"nf1": df1, "nf2": df2, ...})
-    Output: dict of DataFrames with 'total_rates' column
+    Input: dict of DataFrames by type_key (e.g., {"nf1": df1, "nf2": df2, ...}),
+           optional AssumptionCurves to express maturities on the common axis
+    Output: dict of DataFrames with fixed_rate, maturity_idx and 'total_rates' columns
     """
     fixed_results = {}
 
     for type_key, df in fixed_dfs.items():
         logging.info(f"Processing Type {type_key} fixed loans: {len(df)} loans")
-        df_with_rates = process_fixed_loans_dataframe(df, type_key)
+        df_with_rates = process_fixed_loans_dataframe(df, type_key, curves)
         fixed_results[type_key] = df_with_rates
         logging.info(f"Type {type_key} fixed loans processed successfully with total_rates column")
 
@@ -84,13 +129,10 @@ def print_fixed_calculation_summary(fixed_results):
         logging.info(f"\n=== TYPE {type_key} FIXED CALCULATIONS SUMMARY ===")
         logging.info(f"Total loans: {len(df)}")
         if not df.empty:
-            rates = [list(r.values())[0] if r else 0.0 for r in df['total_rates']]
-            avg_rate = sum(rates)/len(rates)
-            min_rate = min(rates)
-            max_rate = max(rates)
-            logging.info(f"Average rate: {avg_rate*100:.4f}%")
-            logging.info(f"Min rate: {min_rate*100:.4f}%")
-            logging.info(f"Max rate: {max_rate*100:.4f}%")
+            rates = df['fixed_rate']
+            logging.info(f"Average rate: {rates.mean()*100:.4f}%")
+            logging.info(f"Min rate: {rates.min()*100:.4f}%")
+            logging.info(f"Max rate: {rates.max()*100:.4f}%")
 
             # Show 5 sample loans
             logging.info("Sample total_rates values:")
@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
 import logging
 
+from input_data.assumption_curves import AssumptionCurves, compile_assumption_curves
+
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 def convert_margin_to_decimal(margin_value):
@@ -17,29 +20,51 @@ def convert_margin_to_decimal(margin_value):
     except:
         return 0.0
 
-def process_floating_calculations(floating_df, assumptions_dict, excel_filename=None):
+def process_floating_calculations(floating_df, curves, excel_filename=None):
+    """
+    Build total_rates for floating loans from the compiled Index Type curves.
+
+    Index rows and maturity cut-offs are resolved for all loans at once and kept as
+    integer columns (index_row, maturity_idx) on the common month-end axis.
+    total_rates = {period_date: index_rate + margin} for periods up to maturity,
+    in percentage format.
+    """
     floating_df = floating_df.copy()
-    floating_df['total_rates'] = [{} for _ in range(len(floating_df))]  # * yerine _
-    
+    if not isinstance(curves, AssumptionCurves):
+        curves = compile_assumption_curves(index_type=curves)
+
+    maturities = pd.to_datetime(floating_df['Maturity Date'], errors='coerce')
+    index_rows = curves.index_rows(floating_df['Index'])
+    maturity_idx = np.where(maturities.isna().to_numpy(), 0, curves.cut_offs(maturities))
+    margins = pd.to_numeric(floating_df['Interest Rate Margin (%)'], errors='coerce').to_numpy(dtype=float)
+
+    floating_df['index_row'] = index_rows
+    floating_df['maturity_idx'] = maturity_idx
+
     # Percentage formatında bırakıyoruz, decimal'a çevirmiyoruz
-    for index_name, group_df in floating_df.groupby('Index'):
-        index_rates = assumptions_dict.get(index_name, {})
-        if not index_rates:
-            continue
-        for i, loan in group_df.iterrows():
-            total_rates = {}
-            maturity = loan.get('Maturity Date')
-            margin = loan['Interest Rate Margin (%)']  # 2.0 (percentage)
-            
-            if pd.isna(maturity):
-                continue
-            for period_date, assumption_rate in index_rates.items():
-                if period_date <= str(maturity):
-                    # assumption_rate (-0.5095%) + margin (2%) = 1.4905%
-                    total_rates[period_date] = assumption_rate + margin
-            
-            floating_df.at[i, 'total_rates'] = total_rates
-    
+    total_rates = [{} for _ in range(len(floating_df))]
+    known = np.flatnonzero(index_rows >= 0)
+    if len(known):
+        keys = index_rows[known] * (curves.n_periods + 1) + maturity_idx[known]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_keys) + 1))
+
+        valid_periods = {}
+        for i, key in enumerate(unique_keys):
+            row, cut_off = divmod(int(key), curves.n_periods + 1)
+            if row not in valid_periods:
+                valid_periods[row] = np.flatnonzero(~np.isnan(curves.index_rates[row]))
+            periods = valid_periods[row][:np.searchsorted(valid_periods[row], cut_off)]
+            period_dates = curves.date_strings[periods].tolist()
+            base_rates = curves.index_rates[row, periods]
+
+            # assumption_rate (-0.5095%) + margin (2%) = 1.4905%
+            for pos in known[order[bounds[i]:bounds[i + 1]]]:
+                total_rates[pos] = dict(zip(period_dates, (base_rates + margins[pos]).tolist()))
+
+    floating_df['total_rates'] = total_rates
+
     if excel_filename:
         floating_df.to_excel(excel_filename, index=False)
         logging.info(f"Floating DataFrame exported to {excel_filename}")
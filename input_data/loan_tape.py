@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+
+from tools.diagnostics import get_diagnostics
+from tools.startup import register_warm_cache
+
+# Phase 1 data tape selection: keyword match on the file name, then most recently modified
+DATA_TAPE_KEYWORDS = ['data', 'datatape', 'simple', 'loan', 'example']
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+# Loans sheet of a tape, first match wins; otherwise the first sheet
+LOANS_SHEET_NAMES = ['Loans', 'loans', 'Loan', 'loan', 'Data', 'data', 'Sheet1']
+
+# Tape encodings accepted for uploaded tapes (SharePoint tapes are always xlsx)
+TAPE_FORMATS = ("xlsx", "csv", "parquet", "json")
+
+
+def read_loans_frame(file_stream):
+    """Parse the loans sheet of a tape workbook (sheet picked by LOANS_SHEET_NAMES)"""
+    file_stream.seek(0)
+    excel_file = pd.ExcelFile(file_stream)
+    available_sheets = excel_file.sheet_names
+    logging.info(f"Available sheets in loans Excel: {available_sheets}")
+
+    target_sheet = next((sheet for sheet in LOANS_SHEET_NAMES if sheet in available_sheets), None)
+    if target_sheet is None:
+        target_sheet = available_sheets[0]
+        logging.info(f"No standard sheet found, using first available sheet: {target_sheet}")
+    else:
+        logging.info(f"Found target sheet: {target_sheet}")
+
+    df = excel_file.parse(sheet_name=target_sheet, header=0)
+    logging.info(f"Successfully loaded {len(df)} rows from sheet '{target_sheet}'")
+    get_diagnostics().emit("loans_columns", columns=lambda: [str(col) for col in df.columns])
+    return df
+
+
+def detect_tape_format(data, name=None):
+    """Tape encoding from the file extension, else from the content (zip -> xlsx, PAR1 -> parquet, [ / { -> json, else csv)"""
+    extension = os.path.splitext(name or "")[1].lower().lstrip(".")
+    if extension in ("xlsx", "xls"):
+        return "xlsx"
+    if extension in TAPE_FORMATS:
+        return extension
+    head = bytes(data[:4])
+    if head.startswith(b"PK"):
+        return "xlsx"
+    if head == b"PAR1":
+        return "parquet"
+    if bytes(data[:64]).lstrip()[:1] in (b"[", b"{"):
+        return "json"
+    return "csv"
+
+
+def read_tape_bytes(data, fmt):
+    """
+    Loans frame of an uploaded tape. Text encodings carry no types, so date columns
+    (name containing 'Date') are parsed to datetimes as the Excel reader would give them.
+    """
+    if fmt == "xlsx":
+        return read_loans_frame(BytesIO(data))
+    if fmt == "csv":
+        df = pd.read_csv(BytesIO(data))
+    elif fmt == "parquet":
+        df = pd.read_parquet(BytesIO(data))
+    elif fmt == "json":
+        df = pd.read_json(BytesIO(data), orient="records", convert_dates=False)
+    else:
+        raise ValueError(f"Unknown tape format: {fmt!r} (expected one of {list(TAPE_FORMATS)})")
+
+    for col in df.columns:
+        if "date" in str(col).lower() and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce", format="mixed")
+    logging.info(f"Successfully loaded {len(df)} rows from {fmt} tape")
+    get_diagnostics().emit("loans_columns", columns=lambda: [str(col) for col in df.columns])
+    return df
+
+
+class LoanTape:
+    """
+    A selected Phase 1 data tape: its bytes, downloaded once, and the parsed loans frame,
+    parsed once on first use and shared by every consumer of the run (template
+    profiling, portfolio summary, the valuation DAG).
+
+    The frame is shared, not copied: consumers that rewrite columns work on their own
+    copy (the DAG's split stage takes a shallow copy). key is the content hash, so the
+    stage cache treats two downloads of the same tape as the same input.
+    fmt is the encoding of data: xlsx for SharePoint tapes, csv / parquet / json for uploads.
+    """
+
+    def __init__(self, data, name, modified=None, fmt="xlsx"):
+        self.data = bytes(data)
+        self.name = name
+        self.modified = modified
+        self.fmt = fmt
+        self.key = hashlib.sha256(self.data).hexdigest()
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_stream(cls, file_stream, name, modified=None):
+        file_stream.seek(0)
+        return cls(file_stream.getvalue(), name, modified)
+
+    def stream(self):
+        """A fresh BytesIO over the tape bytes"""
+        return BytesIO(self.data)
+
+    @property
+    def parsed(self):
+        return self._frame is not None
+
+    @property
+    def frame(self):
+        """Parsed loans frame (parsed on first access, then cached)"""
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = read_tape_bytes(self.data, self.fmt)
+        return self._frame
+
+    def __repr__(self):
+        return f"LoanTape({self.name!r}, {len(self.data) / 1024:.0f} KB, parsed={self.parsed})"
+
+
+def select_latest_file(items, keywords=None, extensions=EXCEL_EXTENSIONS):
+    """
+    Pick the most recently modified file from Graph DriveItem dicts, preferring names
+    that contain one of keywords (all files when none match). None when empty.
+    """
+    items = [item for item in items if item.get("name", "").lower().endswith(extensions)]
+    if keywords:
+        matching = [item for item in items if any(keyword.lower() in item["name"].lower() for keyword in keywords)]
+        if matching:
+            items = matching
+        elif items:
+            logging.warning(f"No files found matching keywords: {keywords}, using all Excel files")
+    if not items:
+        return None
+    latest = max(items, key=lambda item: item.get("lastModifiedDateTime", ""))
+    logging.info(f"Selected latest file: {latest['name']} (Modified: {latest.get('lastModifiedDateTime')})")
+    return latest
+
+
+def fetch_latest_loan_tape(session, phase="Phase 1", name=None):
+    """
+    The Phase 1 data tape (latest by the selection rule, or the file called name) as a
+    LoanTape; only that file is downloaded. None when there is none.
+    """
+    files = session.list_files(phase)
+    if name is None:
+        item = select_latest_file(files, keywords=DATA_TAPE_KEYWORDS)
+    else:
+        item = next((item for item in files if item.get("name") == name), None)
+    if item is None:
+        logging.error(f"No loans Excel file {name or ''} found in {phase}")
+        return None
+    data = session.download(phase, item["name"])
+    if data is None:
+        logging.error(f"Data tape {item['name']} disappeared from {phase}")
+        return None
+    return LoanTape(data, item["name"], item.get("lastModifiedDateTime"))
+
+
+# ---------- Warm tape cache ----------
+# Uploaded tapes by content hash, so repeated what-if runs on one tape parse it once
+_tapes = OrderedDict()
+_tapes_lock = threading.Lock()
+
+
+def tape_cache_entries():
+    """Parsed tapes kept across invocations (LPVP_TAPE_CACHE_ENTRIES, default 4, 0 disables)"""
+    return max(int(os.getenv("LPVP_TAPE_CACHE_ENTRIES", "4")), 0)
+
+
+def cached_loan_tape(data, name=None, fmt=None):
+    """
+    Parsed LoanTape for uploaded bytes: the cached one when the same content was seen
+    before. Raises (ValueError or the reader's error) when the bytes can't be parsed;
+    unreadable tapes are never cached.
+    """
+    fmt = fmt or detect_tape_format(data, name)
+    if fmt not in TAPE_FORMATS:
+        raise ValueError(f"Unknown tape format: {fmt!r} (expected one of {list(TAPE_FORMATS)})")
+    tape = LoanTape(data, name or f"uploaded_tape.{fmt}", fmt=fmt)
+    cache_key = (tape.key, fmt)
+    with _tapes_lock:
+        cached = _tapes.get(cache_key)
+        if cached is not None:
+            _tapes.move_to_end(cache_key)
+            return cached
+
+    tape.frame  # parse outside the lock
+    limit = tape_cache_entries()
+    with _tapes_lock:
+        if limit:
+            _tapes[cache_key] = tape
+        while len(_tapes) > limit:
+            _tapes.popitem(last=False)
+    return tape
+
+
+def lookup_loan_tape(cache_key):
+    """Cached LoanTape under (content key, format), or None"""
+    with _tapes_lock:
+        return _tapes.get(cache_key)
+
+
+def invalidate_loan_tapes():
+    with _tapes_lock:
+        _tapes.clear()
+
+
+register_warm_cache(
+    "loan_tapes",
+    lambda: {"entries": len(_tapes), "limit": tape_cache_entries(),
+             "parsed": sum(tape.parsed for tape in list(_tapes.values()))},
+    invalidate_loan_tapes,
+)
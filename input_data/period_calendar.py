@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# Date header format of the Phase 2 template curve tables (Assumption_Loans, Index_Analysis)
+TEMPLATE_DATE_FORMAT = '%m/%d/%Y'
+
+
+class PeriodCalendar:
+    """
+    The valuation-date-anchored month-end axis, defined once.
+
+    - dates: sorted unique datetime64[ns]; period 0 is the valuation date, then every
+      month-end after it up to the horizon
+    - periods are plain integer offsets into dates; consumers never key on date strings
+
+    Labels (template headers, ISO export keys) are formatted once per calendar and
+    cached, so hot loops index into them by period instead of calling strftime.
+
+        calendar = PeriodCalendar.from_horizon(valuation_date, max_maturity_date)
+        cut_offs = calendar.cut_offs(loans_df['Maturity Date'])  # periods on or before maturity
+    """
+
+    def __init__(self, dates):
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        if len(dates) > 1 and not (np.diff(dates) > np.timedelta64(0, "ns")).all():
+            dates = np.unique(dates)
+        self.dates = dates
+        self._labels = {}
+
+    @classmethod
+    def from_horizon(cls, valuation_date, max_maturity_date=None):
+        """
+        Valuation date followed by the month-ends strictly after it, through the month of
+        max_maturity_date. Without a horizon the calendar holds the valuation date only.
+        """
+        anchor = np.datetime64(pd.Timestamp(valuation_date).normalize(), "D")
+        first_month = anchor.astype("datetime64[M]")
+        if _month_end(first_month) <= anchor:
+            first_month += 1
+
+        month_ends = np.array([], dtype="datetime64[D]")
+        if max_maturity_date is not None and not pd.isna(max_maturity_date):
+            last_month = np.datetime64(pd.Timestamp(max_maturity_date), "M")
+            month_ends = _month_end(np.arange(first_month, last_month + 1, dtype="datetime64[M]"))
+
+        return cls(np.concatenate(([anchor], month_ends)))
+
+    @classmethod
+    def from_labels(cls, labels):
+        """Calendar of date header labels (unparseable labels dropped)"""
+        dates = parse_period_labels(labels)
+        return cls(dates[~np.isnat(dates)])
+
+    # ---------- Axis ----------
+    @property
+    def n_periods(self):
+        return len(self.dates)
+
+    def __len__(self):
+        return self.n_periods
+
+    @property
+    def valuation_date(self):
+        return pd.Timestamp(self.dates[0]) if self.n_periods else None
+
+    def timestamps(self):
+        return [pd.Timestamp(date) for date in self.dates]
+
+    def period_of(self, dates):
+        """Period index of each date that is on the axis, -1 otherwise"""
+        dates = _as_datetime64(dates)
+        positions = np.searchsorted(self.dates, dates, side="left")
+        found = positions < self.n_periods
+        found[found] = self.dates[positions[found]] == dates[found]
+        return np.where(found, positions, -1)
+
+    def cut_offs(self, maturities):
+        """
+        Number of axis periods on or before each maturity (one searchsorted call).
+        Missing maturities keep the whole axis.
+        """
+        maturities = _as_datetime64(maturities)
+        cut_offs = np.searchsorted(self.dates, maturities, side="right")
+        cut_offs[np.isnat(maturities)] = self.n_periods
+        return cut_offs
+
+    # ---------- Labels ----------
+    def labels(self, date_format=None):
+        """Axis labels, formatted once: ISO ('YYYY-MM-DD') by default, or with strftime date_format"""
+        if date_format not in self._labels:
+            if date_format is None:
+                self._labels[None] = np.datetime_as_string(self.dates, unit="D")
+            else:
+                self._labels[date_format] = pd.DatetimeIndex(self.dates).strftime(date_format).to_numpy(dtype=object)
+        return self._labels[date_format]
+
+    @property
+    def iso_labels(self):
+        return self.labels()
+
+    @property
+    def template_labels(self):
+        return self.labels(TEMPLATE_DATE_FORMAT)
+
+    def __repr__(self):
+        if not self.n_periods:
+            return "PeriodCalendar(empty)"
+        return f"PeriodCalendar({self.n_periods} periods, {self.iso_labels[0]} .. {self.iso_labels[-1]})"
+
+
+def iso_dates(values):
+    """'YYYY-MM-DD' labels for datetimes in one vectorized call ('NaT' where missing)"""
+    return np.datetime_as_string(_as_datetime64(values), unit="D")
+
+
+def parse_period_labels(labels):
+    """
+    Parse date header labels to datetime64[ns] (NaT where unparseable). Template headers
+    ('%m/%d/%Y') go through the fixed format; anything else (datetime cells, ISO strings)
+    falls back to mixed-format parsing.
+    """
+    labels = pd.Series([str(label).strip() for label in labels], dtype=object)
+    dates = pd.to_datetime(labels, format=TEMPLATE_DATE_FORMAT, errors="coerce")
+    missing = dates.isna()
+    if missing.any():
+        dates[missing] = pd.to_datetime(labels[missing], errors="coerce", format="mixed")
+    return dates.dt.normalize().to_numpy(dtype="datetime64[ns]")
+
+
+def _month_end(months):
+    return (months + 1).astype("datetime64[D]") - 1
+
+
+def _as_datetime64(values):
+    if isinstance(values, np.ndarray) and values.dtype == "datetime64[ns]":
+        return values
+    return pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[ns]")
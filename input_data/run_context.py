@@ -0,0 +1,54 @@
+import pandas as pd
+
+# Summary scalars that apply to every loan of a run (get_fixed_summary_assumptions fields)
+RUN_CONTEXT_FIELDS = [
+    'val_date', 'output_currency', 'global_tax_flag', 'global_tax', 'cor_spread',
+    'dr_sensitivity_var', 'dr_sensitivity_range', 'cr_sensitivity_var', 'cr_sensitivity_range',
+]
+
+
+class RunContext:
+    """
+    Run-level assumption scalars, held once per run instead of broadcast as per-row
+    columns through the pipeline. The Phase 3 export writes them to a Run_Context sheet;
+    calculations.manage_calculations still takes them as columns (broadcast()).
+    """
+
+    def __init__(self, values):
+        self._values = dict(values)
+
+    @classmethod
+    def from_summary(cls, summary: dict):
+        return cls({field: summary.get(field) for field in RUN_CONTEXT_FIELDS})
+
+    @classmethod
+    def from_summary_df(cls, summary_df: pd.DataFrame):
+        return cls.from_summary(summary_df.iloc[0].to_dict())
+
+    def __getitem__(self, field):
+        return self._values[field]
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        try:
+            return self._values[field]
+        except KeyError:
+            raise AttributeError(field) from None
+
+    def get(self, field, default=None):
+        return self._values.get(field, default)
+
+    def as_dict(self):
+        return dict(self._values)
+
+    def broadcast(self, df):
+        """df with every field as a per-row column: the frame layout manage_calculations reads"""
+        return df.assign(**self._values)
+
+    def to_frame(self):
+        """Two-column Field / Value frame for the Phase 3 header sheet"""
+        return pd.DataFrame({'Field': list(self._values), 'Value': list(self._values.values())})
+
+    def __repr__(self):
+        return f"RunContext({self._values!r})"
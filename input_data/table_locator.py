@@ -0,0 +1,53 @@
+import pandas as pd
+import numpy as np
+
+
+def locate_table_blocks(df_sheet: pd.DataFrame):
+    """
+    Find every block of consecutive non-empty rows in a raw sheet (header=None).
+    The empty-row mask is computed once and block edges come from np.diff.
+
+    Returns:
+        (starts, ends): int arrays, block i spans rows starts[i]:ends[i]
+    """
+    non_empty = df_sheet.notna().any(axis=1).to_numpy()
+    edges = np.diff(np.concatenate(([0], non_empty.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class SheetTableIndex:
+    """
+    One-pass index of the labelled tables on a sheet.
+
+    Column A labels are stripped once and mapped to their first row; a table named
+    in column A runs from its label row to the end of the non-empty block holding it.
+    """
+
+    def __init__(self, df_sheet: pd.DataFrame):
+        self.df_sheet = df_sheet
+        self.starts, self.ends = locate_table_blocks(df_sheet)
+
+        self.labels = {}
+        if df_sheet.shape[1]:
+            column_a = df_sheet.iloc[:, 0]
+            labelled = column_a.notna().to_numpy()
+            labels = column_a[labelled].astype(str).str.strip()
+            first = ~labels.duplicated().to_numpy()
+            self.labels = dict(zip(labels[first], np.flatnonzero(labelled)[first]))
+
+    def blocks(self):
+        """All non-empty row blocks as (start, end) pairs"""
+        return list(zip(self.starts.tolist(), self.ends.tolist()))
+
+    def find(self, table_name: str):
+        """
+        Locate a labelled table.
+
+        Returns:
+            (header_row, end) or None: the header is the label row, data is header_row + 1:end
+        """
+        header_row = self.labels.get(table_name)
+        if header_row is None:
+            return None
+        block = np.searchsorted(self.starts, header_row, side="right") - 1
+        return int(header_row), int(self.ends[block])
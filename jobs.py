@@ -0,0 +1,231 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.job_store import get_job_store, now_iso, QUEUED, RUNNING, SUCCEEDED, FAILED, FINAL_STATES
+
+# -------------------------------
+# Background jobs: submit a run, poll its status
+# -------------------------------
+# kind -> what the job runs
+#   valuation: Phase 1 tape + Phase 2 assumptions -> Phase 3 (loan_input.run_phase3_processing)
+#   cycle:     template update + valuation on one tape (orchestrator.run_full_cycle)
+#   batch:     valuation or cycle of many project roots at once (batch.run_batch)
+JOB_KINDS = ("valuation", "cycle", "batch")
+
+# Options a submission may carry, with their types
+JOB_OPTIONS = {
+    "tape": str,            # Phase 1 file name; default the latest data tape
+    "assumptions": str,     # Phase 2 file name (valuation only); default the latest assumptions workbook
+    "format": str,          # Phase 3 writer: xlsx / parquet / csv
+    "profile": bool,
+    "diagnostics": str,
+    "template": bool,       # cycle only: run the template step (default on)
+    "incremental": bool,    # cycle only: update the existing template (default on)
+    "projects": list,       # batch only: project base paths (required)
+    "mode": str,            # batch only: valuation / cycle per project (default valuation)
+}
+
+# Summary statuses of the runners that count as a succeeded job
+SUCCESS_STATUSES = ("success", "awaiting_assumptions")
+
+_executor = None
+_executor_lock = threading.Lock()
+_active = set()
+_worker = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def job_workers():
+    """Jobs run at the same time in this process (LPVP_JOB_WORKERS, default 2); the rest queue"""
+    try:
+        return max(int(os.getenv("LPVP_JOB_WORKERS", 2)), 1)
+    except ValueError:
+        logging.warning(f"Ignoring LPVP_JOB_WORKERS={os.getenv('LPVP_JOB_WORKERS')!r}: not an integer, using 2")
+        return 2
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=job_workers(), thread_name_prefix="lpvp-job")
+    return _executor
+
+
+def parse_job_options(kind, options=None):
+    """Validated options of a submission; raises ValueError on anything unknown or mistyped"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind!r} (expected one of {list(JOB_KINDS)})")
+    options = dict(options or {})
+    unknown = sorted(set(options) - set(JOB_OPTIONS))
+    if unknown:
+        raise ValueError(f"Unknown job options: {unknown} (expected some of {sorted(JOB_OPTIONS)})")
+
+    parsed = {}
+    for name, value in options.items():
+        if value is None:
+            continue
+        if JOB_OPTIONS[name] is bool and isinstance(value, str):
+            value = value.strip().lower() not in ("0", "false", "no", "off", "")
+        if not isinstance(value, JOB_OPTIONS[name]):
+            raise ValueError(f"Job option {name} must be {JOB_OPTIONS[name].__name__}, got {value!r}")
+        parsed[name] = value
+    if kind == "batch":
+        from batch import BATCH_MODES
+        if not parsed.get("projects"):
+            raise ValueError("Batch jobs need options.projects: a list of project base paths")
+        if parsed.get("mode", "valuation") not in BATCH_MODES:
+            raise ValueError(f"Unknown batch mode: {parsed['mode']!r} (expected one of {list(BATCH_MODES)})")
+    return parsed
+
+
+def submit_job(kind="valuation", options=None, store=None):
+    """
+    Record a job as queued and start it in the background. Returns the job record;
+    poll it with get_job(job_id). Raises ValueError on bad options.
+    """
+    store = store or get_job_store()
+    options = parse_job_options(kind, options)
+    job_id = uuid.uuid4().hex[:16]
+    # Active before the record exists, so a get_job() racing with create never finds it orphaned
+    _active.add(job_id)
+    try:
+        job = store.create({
+            "job_id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "options": options,
+            "worker": _worker,
+            "submitted_at": now_iso(),
+            "started_at": None,
+            "finished_at": None,
+            "step": None,
+            "current_stage": None,
+            "stages": {},
+            "result": None,
+            "error": None,
+        })
+    except BaseException:
+        _active.discard(job_id)
+        raise
+    try:
+        _get_executor().submit(_run_job, job_id, kind, options, store)
+    except RuntimeError as e:  # executor shut down with the host
+        _active.discard(job_id)
+        job = store.update(job_id, status=FAILED, error=f"Could not start job: {e}", finished_at=now_iso())
+    logging.info(f"Job {job_id} ({kind}) queued with options {options}")
+    return job
+
+
+def get_job(job_id, store=None):
+    """
+    The job record, or None. A job left queued/running by a process of this host that
+    no longer exists (host restart) is marked failed instead of staying "running" forever.
+    """
+    store = store or get_job_store()
+    job = store.get(job_id)
+    if job is not None and job["status"] not in FINAL_STATES and _orphaned(job):
+        job = store.update(job_id, status=FAILED, error="Interrupted: the process running the job stopped",
+                           finished_at=now_iso())
+    return job
+
+
+def list_jobs(limit=50, store=None):
+    return (store or get_job_store()).list(limit)
+
+
+def _orphaned(job):
+    host, _, pid = job.get("worker", "").rpartition(":")
+    if job.get("worker") == _worker:
+        return job["job_id"] not in _active
+    if host != socket.gethostname() or not pid.isdigit():
+        return False  # another instance's job: only it can tell
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def _stage_listener(store, job_id):
+    """RunReport listener publishing per-stage progress into the job record"""
+    def listener(event, record):
+        def mutate(job):
+            stage = job["stages"].setdefault(record.name, {})
+            stage["status"] = "running" if event == "started" else record.status
+            if event != "started":
+                stage["wall_seconds"] = record.wall_seconds
+                stage["rows_out"] = record.rows_out
+                if job.get("current_stage") == record.name:
+                    job["current_stage"] = None
+            else:
+                job["current_stage"] = record.name
+        store.update(job_id, mutate=mutate)
+    return listener
+
+
+def _run_job(job_id, kind, options, store):
+    from tools.instrumentation import RunReport
+
+    store.update(job_id, status=RUNNING, started_at=now_iso())
+    run_report = RunReport(run_id=job_id, job_kind=kind)
+    run_report.add_listener(_stage_listener(store, job_id))
+
+    def progress(step):
+        store.update(job_id, step=step)
+
+    try:
+        result = _execute(kind, options, run_report, progress)
+        status = SUCCEEDED if result.get("status") in SUCCESS_STATUSES else FAILED
+        store.update(job_id, status=status, result=result, error=result.get("error"),
+                     run_report=run_report.path, step=None, finished_at=now_iso())
+        logging.info(f"Job {job_id} {status}")
+    except Exception as e:
+        logging.error(f"Job {job_id} failed: {e}", exc_info=True)
+        store.update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", run_report=run_report.path,
+                     finished_at=now_iso())
+    finally:
+        _active.discard(job_id)
+
+
+def _execute(kind, options, run_report, progress):
+    from tools.sharepoint import get_session
+    from input_data.loan_tape import fetch_latest_loan_tape
+
+    if kind == "batch":
+        # Each project writes its own run report; the job tracks projects done
+        from batch import run_batch
+        return run_batch(options["projects"], mode=options.get("mode", "valuation"),
+                         diagnostics=options.get("diagnostics"), output_format=options.get("format"),
+                         template=options.get("template", True), incremental=options.get("incremental", True),
+                         progress=progress)
+
+    session = get_session()
+    tape = None
+    if options.get("tape"):
+        tape = fetch_latest_loan_tape(session, name=options["tape"])
+        if tape is None:
+            return {"status": "failed", "error": f"Data tape {options['tape']} not found in Phase 1"}
+
+    if kind == "cycle":
+        from orchestrator import run_full_cycle
+        return run_full_cycle(template=options.get("template", True), incremental=options.get("incremental", True),
+                              profile=options.get("profile"), diagnostics=options.get("diagnostics"),
+                              output_format=options.get("format"), session=session, tape=tape,
+                              run_report=run_report, progress=progress)
+
+    from loan_input import run_phase3_processing, fetch_latest_assumptions
+    assumptions = None
+    if options.get("assumptions"):
+        assumptions = fetch_latest_assumptions(session, name=options["assumptions"])
+        if assumptions[0] is None:
+            return {"status": "failed", "error": f"Assumptions file {options['assumptions']} not found in Phase 2"}
+    return run_phase3_processing(profile=options.get("profile"), diagnostics=options.get("diagnostics"),
+                                 output_format=options.get("format"), session=session, tape=tape,
+                                 assumptions=assumptions, run_report=run_report, progress=progress)
@@ -2,20 +2,35 @@ import pandas as pd
 import logging
 import sys
 import os
+import tempfile
 from io import BytesIO
 from datetime import datetime
 
 # SharePoint ETL functions import
-from tools.sharepoint import load_env_vars, get_access_token, get_site_id, download_file
+from tools.sharepoint import get_session
 
 # Custom modules
-from input_data.datatape_segmentation import process_loans_dataframe_segmentation
+from input_data.datatape_segmentation import (
+    process_loans_dataframe_segmentation, split_performing_npl, segment_npls, segment_performing,
+    assemble_segmentation,
+)
 from input_data.index_rate_calculation import process_floating_calculations
 from input_data.fixed_rate_calculation import process_fixed_calculations
-from input_data.combined_risk import assign_combined_risk_rates
+from input_data.combined_risk import assign_combined_risk_rates, assign_type_risk_rates
 from input_data.fixed_dfs import enrich_loans_with_fixed_assumptions_parallel
 from input_data.assumption_tables import load_assumptions_excel_to_dict_from_stream
-from calculations import manage_calculations
+from input_data.compiled_assumptions import (
+    CompiledAssumptions, load_compiled_assumptions, workbook_key, artifact_filename, default_cache_dir,
+    fetch_compiled_assumptions, upload_compiled_assumptions,
+)
+from input_data.loan_tape import LoanTape, read_loans_frame, select_latest_file, fetch_latest_loan_tape
+from tools.process_pool import acquire_type_stage_pool, release_type_stage_pool, process_pool_workers
+from tools.executor_budget import get_executor_budget
+from tools.stage_dag import Stage, StageDAG, Uncacheable, get_stage_cache
+from tools.instrumentation import RunReport, default_report_dir
+from tools.profiling import RunProfiler, profiling_requested, profiling_active
+from tools.diagnostics import get_diagnostics, diagnostics_scope
+from output_data.phase3_writers import get_result_writer, content_type
 
 # -------------------------------
 # Logging setup
@@ -29,122 +44,10 @@ logging.basicConfig(
 # -------------------------------
 # SharePoint Integration Functions
 # -------------------------------
-def download_files_from_sharepoint(folder_path):
-    """Download files from specified SharePoint folder with metadata"""
-    try:
-        logging.info(f"Connecting to SharePoint and downloading files from: {folder_path}")
-        
-        # Get SharePoint connection
-        env_vars = load_env_vars()
-        access_token = get_access_token(env_vars)
-        site_id = get_site_id(access_token, env_vars['site_name'])
-        
-        # Build full folder path
-        full_folder_path = f"{env_vars['base_path']}/{folder_path}"
-        
-        # Get folder items with metadata using Graph API
-        import requests
-        
-        folder_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{full_folder_path}:/children"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        
-        response = requests.get(folder_url, headers=headers)
-        response.raise_for_status()
-        items = response.json().get('value', [])
-        
-        # Filter Excel files and get their metadata
-        excel_files_info = []
-        for item in items:
-            if item['name'].lower().endswith(('.xlsx', '.xls')):
-                excel_files_info.append({
-                    'name': item['name'],
-                    'id': item['id'],
-                    'last_modified': item['lastModifiedDateTime'],
-                    'size': item['size']
-                })
-        
-        logging.info(f"Found {len(excel_files_info)} Excel files in {folder_path}")
-        for file_info in excel_files_info:
-            logging.info(f"  - {file_info['name']} (Modified: {file_info['last_modified']})")
-        
-        # Download all Excel files
-        downloaded_files = []
-        for file_info in excel_files_info:
-            file_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{file_info['id']}/content"
-            file_response = requests.get(file_url, headers=headers)
-            file_response.raise_for_status()
-            
-            file_stream = BytesIO(file_response.content)
-            downloaded_files.append((file_stream, file_info['name'], file_info['last_modified']))
-        
-        logging.info(f"Downloaded {len(downloaded_files)} Excel files with metadata")
-        return downloaded_files
-        
-    except Exception as e:
-        logging.error(f"Error downloading files from SharePoint: {str(e)}")
-        return []
-
-def find_latest_excel_file(downloaded_files_with_metadata, keywords=None):
-    """Find the most recently modified Excel file, optionally filtering by keywords"""
-    if not downloaded_files_with_metadata:
-        return None, None
-    
-    # Filter by keywords if provided
-    if keywords:
-        filtered_files = []
-        for file_stream, filename, modified_date in downloaded_files_with_metadata:
-            filename_lower = filename.lower()
-            if any(keyword.lower() in filename_lower for keyword in keywords):
-                filtered_files.append((file_stream, filename, modified_date))
-        
-        if filtered_files:
-            downloaded_files_with_metadata = filtered_files
-            logging.info(f"Filtered to {len(filtered_files)} files matching keywords: {keywords}")
-        else:
-            logging.warning(f"No files found matching keywords: {keywords}, using all Excel files")
-    
-    # Sort by modification date (most recent first)
-    sorted_files = sorted(downloaded_files_with_metadata, 
-                         key=lambda x: x[2], 
-                         reverse=True)
-    
-    latest_file = sorted_files[0]
-    file_stream, filename, modified_date = latest_file
-    
-    logging.info(f"Selected latest file: {filename} (Modified: {modified_date})")
-    
-    return file_stream, filename
-
 def load_loans_excel_from_stream(file_stream):
     """Load loans dataframe directly from BytesIO stream"""
     try:
-        file_stream.seek(0)
-        
-        # Check what sheets are available
-        excel_file = pd.ExcelFile(file_stream)
-        available_sheets = excel_file.sheet_names
-        logging.info(f"Available sheets in loans Excel: {available_sheets}")
-        
-        # Try different possible sheet names
-        possible_sheet_names = ['Loans', 'loans', 'Loan', 'loan', 'Data', 'data', 'Sheet1']
-        
-        target_sheet = None
-        for sheet in possible_sheet_names:
-            if sheet in available_sheets:
-                target_sheet = sheet
-                logging.info(f"Found target sheet: {target_sheet}")
-                break
-        
-        # If no common sheet name found, use the first available sheet
-        if target_sheet is None:
-            target_sheet = available_sheets[0]
-            logging.info(f"No standard sheet found, using first available sheet: {target_sheet}")
-        
-        df = pd.read_excel(file_stream, sheet_name=target_sheet, header=0)
-        logging.info(f"Successfully loaded {len(df)} rows from sheet '{target_sheet}'")
-        logging.info(f"Columns found: {list(df.columns)}")
-        
-        return df
+        return read_loans_frame(file_stream)
         
     except Exception as e:
         logging.error(f"Error loading loans DataFrame from stream: {str(e)}")
@@ -182,250 +85,334 @@ def load_assumptions_excel_from_stream(file_stream):
         logging.error(f"Error loading assumptions from stream: {str(e)}")
         return None
 
-def get_excel_streams_from_sharepoint():
+def load_compiled_assumptions_from_stream(file_stream):
+    """Load compiled assumptions (curves, rates/fees, FX/tax, summary) for an assumptions BytesIO stream.
+    Uses the local artifact cache keyed by workbook hash, compiling only on a cache miss."""
+    try:
+        logging.info("Loading compiled assumptions from BytesIO stream")
+        file_stream.seek(0)
+        compiled = load_compiled_assumptions(file_stream.getvalue())
+        logging.info("Compiled assumptions ready")
+        return compiled
+
+    except Exception as e:
+        logging.error(f"Error compiling assumptions from stream: {str(e)}")
+        return None
+
+def share_compiled_assumptions_enabled():
+    """Opt-in: keep the compiled assumptions artifact next to the template in Phase 2"""
+    return os.getenv("LPVP_SHARE_COMPILED_ASSUMPTIONS", "").lower() in ("1", "true", "yes")
+
+def prefetch_compiled_assumptions(assumptions_stream, session=None):
+    """Pull the compiled assumptions artifact from Phase 2 into the local cache if it is missing locally"""
+    try:
+        key = workbook_key(assumptions_stream.getvalue())
+        if os.path.exists(os.path.join(default_cache_dir(), artifact_filename(key))):
+            return
+        session = session or get_session()
+        path = fetch_compiled_assumptions(key, session.access_token, session.site_id, session.folder("Phase 2"))
+        if path:
+            logging.info(f"Fetched compiled assumptions artifact from Phase 2: {os.path.basename(path)}")
+    except Exception as e:
+        logging.warning(f"Could not prefetch compiled assumptions artifact: {e}")
+
+def publish_compiled_assumptions(compiled_assumptions, session=None):
+    """Upload the compiled assumptions artifact next to the template in Phase 2"""
+    try:
+        session = session or get_session()
+        upload_compiled_assumptions(compiled_assumptions, session.access_token, session.site_id, session.folder("Phase 2"))
+        logging.info("Compiled assumptions artifact uploaded to Phase 2")
+    except Exception as e:
+        logging.warning(f"Could not upload compiled assumptions artifact: {e}")
+
+ASSUMPTIONS_KEYWORDS = ['assumption', 'template', 'complex']
+
+def fetch_latest_assumptions(session, phase="Phase 2", name=None):
+    """Latest assumptions workbook of Phase 2 (or the one called name) as (BytesIO, name); only that file is downloaded"""
+    if name is None:
+        item = select_latest_file(session.list_files(phase), keywords=ASSUMPTIONS_KEYWORDS)
+        if item is None:
+            logging.error(f"No assumptions Excel file found in {phase}")
+            return None, None
+        name = item["name"]
+    data = session.download(phase, name)
+    if data is None:
+        logging.error(f"Assumptions file {name} not found in {phase}")
+        return None, None
+    return BytesIO(data), name
+
+def get_excel_streams_from_sharepoint(session=None):
     """Download and return BytesIO streams directly from SharePoint Phase 1 and Phase 2"""
+    session = session or get_session()
     
-    # Download from Phase 1 (Loans data) - get latest file
+    # Phase 1 (Loans data) - latest data tape
     logging.info("Downloading loans data from Phase 1...")
-    phase1_files = download_files_from_sharepoint("Phase 1")
-    
-    # Find latest loans Excel file (with optional keyword filtering)
-    loans_stream, loans_filename = find_latest_excel_file(
-        phase1_files, 
-        keywords=['data', 'datatape', 'simple', 'loan', 'example']  # Optional filtering
-    )
-    
-    if not loans_stream:
-        logging.error("No loans Excel file found in Phase 1")
+    tape = fetch_latest_loan_tape(session)
+    if tape is None:
         return None, None, None, None
     
-    # Download from Phase 2 (Assumptions data) - get latest file
+    # Phase 2 (Assumptions data) - latest file
     logging.info("Downloading assumptions data from Phase 2...")
-    phase2_files = download_files_from_sharepoint("Phase 2")
-    
-    # Find latest assumptions Excel file (with optional keyword filtering)
-    assumptions_stream, assumptions_filename = find_latest_excel_file(
-        phase2_files,
-        keywords=['assumption', 'template', 'complex']  # Optional filtering
-    )
-    
+    assumptions_stream, assumptions_filename = fetch_latest_assumptions(session)
     if not assumptions_stream:
-        logging.error("No assumptions Excel file found in Phase 2")
         return None, None, None, None
     
     logging.info(f"Successfully prepared latest streams:")
-    logging.info(f"  Loans: {loans_filename} (latest from Phase 1)")
+    logging.info(f"  Loans: {tape.name} (latest from Phase 1)")
     logging.info(f"  Assumptions: {assumptions_filename} (latest from Phase 2)")
     
-    return loans_stream, assumptions_stream, loans_filename, assumptions_filename
-
-def main_processing_pipeline_from_streams(loans_stream, assumptions_stream, loans_filename):
-    """Modified main processing pipeline to work with BytesIO streams"""
-    logging.info("Starting main processing pipeline from streams")
-
-    # Load loans from stream
-    loans_df = load_loans_excel_from_stream(loans_stream)
-    if loans_df is None:
-        logging.error("Failed to load loans data from stream")
-        return None, None, None
-
-    # Load assumptions from stream
-    assumptions_dicts = load_assumptions_excel_from_stream(assumptions_stream)
-    if not assumptions_dicts:
-        logging.error("Failed to load assumptions data from stream")
-        return None, None, None
-
-    # Debug: Check loaded assumptions data
-    logging.info("=== ASSUMPTIONS DEBUG ===")
-    for sheet_name, tables in assumptions_dicts.items():
-        logging.info(f"Sheet '{sheet_name}':")
-        for table_name, table_data in tables.items():
-            if isinstance(table_data, dict):
-                logging.info(f"  Table '{table_name}': {len(table_data)} loan types")
-                if table_data:
-                    sample_loan_type = next(iter(table_data.keys()))
-                    sample_dates = list(table_data[sample_loan_type].keys()) if table_data[sample_loan_type] else []
-                    logging.info(f"    Sample loan type: '{sample_loan_type}'")
-                    logging.info(f"    Sample dates: {sample_dates[:5]}")  # First 5 dates
-                else:
-                    logging.warning(f"    Table '{table_name}' is EMPTY!")
-            else:
-                logging.warning(f"  Table '{table_name}': Unexpected data type {type(table_data)}")
-    logging.info("=== END ASSUMPTIONS DEBUG ===")
-
-    # For segmentation, we need to pass the filename (not full path)
-    try:
-        # Segment loans
-        logging.info("Segmenting loans dataframe...")
-        segmented_results = process_loans_dataframe_segmentation(loans_df, loans_filename)
+    return tape.stream(), assumptions_stream, tape.name, assumptions_filename
+
+def main_processing_pipeline_from_streams(loans_stream, assumptions_stream, loans_filename, rerun=(),
+                                          run_report=None, diagnostics=None):
+    """Modified main processing pipeline to work with BytesIO streams.
+    loans_stream may also be a LoanTape, whose parsed frame is reused when already parsed,
+    and assumptions_stream a CompiledAssumptions (e.g. a what-if variant with overrides).
+    Each run holds one slot of the process-wide executor budget; raises BudgetExhausted
+    when the host is saturated and the budget's wait queue is full.
+    rerun: stage names to recompute even when the stage cache holds their outputs.
+    run_report: RunReport to fill; one is created otherwise. The JSON report (per-stage
+    wall/CPU time, rows in/out, memory) is written to LPVP_RUN_REPORT_DIR after the run.
+    diagnostics: per-run diagnostics level ('debug', 'info', 'off'); default LPVP_DIAGNOSTICS."""
+    budget = get_executor_budget()
+    run_report = run_report or RunReport(loans_filename=loans_filename)
+    with budget.slots(1), diagnostics_scope(level=diagnostics, run_id=run_report.run_id) as diag:
+        try:
+            return _run_processing_pipeline(loans_stream, assumptions_stream, loans_filename, rerun, run_report)
+        finally:
+            budget.log_stats()
+            run_report.meta["executor_budget"] = budget.stats()
+            run_report.meta["diagnostics_events"] = diag.emitted
+            try:
+                run_report.write()
+            except OSError as e:
+                logging.warning(f"Could not write run report: {e}")
+
+def build_pipeline_dag(pool=None):
+    """
+    The processing pipeline as a stage DAG:
+
+        load_loans -> split_pl_npl -> segment_npls ------------------------------+
+                                   -> segment_performing -> floating -+          |
+                                                         -> fixed ----+-> combine -> risk -> enrichment
+                                                                                 +-> segmentation
+    Floating and fixed curve construction and NPL splitting are independent and overlap.
+    """
+    def load_loans(loan_tape):
+        # Parsed once per LoanTape: a tape already parsed for the template or the summary is reused
+        try:
+            return loan_tape.frame
+        except Exception as e:
+            raise ValueError(f"Failed to load loans data from stream: {e}") from e
 
-        # Process floating loans
-        floating_results = process_floating_loans(segmented_results, assumptions_dicts["Index_Analysis"]["Index_Type"])
+    def split_pl_npl(loans_df):
+        # Shallow copy: segmentation strips/rewrites columns, the loaded tape stays untouched
+        pl_dataset, npl_dataset = split_performing_npl(loans_df.copy(deep=False))
+        return pl_dataset, npl_dataset, len(loans_df), len(npl_dataset)
 
-        # Process fixed loans
-        fixed_results = process_fixed_loans(segmented_results)
+    def floating(performing_loans, assumption_curves):
+        return process_floating_loans({"performing_loans": performing_loans}, assumption_curves, pool=pool)
 
-        # Combine floating + fixed
-        combined_loans = combine_floating_fixed(floating_results, fixed_results)
+    def fixed(performing_loans, assumption_curves):
+        return process_fixed_loans({"performing_loans": performing_loans}, assumption_curves, pool=pool)
 
-        # Assign combined risk rates
-        logging.info("Assigning combined risk rates...")
-        combined_with_risks = assign_combined_risk_rates(
-            combined_loans,
-            assumptions_dicts["Assumption_Loans"]["Cost_Risk"],
-            assumptions_dicts["Assumption_Loans"]["Prepayment_Risk"],
-        )
+    def risk(combined_loans, assumption_curves):
+        if pool is not None:
+            return pool.map_types(assign_type_risk_rates, combined_loans)
+        return assign_combined_risk_rates(combined_loans, assumption_curves)
 
-        # For the fixed assumptions enrichment, we might need to create a temporary file
-        # since that function might expect a file path
-        logging.info("Enriching loans with fixed assumptions...")
+    def enrichment(combined_with_risks, compiled_assumptions):
         try:
-            # Create temporary file just for this function if it needs file path
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as temp_file:
-                assumptions_stream.seek(0)
-                temp_file.write(assumptions_stream.read())
-                temp_assumptions_path = temp_file.name
-            
             combined_with_fixed = enrich_loans_with_fixed_assumptions_parallel(
-                combined_with_risks, temp_assumptions_path, debug_percentage=True, fix_percentage=True
+                combined_with_risks, compiled_assumptions, fix_percentage=True,
+                pool=pool
             )
-            
-            # Clean up temporary file
-            os.unlink(temp_assumptions_path)
-            
             logging.info("Fixed assumptions enrichment completed")
+            return combined_with_fixed
         except Exception as e:
             logging.error(f"enrich_loans_with_fixed_assumptions_parallel failed: {e}", exc_info=True)
-            combined_with_fixed = combined_with_risks  # Use without fixed enrichment
+            # Use without fixed enrichment for this run only: the next run retries it
+            return Uncacheable(combined_with_risks)
+
+    return StageDAG([
+        Stage("load_loans", load_loans, ["loan_tape"], ["loans_df"]),
+        Stage("split_pl_npl", split_pl_npl, ["loans_df"], ["pl_dataset", "npl_dataset", "total_loans", "npl_count"]),
+        Stage("segment_npls", segment_npls, ["npl_dataset", "loans_filename"], ["npl_with_guarantees", "npl_without_guarantees"]),
+        Stage("segment_performing", segment_performing, ["pl_dataset", "loans_filename"],
+              ["performing_loans", "problematic_loans", "performing_count"]),
+        Stage("segmentation", assemble_segmentation,
+              ["total_loans", "performing_loans", "problematic_loans", "performing_count",
+               "npl_with_guarantees", "npl_without_guarantees", "npl_count"],
+              ["segmented_results"]),
+        Stage("floating", floating, ["performing_loans", "assumption_curves"], ["floating_results"]),
+        Stage("fixed", fixed, ["performing_loans", "assumption_curves"], ["fixed_results"]),
+        Stage("combine", combine_floating_fixed, ["floating_results", "fixed_results"], ["combined_loans"]),
+        Stage("risk", risk, ["combined_loans", "assumption_curves"], ["combined_with_risks"]),
+        Stage("enrichment", enrichment, ["combined_with_risks", "compiled_assumptions"], ["combined_with_fixed"]),
+    ])
+
+def _run_processing_pipeline(loans_stream, assumptions_stream, loans_filename, rerun=(), run_report=None):
+    logging.info("Starting main processing pipeline from streams")
+    run_report = run_report or RunReport(loans_filename=loans_filename)
+
+    # Load compiled assumptions from stream (artifact cache keyed by workbook hash),
+    # unless the caller already holds them (what-if runs)
+    with run_report.stage("load_assumptions"):
+        if isinstance(assumptions_stream, CompiledAssumptions):
+            compiled_assumptions = assumptions_stream
+        else:
+            compiled_assumptions = load_compiled_assumptions_from_stream(assumptions_stream)
+    if compiled_assumptions is None:
+        logging.error("Failed to load assumptions data from stream")
+        return None, None, None
+    assumption_curves = compiled_assumptions.curves
+
+    # Debug: Check compiled assumptions data
+    logging.info(f"Assumption curves: {assumption_curves.summary()}")
+    if not assumption_curves.loan_types:
+        logging.warning("Cost of Risk / Prepayment Risk tables are EMPTY!")
+    if not assumption_curves.indices:
+        logging.warning("Index Type table is EMPTY!")
+
+    # Optional process pool for the type-partitioned stages (LPVP_PROCESS_POOL_WORKERS),
+    # kept warm between runs on the same assumptions
+    pool = None
+    pool_healthy = False
+    workers = process_pool_workers()
+
+    # For segmentation, we need to pass the filename (not full path)
+    try:
+        if workers:
+            pool = acquire_type_stage_pool(assumption_curves, compiled_assumptions.key, max_workers=workers)
+
+        loan_tape = loans_stream if isinstance(loans_stream, LoanTape) else LoanTape.from_stream(loans_stream, loans_filename)
+        seeds = {
+            "loan_tape": loan_tape,
+            "loans_filename": loans_filename,
+            "compiled_assumptions": compiled_assumptions,
+            "assumption_curves": assumption_curves,
+        }
+        # The compiled assumptions key already fingerprints the workbook content
+        fingerprints = {"assumption_curves": f"{compiled_assumptions.key}:curves"}
+
+        # Profilers only see the thread they run on: keep stages inline while one is capturing
+        dag_run = build_pipeline_dag(pool).run(
+            seeds, fingerprints=fingerprints, rerun=rerun, cache=get_stage_cache(), report=run_report,
+            max_parallel=1 if profiling_active() else None,
+        )
+        run_report.meta["dag"] = dag_run.summary()
+        run_report.meta["process_pool_workers"] = pool.max_workers if pool is not None else 0
 
         logging.info("Main processing pipeline completed successfully")
-        return combined_with_fixed, assumptions_dicts, segmented_results
+        pool_healthy = True
+        return dag_run["combined_with_fixed"], compiled_assumptions, dag_run["segmented_results"]
         
     except Exception as e:
         logging.error(f"Error in main processing pipeline: {str(e)}", exc_info=True)
         return None, None, None
 
-def save_results_to_phase3(combined_with_fixed, loans_filename):
-    """Save processing results to Phase 3 as Excel"""
+    finally:
+        if pool is not None:
+            release_type_stage_pool(pool, keep=pool_healthy)
+
+def save_results_to_phase3(combined_with_fixed, loans_filename, run_context=None, profiler=None,
+                           output_format=None, session=None):
+    """Save processing results to Phase 3.
+    Run-level assumption scalars (RunContext) go to a single Run_Context header sheet.
+    output_format: 'xlsx' (streaming, default), 'parquet' (one file per type) or 'csv'
+    (gzip per type); default LPVP_OUTPUT_FORMAT. total_rates / risk_rates go to a
+    <output>_curves sidecar file (LPVP_OUTPUT_CURVES=inline keeps them as text cells).
+    Files are written to a temp dir and streamed from disk to SharePoint.
+    profiler: RunProfiler of the run; its artifacts are uploaded next to the output as
+    Processed_Loans_<tape>_<timestamp>_profile.* / _allocations.txt
+    session: SharePointSession of the run (the warm process session when None)"""
     try:
         logging.info("Saving processing results to Phase 3...")
         
         # Create output filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = loans_filename.replace('.xlsx', '').replace('.xls', '')
-        output_filename = f"Processed_Loans_{base_name}_{timestamp}.xlsx"
-        
-        # Convert results to Excel in BytesIO
-        output_buffer = BytesIO()
-        with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-            # Write each loan type to separate sheets
-            for type_key, df in combined_with_fixed.items():
-                if not df.empty:
-                    sheet_name = f"Type_{type_key}"
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    logging.info(f"Added sheet '{sheet_name}' with {len(df)} rows")
-                else:
-                    logging.info(f"Skipping empty dataset for {type_key}")
-        
-        output_buffer.seek(0)
+        output_stem = f"Processed_Loans_{base_name}_{timestamp}"
+        writer = get_result_writer(output_format)
         
         # Get SharePoint connection
-        env_vars = load_env_vars()
-        access_token = get_access_token(env_vars)
-        site_id = get_site_id(access_token, env_vars['site_name'])
-        
-        # Build Phase 3 path
-        phase3_path = f"{env_vars['base_path']}/Phase 3/{output_filename}"
-        
-        # Upload to SharePoint Phase 3
-        import requests
-        
-        # Get file size for upload method decision
-        file_data = output_buffer.getvalue()
-        file_size = len(file_data)
-        
-        if file_size <= 4 * 1024 * 1024:  # <= 4MB -> simple upload
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{phase3_path}:/content"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            }
-            resp = requests.put(url, headers=headers, data=file_data)
-            resp.raise_for_status()
-            result = resp.json()
-        else:
-            # Large file upload with chunked upload
-            session_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{phase3_path}:/createUploadSession"
-            session_headers = {"Authorization": f"Bearer {access_token}"}
-            session_body = {
-                "item": {
-                    "@microsoft.graph.conflictBehavior": "replace",
-                    "name": output_filename,
-                }
-            }
-            session_resp = requests.post(session_url, headers=session_headers, json=session_body)
-            session_resp.raise_for_status()
-            upload_url = session_resp.json().get("uploadUrl")
-
-            # Upload in chunks
-            chunk_size = 5 * 1024 * 1024  # 5 MB
-            start = 0
-            last_resp = None
-
-            while start < file_size:
-                end = min(start + chunk_size, file_size) - 1
-                chunk = file_data[start : end + 1]
-                headers = {
-                    "Content-Length": str(end - start + 1),
-                    "Content-Range": f"bytes {start}-{end}/{file_size}",
-                }
-                put_resp = requests.put(upload_url, headers=headers, data=chunk)
-                put_resp.raise_for_status()
-                last_resp = put_resp
-                start = end + 1
-            
-            result = last_resp.json()
-        
-        logging.info(f"SUCCESS: Results saved to Phase 3 as '{output_filename}'")
-        logging.info(f"File size: {file_size / (1024*1024):.2f} MB")
-        logging.info(f"SharePoint location: {phase3_path}")
-        
+        session = (session or get_session()).refreshed()
+        phase3_folder = session.folder("Phase 3")
+
+        with tempfile.TemporaryDirectory(prefix="lpvp_phase3_") as tmp_dir:
+            paths = writer.write(combined_with_fixed, tmp_dir, output_stem, run_context)
+
+            result, uploaded, total_size = None, [], 0
+            for path in paths:
+                file_name = os.path.basename(path)
+                item = session.upload_file("Phase 3", file_name, path, content_type(path))
+                result = result or item  # primary output first
+                uploaded.append(file_name)
+                total_size += os.path.getsize(path)
+        
+        logging.info(f"SUCCESS: Results saved to Phase 3 as {uploaded} ({writer.name})")
+        logging.info(f"File size: {total_size / (1024*1024):.2f} MB")
+        logging.info(f"SharePoint location: {phase3_folder}")
+
+        if profiler is not None and profiler.enabled:
+            profiler.write(default_report_dir(), output_stem)
+            try:
+                profiler.upload(session.access_token, session.site_id, phase3_folder, output_stem)
+            except Exception as e:
+                logging.warning(f"Could not upload profile artifacts: {e}")
+
+        result["uploaded_files"] = uploaded
         return result
         
     except Exception as e:
         logging.error(f"Error saving results to Phase 3: {str(e)}")
         return None
 
+# -------------------------------
+# Process pool stages: stage(df, type_key, curves)
+# -------------------------------
+def _floating_stage(df, type_key, curves):
+    return process_floating_calculations(floating_df=df, curves=curves)
+
+def _fixed_stage(df, type_key, curves):
+    return process_fixed_calculations({type_key: df}, curves)[type_key]
+
 # -------------------------------
 # Original Functions (unchanged)
 # -------------------------------
-def process_fixed_loans(segmented_results):
+def process_fixed_loans(segmented_results, assumption_curves=None, pool=None):
     logging.info("Processing fixed loans...")
     fixed_results = {}
     fixed_datasets = segmented_results["performing_loans"]["original"]["fixed"]
 
+    if pool is not None:
+        return pool.map_types(_fixed_stage, {
+            f"type_{calc_type[-1]}": fixed_datasets[calc_type] for calc_type in ["nf1", "nf2", "nf3", "nf4"]
+        })
+
     for calc_type in ["nf1", "nf2", "nf3", "nf4"]:
         type_number = calc_type[-1]
         type_fixed_data = fixed_datasets[calc_type]
         if not type_fixed_data.empty:
-            df_with_rates = process_fixed_calculations({f"type_{type_number}": type_fixed_data})[f"type_{type_number}"]
+            df_with_rates = process_fixed_calculations({f"type_{type_number}": type_fixed_data}, assumption_curves)[f"type_{type_number}"]
             fixed_results[f"type_{type_number}"] = df_with_rates
         else:
             fixed_results[f"type_{type_number}"] = pd.DataFrame()
     
     return fixed_results
 
-def process_floating_loans(segmented_results, assumptions_dict):
+def process_floating_loans(segmented_results, assumption_curves, pool=None):
     floating_results = {}
     floating_original = segmented_results["performing_loans"]["original"]["floating"]
+    if pool is not None:
+        return pool.map_types(_floating_stage, {f"type_{i}": floating_original[f"f{i}"] for i in range(1, 5)})
     for i in range(1, 5):
         f_key = f"f{i}"
         type_floating_data = floating_original[f_key]
         if not type_floating_data.empty:
             floating_results[f"type_{i}"] = process_floating_calculations(
                 floating_df=type_floating_data,
-                assumptions_dict=assumptions_dict
+                curves=assumption_curves
             )
         else:
             floating_results[f"type_{i}"] = pd.DataFrame()
@@ -476,65 +463,135 @@ def log_portfolio_summary(loans_df: pd.DataFrame):
 # -------------------------------
 # Main execution with SharePoint integration
 # -------------------------------
-if __name__ == "__main__":
+def run_phase3_processing(profile=None, diagnostics=None, output_format=None, session=None, tape=None,
+                          assumptions=None, run_report=None, progress=None):
+    """
+    Phase 1 tape + Phase 2 assumptions from SharePoint -> pipeline -> calculations -> Phase 3.
+
+    profile: truthy to capture a profiler run (HTTP ?profile=1); None falls back to
+    LPVP_PROFILE. Off, the profiler is a no-op. On, the pipeline stages run on one thread
+    and cProfile/pyinstrument + tracemalloc artifacts are saved next to the Phase 3 output.
+    diagnostics: per-run diagnostics level (HTTP ?diagnostics=debug); default LPVP_DIAGNOSTICS.
+    output_format: Phase 3 writer ('xlsx', 'parquet', 'csv'); default LPVP_OUTPUT_FORMAT.
+    session / tape / assumptions: handed over by the full-cycle orchestrator so one run
+    authenticates once and downloads and parses the tape once. session is a
+    SharePointSession, tape a LoanTape, assumptions a (BytesIO, file name) pair; whatever
+    is None is fetched from SharePoint as usual.
+    run_report: RunReport of the run (per-stage progress of a background job); progress:
+    optional callable(step) told "download", "valuation", "calculations" and "save".
+
+    Returns a summary dict with "status" ("success", "save_failed" or "failed").
+    """
+    logging.info("Starting main processing with SharePoint integration (BytesIO)")
+    logging.info("=" * 60)
+    logging.info("Configuration:")
+    logging.info("- Loans data source: SharePoint Phase 1 (latest file)")
+    logging.info("- Assumptions data source: SharePoint Phase 2 (latest file)")
+    logging.info("- Processing: Direct from BytesIO streams (no local files)")
+    logging.info("=" * 60)
+
+    progress = progress or (lambda step: None)
+
+    # Download Excel streams from SharePoint (only what the caller did not hand over)
+    progress("download")
     try:
-        logging.info("Starting main processing with SharePoint integration (BytesIO)")
-        logging.info("=" * 60)
-        logging.info("Configuration:")
-        logging.info("- Loans data source: SharePoint Phase 1 (latest file)")
-        logging.info("- Assumptions data source: SharePoint Phase 2 (latest file)")
-        logging.info("- Processing: Direct from BytesIO streams (no local files)")
-        logging.info("=" * 60)
-        
-        # Download Excel streams from SharePoint
-        result = get_excel_streams_from_sharepoint()
-        
-        if not result or len(result) != 4:
-            logging.error("Failed to download required Excel files from SharePoint")
-            sys.exit(1)
-        
-        loans_stream, assumptions_stream, loans_filename, assumptions_filename = result
-        
-        # Load raw loans for portfolio summary
-        loans_df = load_loans_excel_from_stream(loans_stream)
-        if loans_df is not None:
-            log_portfolio_summary(loans_df)
-        else:
-            logging.error("Failed to load loans data for portfolio summary")
-            sys.exit(1)
+        session = session or get_session()
+        tape = tape or fetch_latest_loan_tape(session)
+        assumptions_stream, assumptions_filename = assumptions or fetch_latest_assumptions(session)
+    except Exception as e:
+        logging.error(f"Error downloading Excel streams from SharePoint: {str(e)}")
+        tape, assumptions_stream = None, None
+
+    if tape is None or assumptions_stream is None:
+        logging.error("Failed to download required Excel files from SharePoint")
+        return {"status": "failed", "error": "Failed to download required Excel files from SharePoint"}
+
+    loans_filename = tape.name
+    logging.info(f"  Loans: {loans_filename} (Phase 1)")
+    logging.info(f"  Assumptions: {assumptions_filename} (Phase 2)")
+
+    # Parse raw loans for portfolio summary; the pipeline reuses the parsed tape
+    try:
+        log_portfolio_summary(tape.frame)
+    except Exception as e:
+        logging.error(f"Failed to load loans data for portfolio summary: {str(e)}")
+        return {"status": "failed", "error": "Failed to load loans data", "loans_file": loans_filename}
 
-        # Run main pipeline with streams
-        combined_with_fixed, assumptions_dicts, segmented_results = main_processing_pipeline_from_streams(
-            loans_stream, assumptions_stream, loans_filename
+    if share_compiled_assumptions_enabled():
+        prefetch_compiled_assumptions(assumptions_stream, session=session)
+
+    profiler = RunProfiler(enabled=profiling_requested(profile), label=loans_filename)
+    if run_report is not None:
+        run_report.meta.setdefault("loans_filename", loans_filename)
+
+    # Run main pipeline with streams
+    with profiler:
+        progress("valuation")
+        combined_with_fixed, compiled_assumptions, segmented_results = main_processing_pipeline_from_streams(
+            tape, assumptions_stream, loans_filename, run_report=run_report, diagnostics=diagnostics
         )
 
         if combined_with_fixed is not None:
             logging.info("Final processing completed successfully! Loans enriched with risk profiles and fixed assumptions.")
-            
+
+            # The run may have outlived the token it started with: renew it before uploading
+            session = session.refreshed()
+
+            if share_compiled_assumptions_enabled():
+                publish_compiled_assumptions(compiled_assumptions, session=session)
+
+            # Run-level scalars travel once through the pipeline (RunContext)
+            run_context = compiled_assumptions.run_context
+
             logging.info("Sending results to calculations.py manage_calculations...")
-            calculations_result = manage_calculations(combined_with_fixed)
-
-            # Save results to Phase 3
-            save_result = save_results_to_phase3(combined_with_fixed, loans_filename)
-            
-            if save_result:
-                logging.info("=" * 60)
-                logging.info("PROCESSING AND SAVE COMPLETED SUCCESSFULLY!")
-                logging.info("=" * 60)
-                logging.info("Summary:")
-                logging.info(f"- Input: {loans_filename} (Phase 1)")
-                logging.info(f"- Assumptions: {assumptions_filename} (Phase 2)")
-                logging.info(f"- Output: Processed results saved to Phase 3")
-                logging.info("=" * 60)
-            else:
-                logging.warning("Processing completed but failed to save to Phase 3")
-                logging.info("=" * 60)
-                logging.info("PROCESSING COMPLETED (SAVE FAILED)")
-                logging.info("=" * 60)
-        else:
-            logging.error("Processing pipeline failed")
+            progress("calculations")
+            # Imported here: only the Phase 3 run needs it, not what-if runs or benchmarks
+            from calculations import manage_calculations
+            # calculations reads the run-level scalars as per-row columns: broadcast them
+            # back for it only (the Phase 3 output keeps them in its Run_Context sheet)
+            calculations_input = {type_key: run_context.broadcast(df) for type_key, df in combined_with_fixed.items()}
+            calculations_result = manage_calculations(calculations_input)
+
+    if combined_with_fixed is None:
+        logging.error("Processing pipeline failed")
+        return {"status": "failed", "error": "Processing pipeline failed", "loans_file": loans_filename}
+
+    # Save results to Phase 3
+    progress("save")
+    save_result = save_results_to_phase3(combined_with_fixed, loans_filename, run_context, profiler=profiler,
+                                         output_format=output_format, session=session)
+
+    summary = {
+        "status": "success" if save_result else "save_failed",
+        "loans_file": loans_filename,
+        "assumptions_file": assumptions_filename,
+        "output_file": save_result.get("name") if save_result else None,
+        "output_files": save_result.get("uploaded_files", []) if save_result else [],
+        "output_folder": session.folder("Phase 3"),
+        "profile_artifacts": [os.path.basename(path) for path in profiler.paths],
+    }
+    if save_result:
+        logging.info("=" * 60)
+        logging.info("PROCESSING AND SAVE COMPLETED SUCCESSFULLY!")
+        logging.info("=" * 60)
+        logging.info("Summary:")
+        logging.info(f"- Input: {loans_filename} (Phase 1)")
+        logging.info(f"- Assumptions: {assumptions_filename} (Phase 2)")
+        logging.info(f"- Output: Processed results saved to Phase 3")
+        logging.info("=" * 60)
+    else:
+        logging.warning("Processing completed but failed to save to Phase 3")
+        logging.info("=" * 60)
+        logging.info("PROCESSING COMPLETED (SAVE FAILED)")
+        logging.info("=" * 60)
+    return summary
+
+if __name__ == "__main__":
+    try:
+        summary = run_phase3_processing()
+        if summary["status"] == "failed":
             sys.exit(1)
 
     except Exception as e:
         logging.error(f"Processing failed: {e}", exc_info=True)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
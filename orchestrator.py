@@ -0,0 +1,94 @@
+import logging
+import sys
+import time
+from io import BytesIO
+
+# -------------------------------
+# Full cycle: Phase 1 tape -> Phase 2 template -> Phase 3 valuation, in one process
+# -------------------------------
+def run_full_cycle(template=True, valuation=True, incremental=True, profile=None, diagnostics=None,
+                   output_format=None, session=None, tape=None, run_report=None, progress=None):
+    """
+    Template generation and valuation on one SharePointSession and one LoanTape.
+
+    The tape is selected once (keywords, then latest modified), downloaded once and
+    parsed once; the template step, the portfolio summary and the valuation DAG all read
+    the same parsed frame. The template step runs incrementally by default, so the
+    valuation is handed the template it just updated (or the existing one, when the tape
+    added nothing) without downloading Phase 2 again.
+
+    A freshly created template is blank: the valuation is skipped with status
+    "awaiting_assumptions" until it has been filled in.
+
+    session / tape: an open SharePointSession and a selected LoanTape to reuse (fetched
+    otherwise); run_report / progress are passed to the valuation (see run_phase3_processing).
+
+    Returns a summary dict with "status" and the "template" / "valuation" step results.
+    """
+    # Heavy imports stay inside the call: the Function host imports this module per route
+    from tools.sharepoint import get_session
+    from input_data.loan_tape import fetch_latest_loan_tape
+    from assumption import generate_assumption_template
+    from loan_input import run_phase3_processing
+
+    started = time.perf_counter()
+    summary = {"status": "failed", "tape": None, "template": None, "valuation": None}
+
+    progress = progress or (lambda step: None)
+    try:
+        session = session or get_session()
+    except Exception as e:
+        logging.error(f"SharePoint authentication failed: {e}", exc_info=True)
+        summary["error"] = f"SharePoint authentication failed: {e}"
+        return summary
+
+    progress("download")
+    tape = tape or fetch_latest_loan_tape(session)
+    if tape is None:
+        summary["error"] = "No data tape found in Phase 1"
+        return summary
+    summary["tape"] = tape.name
+    logging.info(f"Full cycle on {tape!r}")
+
+    assumptions = None
+    if template:
+        progress("template")
+        result = generate_assumption_template(session, tape, incremental=incremental)
+        summary["template"] = {key: result.get(key) for key in ("status", "name", "changes")}
+        if result["status"] == "failed":
+            summary["error"] = "Assumption template generation failed"
+            return summary
+        if result["status"] == "created":
+            logging.info(f"New blank template {result['name']}: valuation waits until it is filled in")
+            summary["status"] = "awaiting_assumptions"
+            summary["seconds"] = round(time.perf_counter() - started, 3)
+            return summary
+        assumptions = (BytesIO(result["data"]), result["name"])
+
+    if valuation:
+        result = run_phase3_processing(profile=profile, diagnostics=diagnostics, output_format=output_format,
+                                       session=session, tape=tape, assumptions=assumptions,
+                                       run_report=run_report, progress=progress)
+        summary["valuation"] = result
+        summary["status"] = result["status"]
+    else:
+        summary["status"] = "success"
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    logging.info(f"Full cycle finished: {summary['status']} in {summary['seconds']}s")
+    return summary
+
+if __name__ == "__main__":
+    try:
+        summary = run_full_cycle(
+            template="--valuation-only" not in sys.argv,
+            valuation="--template-only" not in sys.argv,
+            incremental="--fresh-template" not in sys.argv,
+        )
+        logging.info(f"Summary: {summary}")
+        if summary["status"] == "failed":
+            sys.exit(1)
+
+    except Exception as e:
+        logging.error(f"Full cycle failed: {e}", exc_info=True)
+        sys.exit(1)
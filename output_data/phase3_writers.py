@@ -0,0 +1,329 @@
+import csv
+import gzip
+import json
+import logging
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from tools.startup import LazyModule, module_available
+
+# Optional and slow to import: pyarrow loads on the first Parquet write, openpyxl on the first xlsx
+HAVE_PYARROW = module_available("pyarrow")
+pa = LazyModule("pyarrow")
+pq = LazyModule("pyarrow.parquet")
+
+# Excel's sheet limit, header row included
+EXCEL_MAX_ROWS = 1_048_576
+# Rows converted per step; bounds writer memory independently of the tape size
+CHUNK_ROWS = 50_000
+# zlib level 6: within ~6% of level 9 size at a quarter of the time
+GZIP_LEVEL = 6
+
+ID_COLUMN = "Unique Loan ID"
+# Per-loan curves: total_rates {date: rate} dicts and risk_rates JSON payloads
+CURVE_COLUMNS = ["total_rates", "risk_rates"]
+CURVE_SIDECAR_COLUMNS = ["loan_type_group", ID_COLUMN, "curve", "date", "value"]
+
+CONTENT_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".parquet": "application/vnd.apache.parquet",
+    ".gz": "application/gzip",
+}
+
+
+# ---------- Curve columns ----------
+def curve_frame(df, type_key, parse_dates=True):
+    """
+    Long (tidy) form of a result frame's curve columns:
+    loan_type_group, Unique Loan ID, curve (total_rate / cost_of_risk / prepayment_risk), date, value
+    Dates stay 'YYYY-MM-DD' strings with parse_dates=False (text outputs skip the round trip).
+    """
+    ids = df[ID_COLUMN].to_numpy() if ID_COLUMN in df.columns else np.arange(len(df))
+    parts = []
+
+    if "total_rates" in df.columns:
+        rates = [r if isinstance(r, dict) else {} for r in df["total_rates"].tolist()]
+        lengths = np.fromiter((len(r) for r in rates), dtype=np.int64, count=len(rates))
+        total = int(lengths.sum())
+        if total:
+            parts.append(pd.DataFrame({
+                ID_COLUMN: np.repeat(ids, lengths),
+                "curve": "total_rate",
+                "date": list(chain.from_iterable(r.keys() for r in rates)),
+                "value": np.fromiter(chain.from_iterable(r.values() for r in rates), dtype=float, count=total),
+            }))
+
+    if "risk_rates" in df.columns:
+        # Loans of one type share the same payload objects; parse each distinct payload once
+        parsed = {}
+        payloads = df["risk_rates"].tolist()
+        for payload in payloads:
+            if isinstance(payload, str) and payload not in parsed:
+                parsed[payload] = json.loads(payload)
+        for curve, field in (("cost_of_risk", "Cost of Risk"), ("prepayment_risk", "Prepayment Risk")):
+            per_loan = [parsed[p] if isinstance(p, str) else None for p in payloads]
+            lengths = np.fromiter((len(p["Date"]) if p else 0 for p in per_loan), dtype=np.int64, count=len(per_loan))
+            total = int(lengths.sum())
+            if total:
+                parts.append(pd.DataFrame({
+                    ID_COLUMN: np.repeat(ids, lengths),
+                    "curve": curve,
+                    "date": list(chain.from_iterable(p["Date"] for p in per_loan if p)),
+                    "value": np.fromiter(chain.from_iterable(p[field] for p in per_loan if p), dtype=float, count=total),
+                }))
+
+    if not parts:
+        return pd.DataFrame(columns=CURVE_SIDECAR_COLUMNS)
+    curves = pd.concat(parts, ignore_index=True)
+    curves.insert(0, "loan_type_group", type_key)
+    if parse_dates:
+        curves["date"] = pd.to_datetime(curves["date"], format="%Y-%m-%d")
+    return curves[CURVE_SIDECAR_COLUMNS]
+
+
+def _excel_cells(chunk):
+    # NaN / NaT -> empty cell, numpy scalars -> python, dicts and lists -> text (inline curves)
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    for col in chunk.columns:
+        if chunk[col].dtype == object and chunk[col].map(lambda v: isinstance(v, (dict, list))).any():
+            chunk[col] = chunk[col].map(lambda v: str(v) if v is not None else None)
+    return chunk.itertuples(index=False, name=None)
+
+
+def _parquet_safe(chunk):
+    # One Arrow type per column: mixed object columns (e.g. Past Due Date: 0 / "2021-01-31") become text
+    chunk = chunk.copy(deep=False)
+    for col in chunk.columns:
+        if chunk[col].dtype == object:
+            chunk[col] = chunk[col].map(lambda v: None if v is None or (isinstance(v, float) and np.isnan(v))
+                                        else v if isinstance(v, str) else json.dumps(v) if isinstance(v, (dict, list))
+                                        else str(v)).astype("string")
+    return chunk
+
+
+# ---------- Writers ----------
+class ResultWriter:
+    """
+    Base of the Phase 3 output writers.
+
+    write() takes the per-type result frames and writes one or more files named
+    <base_name>... into directory, returning their paths (primary file first).
+    With curves_sidecar, total_rates / risk_rates leave the per-type output and go to
+    one long-format <base_name>_curves file (Parquet when pyarrow is installed, gzip
+    CSV otherwise) instead of being stringified per row.
+    """
+
+    name = None
+
+    def __init__(self, curves_sidecar=True, chunk_rows=CHUNK_ROWS):
+        self.curves_sidecar = curves_sidecar
+        self.chunk_rows = chunk_rows
+
+    def write(self, results, directory, base_name, run_context=None):
+        paths = self._write_results(results, directory, base_name, run_context)
+        if self.curves_sidecar:
+            sidecar = self._write_curves(results, directory, base_name)
+            if sidecar:
+                paths.append(sidecar)
+        return paths
+
+    def _write_results(self, results, directory, base_name, run_context):
+        raise NotImplementedError
+
+    def _result_frame(self, df):
+        if not self.curves_sidecar:
+            return df
+        return df.drop(columns=[col for col in CURVE_COLUMNS if col in df.columns])
+
+    def _chunks(self, df):
+        for start in range(0, len(df), self.chunk_rows):
+            yield df.iloc[start:start + self.chunk_rows]
+
+    def _write_curves(self, results, directory, base_name):
+        frames = ((type_key, df) for type_key, df in results.items()
+                  if not df.empty and any(col in df.columns for col in CURVE_COLUMNS))
+        if HAVE_PYARROW:
+            path = os.path.join(directory, f"{base_name}_curves.parquet")
+            schema, writer = None, None
+            try:
+                for type_key, df in frames:
+                    for chunk in self._chunks(df):
+                        curves = curve_frame(chunk, type_key)
+                        if curves.empty:
+                            continue
+                        table = pa.Table.from_pandas(_parquet_safe(curves), schema=schema, preserve_index=False)
+                        if writer is None:
+                            schema = table.schema
+                            writer = pq.ParquetWriter(path, schema, compression="zstd")
+                        writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            return path if writer is not None else None
+
+        path = os.path.join(directory, f"{base_name}_curves.csv.gz")
+        header = True
+        with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=GZIP_LEVEL) as fh:
+            for type_key, df in frames:
+                for chunk in self._chunks(df):
+                    curves = curve_frame(chunk, type_key, parse_dates=False)
+                    if curves.empty:
+                        continue
+                    curves.to_csv(fh, index=False, header=header)
+                    header = False
+        if header:
+            os.remove(path)
+            return None
+        return path
+
+
+class StreamingXlsxWriter(ResultWriter):
+    """
+    Constant-memory xlsx: openpyxl write-only workbook, rows streamed chunk by chunk.
+    Sheets are Run_Context and Type_<n> as before; a type with more rows than Excel
+    allows continues on Type_<n>_2, Type_<n>_3, ...
+    """
+
+    name = "xlsx"
+    extension = ".xlsx"
+
+    def __init__(self, curves_sidecar=True, chunk_rows=CHUNK_ROWS, max_rows=EXCEL_MAX_ROWS):
+        super().__init__(curves_sidecar, chunk_rows)
+        self.max_rows = max_rows
+
+    def _write_results(self, results, directory, base_name, run_context):
+        from openpyxl import Workbook
+
+        path = os.path.join(directory, f"{base_name}.xlsx")
+        wb = Workbook(write_only=True)
+
+        if run_context is not None:
+            ws = wb.create_sheet("Run_Context")
+            frame = run_context.to_frame()
+            ws.append(list(frame.columns))
+            for row in _excel_cells(frame):
+                ws.append(row)
+            logging.info("Added sheet 'Run_Context' with run-level assumptions")
+
+        for type_key, df in results.items():
+            if df.empty:
+                logging.info(f"Skipping empty dataset for {type_key}")
+                continue
+            df = self._result_frame(df)
+            sheets = self._write_type_sheets(wb, type_key, df)
+            logging.info(f"Added {len(df)} rows of {type_key} on sheet(s) {sheets}")
+
+        if not wb.worksheets:
+            wb.create_sheet("Type_1")  # a workbook needs one sheet
+        wb.save(path)
+        return [path]
+
+    def _write_type_sheets(self, wb, type_key, df):
+        rows_per_sheet = self.max_rows - 1
+        header = [str(col) for col in df.columns]
+        sheets, ws, rows_on_sheet = [], None, rows_per_sheet
+        for chunk in self._chunks(df):
+            for row in _excel_cells(chunk):
+                if rows_on_sheet == rows_per_sheet:
+                    title = f"Type_{type_key}" if not sheets else f"Type_{type_key}_{len(sheets) + 1}"
+                    ws = wb.create_sheet(title)
+                    ws.append(header)
+                    sheets.append(title)
+                    rows_on_sheet = 0
+                ws.append(row)
+                rows_on_sheet += 1
+        return sheets
+
+
+class ParquetWriter(ResultWriter):
+    """One Parquet file per loan type (<base_name>_Type_<n>.parquet) written in row groups, plus Run_Context"""
+
+    name = "parquet"
+    extension = ".parquet"
+
+    def __init__(self, curves_sidecar=True, chunk_rows=CHUNK_ROWS):
+        if not HAVE_PYARROW:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        super().__init__(curves_sidecar, chunk_rows)
+
+    def _write_results(self, results, directory, base_name, run_context):
+        paths = []
+        for type_key, df in results.items():
+            if df.empty:
+                logging.info(f"Skipping empty dataset for {type_key}")
+                continue
+            df = self._result_frame(df)
+            path = os.path.join(directory, f"{base_name}_Type_{type_key}.parquet")
+            schema, writer = None, None
+            try:
+                for chunk in self._chunks(df):
+                    table = pa.Table.from_pandas(_parquet_safe(chunk), schema=schema, preserve_index=False)
+                    if writer is None:
+                        schema = table.schema
+                        writer = pq.ParquetWriter(path, schema, compression="zstd")
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            paths.append(path)
+            logging.info(f"Wrote {len(df)} rows of {type_key} to {os.path.basename(path)}")
+
+        if run_context is not None:
+            path = os.path.join(directory, f"{base_name}_Run_Context.parquet")
+            pq.write_table(pa.Table.from_pandas(_parquet_safe(run_context.to_frame()), preserve_index=False), path)
+            paths.append(path)
+        return paths
+
+
+class CsvGzipWriter(ResultWriter):
+    """One gzip CSV per loan type (<base_name>_Type_<n>.csv.gz), appended chunk by chunk, plus Run_Context"""
+
+    name = "csv"
+    extension = ".csv.gz"
+
+    def _write_results(self, results, directory, base_name, run_context):
+        paths = []
+        for type_key, df in results.items():
+            if df.empty:
+                logging.info(f"Skipping empty dataset for {type_key}")
+                continue
+            df = self._result_frame(df)
+            path = os.path.join(directory, f"{base_name}_Type_{type_key}.csv.gz")
+            with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=GZIP_LEVEL) as fh:
+                for i, chunk in enumerate(self._chunks(df)):
+                    chunk.to_csv(fh, index=False, header=(i == 0), quoting=csv.QUOTE_MINIMAL)
+            paths.append(path)
+            logging.info(f"Wrote {len(df)} rows of {type_key} to {os.path.basename(path)}")
+
+        if run_context is not None:
+            path = os.path.join(directory, f"{base_name}_Run_Context.csv.gz")
+            with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=GZIP_LEVEL) as fh:
+                run_context.to_frame().to_csv(fh, index=False)
+            paths.append(path)
+        return paths
+
+
+RESULT_WRITERS = {writer.name: writer for writer in (StreamingXlsxWriter, ParquetWriter, CsvGzipWriter)}
+
+
+def get_result_writer(output_format=None, curves_sidecar=None):
+    """
+    Writer for output_format ('xlsx', 'parquet', 'csv'); defaults from LPVP_OUTPUT_FORMAT
+    (xlsx) and LPVP_OUTPUT_CURVES ('sidecar', or 'inline' for the old text cells).
+    The sidecar defaults on with pyarrow only: as gzip CSV, the long curve table costs
+    more to format than the inline cells it replaces.
+    """
+    output_format = (output_format or os.getenv("LPVP_OUTPUT_FORMAT") or "xlsx").strip().lower()
+    if output_format not in RESULT_WRITERS:
+        raise ValueError(f"Unknown output format: {output_format!r} (expected one of {sorted(RESULT_WRITERS)})")
+    if curves_sidecar is None:
+        default = "sidecar" if HAVE_PYARROW else "inline"
+        curves_sidecar = (os.getenv("LPVP_OUTPUT_CURVES") or default).strip().lower() != "inline"
+    return RESULT_WRITERS[output_format](curves_sidecar=curves_sidecar)
+
+
+def content_type(path):
+    return CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
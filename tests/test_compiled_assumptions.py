@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from input_data import compiled_assumptions as ca
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "Assumption_Summary_Template_complex.xlsx")
+
+
+@pytest.fixture(scope="module")
+def workbook():
+    with open(TEMPLATE, "rb") as fh:
+        return fh.read()
+
+
+@pytest.fixture(scope="module")
+def compiled(workbook):
+    return ca.compile_assumptions(workbook)
+
+
+@pytest.fixture(autouse=True)
+def empty_memory_cache():
+    ca.invalidate_compiled_assumptions()
+    yield
+    ca.invalidate_compiled_assumptions()
+
+
+def test_template_artifact_roundtrip(workbook):
+    assert ca.check_artifact_roundtrip(workbook)
+
+
+def test_summary_nan_none_and_nat_survive_the_artifact(compiled, tmp_path):
+    fields = list(compiled.summary)
+    summary = dict(compiled.summary, **{fields[0]: float("nan"), fields[1]: None, "unset_date": pd.NaT})
+    variant = ca.CompiledAssumptions(curves=compiled.curves, rates_fees_dict=compiled.rates_fees_dict,
+                                     fx_table=compiled.fx_table, tax_table=compiled.tax_table,
+                                     summary=summary, key=compiled.key)
+
+    loaded = ca.load_compiled_assumptions_artifact(ca.save_compiled_assumptions(variant, str(tmp_path / "a.lpvp")))
+
+    assert isinstance(loaded.summary[fields[0]], float) and np.isnan(loaded.summary[fields[0]])
+    assert loaded.summary[fields[1]] is None
+    assert loaded.summary["unset_date"] is pd.NaT
+    for name in ("cost_risk", "prepay_risk", "index_rates"):
+        assert np.array_equal(getattr(compiled.curves, name), getattr(loaded.curves, name), equal_nan=True)
+
+
+def test_artifact_of_another_version_is_rejected(compiled, tmp_path, monkeypatch):
+    path = ca.save_compiled_assumptions(compiled, str(tmp_path / "a.lpvp"))
+    monkeypatch.setattr(ca, "ARTIFACT_VERSION", ca.ARTIFACT_VERSION + 1)
+    with pytest.raises(ValueError, match="Unsupported artifact version"):
+        ca.load_compiled_assumptions_artifact(path)
+
+
+def test_unreadable_artifact_is_recompiled_and_replaced(workbook, tmp_path):
+    path = tmp_path / ca.artifact_filename(ca.workbook_key(workbook))
+    path.write_bytes(b"not an artifact")
+
+    compiled = ca.load_compiled_assumptions(workbook, cache_dir=str(tmp_path))
+
+    assert compiled.key == ca.workbook_key(workbook)
+    assert ca.load_compiled_assumptions_artifact(str(path)).key == compiled.key
+    assert sorted(os.listdir(tmp_path)) == [path.name]
+
+
+def test_failed_write_keeps_the_previous_artifact(tmp_path):
+    path = tmp_path / "a.lpvp"
+    path.write_bytes(b"previous")
+
+    with pytest.raises(RuntimeError):
+        with ca._atomic_write(str(path)) as fh:
+            fh.write(b"partial")
+            raise RuntimeError("writer failed")
+
+    assert path.read_bytes() == b"previous"
+    assert os.listdir(tmp_path) == ["a.lpvp"]
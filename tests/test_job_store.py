@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from tools import job_store
+from tools.job_store import JobStore, LocalFileJobStore, QUEUED, RUNNING, create_job_store
+
+
+def _job(job_id, submitted_at):
+    return {"job_id": job_id, "status": QUEUED, "submitted_at": submitted_at, "stages": {}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalFileJobStore(str(tmp_path))
+
+
+def test_create_get_update_list(store):
+    store.create(_job("first", "2026-01-01T10:00:00.000"))
+    store.create(_job("second", "2026-01-01T11:00:00.000"))
+
+    job = store.update("first", status=RUNNING, mutate=lambda job: job["stages"].update(load={"status": "ran"}))
+
+    assert store.get("first") == job
+    assert job["status"] == RUNNING and job["stages"] == {"load": {"status": "ran"}}
+    assert "updated_at" in job
+    assert [job["job_id"] for job in store.list()] == ["second", "first"]
+    assert [job["job_id"] for job in store.list(limit=1)] == ["second"]
+    assert store.get("unknown") is None
+
+
+def test_bad_requests_are_refused(store):
+    store.create(_job("first", "2026-01-01T10:00:00.000"))
+
+    with pytest.raises(ValueError, match="already exists"):
+        store.create(_job("first", "2026-01-01T10:00:00.000"))
+    with pytest.raises(KeyError):
+        store.update("unknown", status=RUNNING)
+    with pytest.raises(ValueError, match="Invalid job id"):
+        store.get("../first")
+
+
+def test_failed_write_keeps_the_previous_record(store, monkeypatch):
+    store.create(_job("first", "2026-01-01T10:00:00.000"))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(job_store.json, "dump", fail)
+    with pytest.raises(OSError):
+        store.update("first", status=RUNNING)
+    monkeypatch.undo()
+
+    assert store.get("first")["status"] == QUEUED
+    assert os.listdir(store.directory) == ["first.json"]
+
+
+def test_custom_stores_must_implement_the_interface():
+    class Partial(JobStore):
+        def create(self, job):
+            return job
+
+    with pytest.raises(TypeError):
+        Partial()
+    with pytest.raises(ValueError, match="not a JobStore subclass"):
+        create_job_store("collections:OrderedDict")
+    with pytest.raises(ValueError, match="Unknown job store"):
+        create_job_store("nowhere")
@@ -0,0 +1,57 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools.process_pool import TypeStagePool
+
+SHM_DIR = "/dev/shm"
+
+
+def double_stage(df, type_key, curves):
+    time.sleep(0.05)
+    return df * 2
+
+
+def failing_stage(df, type_key, curves):
+    if type_key == "bad":
+        raise ValueError("stage failed")
+    time.sleep(0.3)
+    return df * 2
+
+
+def _frames():
+    return {
+        "type_1": pd.DataFrame({"a": np.arange(100.0), "b": np.arange(100)}, index=np.arange(100) * 3),
+        "type_2": pd.DataFrame(),
+        "type_3": pd.DataFrame({"a": np.arange(7.0), "b": np.arange(7)}),
+    }
+
+
+def test_map_types_matches_the_in_process_stage():
+    frames = _frames()
+    with TypeStagePool(max_workers=2, chunk_rows=30) as pool:
+        results = pool.map_types(double_stage, frames)
+
+    assert list(results) == list(frames)
+    assert results["type_2"].empty
+    for type_key in ("type_1", "type_3"):
+        pd.testing.assert_frame_equal(results[type_key], frames[type_key] * 2)
+
+
+@pytest.mark.skipif(not os.path.isdir(SHM_DIR), reason="needs /dev/shm to count shared memory segments")
+def test_failed_task_leaves_no_shared_memory_behind():
+    frames = {"bad": pd.DataFrame({"a": np.arange(10.0)}), **_frames()}
+    before = set(os.listdir(SHM_DIR))
+
+    with TypeStagePool(max_workers=4, chunk_rows=20) as pool:
+        with pytest.raises(ValueError, match="stage failed"):
+            pool.map_types(failing_stage, frames)
+        leaked = set(os.listdir(SHM_DIR)) - before
+        # The pool still works after the failure
+        results = pool.map_types(double_stage, {"type_3": frames["type_3"]})
+
+    assert leaked == set()
+    pd.testing.assert_frame_equal(results["type_3"], frames["type_3"] * 2)
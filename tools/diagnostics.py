@@ -0,0 +1,149 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Levels follow the logging module; OFF is above everything
+TRACE = 5
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+OFF = logging.CRITICAL + 10
+
+LEVELS = {"trace": TRACE, "debug": DEBUG, "info": INFO, "off": OFF}
+
+DEFAULT_SAMPLE_ROWS = 3
+
+logger = logging.getLogger("lpvp.diagnostics")
+
+
+def parse_level(value, default=OFF):
+    """'debug' / 'info' / 'trace' / 'off' or a logging level number"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lower()
+    if value.isdigit():
+        return int(value)
+    if value not in LEVELS:
+        raise ValueError(f"Unknown diagnostics level: {value!r} (expected one of {sorted(LEVELS)})")
+    return LEVELS[value]
+
+
+class Diagnostics:
+    """
+    Structured diagnostics: named events with fields, gated by level, emitted as one
+    JSON object per event to the 'lpvp.diagnostics' logger or a JSON-lines file.
+
+        diag = get_diagnostics()
+        diag.emit("interest_rate_scale", type_id=1, max_rate=lambda: float(df[col].max()),
+                  sample=lambda: diag.sample(df[col]))
+
+    Callable field values are only evaluated when the event passes the level check, so
+    a disabled event costs one comparison. Per-row diagnostics go through sample(),
+    capped at sample_rows rows.
+    """
+
+    def __init__(self, level=OFF, sample_rows=DEFAULT_SAMPLE_ROWS, path=None, run_id=None):
+        self.level = level
+        self.sample_rows = sample_rows
+        self.path = path
+        self.run_id = run_id
+        self.emitted = 0
+        self._lock = threading.Lock()
+
+    def enabled(self, level=DEBUG):
+        return level >= self.level
+
+    def emit(self, event, level=DEBUG, force=False, **fields):
+        """Emit event when level passes (or force, for an explicit per-call debug request)"""
+        if not force and level < self.level:
+            return None
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "level": logging.getLevelName(level) if level != TRACE else "TRACE",
+            "event": event,
+        }
+        if self.run_id:
+            record["run_id"] = self.run_id
+        for key, value in fields.items():
+            record[key] = value() if callable(value) else value
+        line = json.dumps(record, default=_json_default)
+
+        with self._lock:
+            self.emitted += 1
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as fh:
+                    fh.write(line + "\n")
+        if not self.path:
+            # The diagnostics level is the switch; don't let the root logger level drop it again
+            logger.log(max(level, INFO), line)
+        return record
+
+    def sample(self, values, n=None):
+        """First n non-null values of a Series as {index: value}, or rows of a frame as records"""
+        n = self.sample_rows if n is None else n
+        if isinstance(values, pd.DataFrame):
+            return values.head(n).to_dict(orient="records")
+        return {str(idx): value for idx, value in values.dropna().head(n).items()}
+
+
+_default = None
+_default_lock = threading.Lock()
+_current = contextvars.ContextVar("lpvp_diagnostics", default=None)
+
+
+def default_diagnostics():
+    """Process default from LPVP_DIAGNOSTICS (level), LPVP_DIAGNOSTICS_SAMPLE and LPVP_DIAGNOSTICS_FILE"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Diagnostics(
+                    level=parse_level(os.getenv("LPVP_DIAGNOSTICS")),
+                    sample_rows=int(os.getenv("LPVP_DIAGNOSTICS_SAMPLE", DEFAULT_SAMPLE_ROWS)),
+                    path=os.getenv("LPVP_DIAGNOSTICS_FILE") or None,
+                )
+    return _default
+
+
+def get_diagnostics():
+    """Diagnostics of the current run scope, else the process default"""
+    return _current.get() or default_diagnostics()
+
+
+@contextmanager
+def diagnostics_scope(level=None, sample_rows=None, path=None, run_id=None):
+    """
+    Per-run override (e.g. ?diagnostics=debug on the Function route). Unset arguments
+    inherit from the enclosing diagnostics. Scopes live in a context variable: stage DAG
+    and executor budget threads run in a copy of the submitting context, so they see it.
+    """
+    parent = get_diagnostics()
+    diag = Diagnostics(
+        level=parent.level if level is None else parse_level(level),
+        sample_rows=parent.sample_rows if sample_rows is None else int(sample_rows),
+        path=parent.path if path is None else path,
+        run_id=run_id or parent.run_id,
+    )
+    token = _current.set(diag)
+    try:
+        yield diag
+    finally:
+        _current.reset(token)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
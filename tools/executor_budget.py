@@ -0,0 +1,193 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class BudgetExhausted(RuntimeError):
+    """Raised when the wait queue is full or a slot wait times out (backpressure)"""
+
+
+class ExecutorBudget:
+    """
+    Process-wide worker budget shared by concurrent pipeline runs and their stages.
+
+    - total_slots bounds the threads/processes doing pipeline work in this host process
+    - a run holds one slot for its own thread (slots()); stage fan-out borrows extra
+      slots with try_acquire_up_to() or map(), never blocking on them
+    - map() uses caller-runs backpressure: items that get no free slot run inline in
+      the calling thread, so nested fan-out cannot deadlock or oversubscribe
+    - blocking waits beyond max_queue raise BudgetExhausted instead of piling up
+
+    stats() reports in-use slots, queue depth and utilisation (busy slot-seconds over
+    total_slots * uptime).
+    """
+
+    def __init__(self, total_slots=None, max_queue=None):
+        self.total_slots = max(int(total_slots or os.cpu_count() or 1), 1)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        self._peak_in_use = 0
+        self._peak_waiting = 0
+        self._granted = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._busy_slot_seconds = 0.0
+        self._started = self._last_change = time.monotonic()
+        self._executor = None
+
+    # ---------- Accounting ----------
+    def _mark(self):
+        now = time.monotonic()
+        self._busy_slot_seconds += self._in_use * (now - self._last_change)
+        self._last_change = now
+
+    def _take(self, n):
+        self._mark()
+        self._in_use += n
+        self._granted += n
+        self._peak_in_use = max(self._peak_in_use, self._in_use)
+
+    @property
+    def available(self):
+        with self._cond:
+            return self.total_slots - self._in_use
+
+    # ---------- Slots ----------
+    def acquire(self, n=1, timeout=None):
+        """Block until n slots are free. Raises BudgetExhausted on a full queue or timeout."""
+        n = min(max(int(n), 1), self.total_slots)
+        with self._cond:
+            if self.total_slots - self._in_use >= n and not self._waiting:
+                self._take(n)
+                return n
+
+            if self.max_queue is not None and self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise BudgetExhausted(f"Executor budget queue full ({self._waiting} waiting)")
+
+            self._waiting += 1
+            self._peak_waiting = max(self._peak_waiting, self._waiting)
+            start = time.monotonic()
+            try:
+                granted = self._cond.wait_for(lambda: self.total_slots - self._in_use >= n, timeout)
+                if not granted:
+                    self._rejected += 1
+                    raise BudgetExhausted(f"No executor slot within {timeout}s ({self._in_use}/{self.total_slots} in use)")
+                self._take(n)
+                return n
+            finally:
+                self._waiting -= 1
+                self._wait_seconds += time.monotonic() - start
+
+    def try_acquire_up_to(self, n):
+        """Take up to n free slots without waiting; returns how many were granted (may be 0)"""
+        with self._cond:
+            granted = max(min(int(n), self.total_slots - self._in_use), 0)
+            if granted:
+                self._take(granted)
+            return granted
+
+    def release(self, n=1):
+        if n <= 0:
+            return
+        with self._cond:
+            self._mark()
+            self._in_use = max(self._in_use - n, 0)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slots(self, n=1, timeout=None):
+        """with budget.slots(): ... holds n slots for the block (admission for a run)"""
+        granted = self.acquire(n, timeout)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+    @contextmanager
+    def lease(self, n):
+        """with budget.lease(n) as granted: ... non-blocking, granted may be 0"""
+        granted = self.try_acquire_up_to(n)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+    # ---------- Fan-out ----------
+    def _shared_executor(self):
+        with self._cond:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.total_slots, thread_name_prefix="lpvp-budget")
+            return self._executor
+
+    def map(self, fn, items):
+        """
+        Ordered map over items on the shared budget threads. Each item runs on a borrowed
+        slot when one is free and inline in the caller otherwise (caller-runs backpressure).
+        """
+        items = list(items)
+        results = [None] * len(items)
+        futures = []
+        for i, item in enumerate(items):
+            if i < len(items) - 1 and self.try_acquire_up_to(1):
+                context = contextvars.copy_context()  # caller's per-run scopes follow the item
+                futures.append((i, self._shared_executor().submit(context.run, self._run_on_slot, fn, item)))
+            else:
+                results[i] = fn(item)
+        for i, future in futures:
+            results[i] = future.result()
+        return results
+
+    def _run_on_slot(self, fn, item):
+        try:
+            return fn(item)
+        finally:
+            self.release(1)
+
+    # ---------- Reporting ----------
+    def stats(self):
+        with self._cond:
+            self._mark()
+            uptime = max(self._last_change - self._started, 1e-9)
+            return {
+                "total_slots": self.total_slots,
+                "in_use": self._in_use,
+                "available": self.total_slots - self._in_use,
+                "queue_depth": self._waiting,
+                "peak_in_use": self._peak_in_use,
+                "peak_queue_depth": self._peak_waiting,
+                "granted": self._granted,
+                "rejected": self._rejected,
+                "wait_seconds": round(self._wait_seconds, 3),
+                "utilisation": round(self._busy_slot_seconds / (self.total_slots * uptime), 4),
+            }
+
+    def log_stats(self, prefix="Executor budget"):
+        logging.info(f"{prefix}: {self.stats()}")
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_executor_budget():
+    """
+    The process-wide budget. Size from LPVP_EXECUTOR_SLOTS (default: CPU count),
+    wait queue bound from LPVP_EXECUTOR_MAX_QUEUE (default: unbounded).
+    """
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            max_queue = os.getenv("LPVP_EXECUTOR_MAX_QUEUE")
+            _budget = ExecutorBudget(
+                total_slots=os.getenv("LPVP_EXECUTOR_SLOTS") or None,
+                max_queue=int(max_queue) if max_queue else None,
+            )
+            logging.info(f"Executor budget: {_budget.total_slots} slots, max queue {_budget.max_queue}")
+        return _budget
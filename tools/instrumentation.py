@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows local development
+    resource = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+def count_rows(value):
+    """Rows in a frame, or summed over the frames of a dict / tuple / list; None when nothing countable"""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        counts = [count_rows(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def current_rss_mb():
+    """Resident set size of this process (Linux /proc), None elsewhere"""
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if platform.system() == "Darwin" else 1024), 1)
+
+
+def tracemalloc_enabled():
+    """Opt-in Python heap tracking (LPVP_TRACEMALLOC=1); it slows allocation-heavy stages down"""
+    return os.getenv("LPVP_TRACEMALLOC", "").lower() in ("1", "true", "yes")
+
+
+def otel_enabled():
+    """Spans go out when opentelemetry is installed and LPVP_OTEL is not switched off"""
+    return otel_trace is not None and os.getenv("LPVP_OTEL", "1").lower() not in ("0", "false", "no")
+
+
+class StageRecord:
+    """Measurements of one stage execution; set rows_out (or any extra field) inside the block"""
+
+    def __init__(self, name, rows_in=None, **attributes):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.status = "ran"
+        self.error = None
+        self.attributes = dict(attributes)
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.peak_rss_mb = None
+        self.tracemalloc_peak_mb = None
+        self.started_at = None
+
+    def to_dict(self):
+        record = {
+            "stage": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rss_start_mb": self.rss_start_mb,
+            "rss_end_mb": self.rss_end_mb,
+            "rss_delta_mb": (round(self.rss_end_mb - self.rss_start_mb, 1)
+                             if self.rss_start_mb is not None and self.rss_end_mb is not None else None),
+            "peak_rss_mb": self.peak_rss_mb,
+            "tracemalloc_peak_mb": self.tracemalloc_peak_mb,
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attributes)
+        return record
+
+
+class RunReport:
+    """
+    Machine-readable report of one pipeline run.
+
+        report = RunReport(tape="tape.xlsx")
+        with report.stage("risk", rows_in=count_rows(loans)) as record:
+            result = assign_combined_risk_rates(loans, curves)
+            record.rows_out = count_rows(result)
+        report.write()
+
+    Per stage: wall time, CPU time of the stage's thread, rows in/out, RSS at start/end,
+    process peak RSS and (with LPVP_TRACEMALLOC=1) the Python heap peak during the stage.
+    Stages overlapping on threads share the process-wide RSS/heap figures, and work done
+    in process pool workers is not in cpu_seconds. Each stage is also an OpenTelemetry
+    span when opentelemetry is installed.
+
+    Listeners (add_listener) are called as listener(event, record) with event "started",
+    "finished" or "skipped", e.g. to publish per-stage progress of a background job.
+    """
+
+    def __init__(self, run_id=None, **meta):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.meta = dict(meta)
+        self.records = []
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._tracer = otel_trace.get_tracer("lpvp.pipeline") if otel_enabled() else None
+        self.path = None
+        self._listeners = []
+
+        self._owns_tracemalloc = tracemalloc_enabled() and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, record):
+        for listener in self._listeners:
+            try:
+                listener(event, record)
+            except Exception as e:  # progress reporting never fails a stage
+                logging.warning(f"Run report listener failed on {event} {record.name}: {e}")
+
+    @contextmanager
+    def stage(self, name, rows_in=None, **attributes):
+        record = StageRecord(name, rows_in, **attributes)
+        record.started_at = datetime.now().isoformat(timespec="milliseconds")
+        record.rss_start_mb = current_rss_mb()
+        self._notify("started", record)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            heap_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        span = self._tracer.start_as_current_span(f"lpvp.{name}") if self._tracer else None
+        active_span = span.__enter__() if span else None
+
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        except Exception as e:
+            record.status = "failed"
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.wall_seconds = round(time.perf_counter() - wall_start, 4)
+            record.cpu_seconds = round(time.thread_time() - cpu_start, 4)
+            record.rss_end_mb = current_rss_mb()
+            record.peak_rss_mb = peak_rss_mb()
+            if tracing:
+                record.tracemalloc_peak_mb = round((tracemalloc.get_traced_memory()[1] - heap_start) / 1024 ** 2, 2)
+
+            if active_span is not None:
+                for key, value in record.to_dict().items():
+                    if value is not None and key != "stage":
+                        active_span.set_attribute(f"lpvp.{key}", value)
+                span.__exit__(None, None, None)
+
+            with self._lock:
+                self.records.append(record)
+            self._notify("finished", record)
+
+    def skipped(self, name, status="cached", **attributes):
+        """Record a stage that did not execute (e.g. served from the stage cache)"""
+        record = StageRecord(name, **attributes)
+        record.status = status
+        record.started_at = datetime.now().isoformat(timespec="milliseconds")
+        with self._lock:
+            self.records.append(record)
+        self._notify("skipped", record)
+        return record
+
+    def to_dict(self):
+        stages = [record.to_dict() for record in self.records]
+        ran = [stage for stage in stages if stage["status"] == "ran"]
+        slowest = max(ran, key=lambda stage: stage["wall_seconds"] or 0, default=None)
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "wall_seconds": round(time.perf_counter() - self._started, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "slowest_stage": slowest["stage"] if slowest else None,
+            "meta": self.meta,
+            "stages": stages,
+        }
+
+    def write(self, directory=None):
+        """Write run_report_<timestamp>_<run id>.json and return its path"""
+        directory = directory or default_report_dir()
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(directory, f"run_report_{timestamp}_{self.run_id}.json")
+        with open(self.path, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2, default=str)
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        logging.info(f"Run report written: {self.path}")
+        return self.path
+
+
+def default_report_dir():
+    return os.getenv("LPVP_RUN_REPORT_DIR") or os.path.join(tempfile.gettempdir(), "lpvp_reports")
@@ -0,0 +1,150 @@
+import abc
+import importlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+
+# Job states; a job ends in exactly one of the final ones
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINAL_STATES = (SUCCEEDED, FAILED)
+
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def now_iso():
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+class JobStore(abc.ABC):
+    """
+    Where background job records live. A record is a JSON-serialisable dict with at least
+    job_id and status; the job runner owns its layout.
+
+    Implementations subclass it, provide create / get / update / list and make update atomic per
+    job (a reader never sees half a record). Pick one with LPVP_JOB_STORE: a name from
+    JOB_STORES or "package.module:ClassName" for a custom store (blob storage, a table, ...).
+    """
+
+    @abc.abstractmethod
+    def create(self, job):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        """The record, or None for an unknown job"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update(self, job_id, mutate=None, **fields):
+        """Set fields and/or apply mutate(record) in place; returns the new record"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list(self, limit=50):
+        """Most recently submitted records first"""
+        raise NotImplementedError
+
+
+class LocalFileJobStore(JobStore):
+    """
+    One <job_id>.json file per job under directory (LPVP_JOB_STORE_DIR). Writes go to a
+    temp file and are renamed over the record, so readers in other processes see either
+    the old or the new record. Updates are serialised within the process; a job is only
+    ever written by the process running it.
+    """
+
+    name = "local"
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("LPVP_JOB_STORE_DIR") or os.path.join(tempfile.gettempdir(), "lpvp_jobs")
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        if not _JOB_ID.match(str(job_id)):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job):
+        path = self._path(job["job_id"])
+        fd, tmp_path = tempfile.mkstemp(prefix=".job_", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(job, fh, indent=2, default=str)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def create(self, job):
+        with self._lock:
+            if os.path.exists(self._path(job["job_id"])):
+                raise ValueError(f"Job {job['job_id']} already exists")
+            self._write(job)
+        return job
+
+    def get(self, job_id):
+        try:
+            with open(self._path(job_id), encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id, mutate=None, **fields):
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            job.update(fields)
+            if mutate is not None:
+                mutate(job)
+            job["updated_at"] = now_iso()
+            self._write(job)
+        return job
+
+    def list(self, limit=50):
+        jobs = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                job = self.get(name[:-len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        jobs.sort(key=lambda job: job.get("submitted_at", ""), reverse=True)
+        return jobs[:limit]
+
+
+JOB_STORES = {LocalFileJobStore.name: LocalFileJobStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_job_store(spec=None):
+    """Store for spec: a JOB_STORES name or 'module:Class'; default LPVP_JOB_STORE, then local files"""
+    spec = (spec or os.getenv("LPVP_JOB_STORE") or LocalFileJobStore.name).strip()
+    if spec in JOB_STORES:
+        return JOB_STORES[spec]()
+    if ":" not in spec:
+        raise ValueError(f"Unknown job store: {spec!r} (expected one of {sorted(JOB_STORES)} or 'module:Class')")
+    module_name, class_name = spec.split(":", 1)
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(store_class, type) and issubclass(store_class, JobStore)):
+        raise ValueError(f"Job store {spec!r} is not a JobStore subclass")
+    store = store_class()
+    logging.info(f"Using job store {spec}")
+    return store
+
+
+def get_job_store():
+    """Process-wide job store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_job_store()
+    return _store
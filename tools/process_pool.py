@@ -0,0 +1,330 @@
+import atexit
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from input_data.assumption_curves import AssumptionCurves
+from tools.executor_budget import get_executor_budget
+from tools.startup import register_warm_cache
+
+_ALIGNMENT = 64
+_CURVE_ARRAYS = ("dates", "cost_risk", "prepay_risk", "index_rates")
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Worker-side state: compiled curves attached once per worker process
+_worker_curves = None
+_worker_segment = None
+
+
+def process_pool_workers():
+    """Opt-in: LPVP_PROCESS_POOL_WORKERS=<n> (or 'auto' for all cores); 0 / unset keeps stages in-process"""
+    value = os.getenv("LPVP_PROCESS_POOL_WORKERS", "").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        return 0
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+# ---------- Shared memory transport ----------
+def export_frame(df):
+    """
+    Copy a DataFrame into a new shared memory segment.
+
+    Column blocks travel as pickle protocol 5 out-of-band buffers, written raw into
+    the segment; only the small frame skeleton (and object columns) is pickled.
+    Returns (segment, spec); spec is what crosses the process boundary.
+    """
+    buffers = []
+    skeleton = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+
+    layout = []
+    offset = _align(len(skeleton))
+    for raw in raws:
+        layout.append((offset, raw.nbytes))
+        offset = _align(offset + raw.nbytes)
+
+    segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    segment.buf[:len(skeleton)] = skeleton
+    for (start, nbytes), raw in zip(layout, raws):
+        segment.buf[start:start + nbytes] = raw
+        raw.release()
+    return segment, {"name": segment.name, "skeleton": len(skeleton), "buffers": layout}
+
+
+def import_frame(spec):
+    """
+    Rebuild a DataFrame from export_frame's spec. Each column block is copied out of
+    the segment once into a writable buffer, so the segment can be closed right away.
+    """
+    segment = shared_memory.SharedMemory(name=spec["name"])
+    try:
+        with segment.buf[:spec["skeleton"]] as view:
+            skeleton = bytes(view)
+        buffers = []
+        for start, nbytes in spec["buffers"]:
+            with segment.buf[start:start + nbytes] as view:
+                buffers.append(bytearray(view))
+        return pickle.loads(skeleton, buffers=buffers)
+    finally:
+        segment.close()
+
+
+def release_segment(segment):
+    segment.close()
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _release_result(spec):
+    """Unlink a result segment a worker left for the parent (export_frame spec)"""
+    try:
+        segment = shared_memory.SharedMemory(name=spec["name"])
+    except FileNotFoundError:
+        return
+    release_segment(segment)
+
+
+class SharedCurves:
+    """
+    AssumptionCurves arrays packed into one shared memory segment. Workers map the
+    segment read-only and rebuild AssumptionCurves on views of it (no copies).
+    """
+
+    def __init__(self, curves):
+        arrays = {name: np.ascontiguousarray(getattr(curves, name)) for name in _CURVE_ARRAYS}
+
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+
+        self.segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, array in arrays.items():
+            start = layout[name]["offset"]
+            self.segment.buf[start:start + array.nbytes] = array.tobytes()
+
+        self.spec = {
+            "name": self.segment.name,
+            "arrays": layout,
+            "loan_types": list(curves.loan_types),
+            "indices": list(curves.indices),
+        }
+
+    @staticmethod
+    def attach(spec):
+        """Returns (segment, AssumptionCurves); keep the segment referenced while the curves are in use"""
+        segment = shared_memory.SharedMemory(name=spec["name"])
+        arrays = {}
+        for name, array_spec in spec["arrays"].items():
+            shape = tuple(array_spec["shape"])
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(array_spec["dtype"]),
+                                      buffer=segment.buf, offset=array_spec["offset"])
+            arrays[name].flags.writeable = False
+
+        curves = AssumptionCurves(
+            dates=arrays["dates"],
+            loan_types={loan_type: row for row, loan_type in enumerate(spec["loan_types"])},
+            indices={index_name: row for row, index_name in enumerate(spec["indices"])},
+            cost_risk=arrays["cost_risk"],
+            prepay_risk=arrays["prepay_risk"],
+            index_rates=arrays["index_rates"],
+        )
+        return segment, curves
+
+    def release(self):
+        release_segment(self.segment)
+
+
+def _init_worker(curves_spec):
+    global _worker_curves, _worker_segment
+    if curves_spec is not None:
+        _worker_segment, _worker_curves = SharedCurves.attach(curves_spec)
+
+
+def _run_stage_task(stage, type_key, frame_spec, options):
+    df = import_frame(frame_spec)
+    result = stage(df, type_key, _worker_curves, **options)
+    segment, spec = export_frame(result)
+    segment.close()  # parent imports and unlinks it
+    return spec
+
+
+# ---------- Pool ----------
+class TypeStagePool:
+    """
+    Process pool for the type-partitioned pipeline stages (rate curves, risk, enrichment).
+
+    Frames cross the process boundary through shared memory segments and the compiled
+    curves are shared once per worker, so column data is never pickled through the
+    pool's pipes. A stage is a module-level callable stage(df, type_key, curves, **options).
+
+    Workers are leased from the process-wide executor budget: the calling run's own
+    slot plus whatever extra slots are free (up to max_workers), returned on close().
+
+    Usage:
+        with TypeStagePool(curves, max_workers=8) as pool:
+            floating = pool.map_types(floating_stage, floating_frames)
+    """
+
+    def __init__(self, curves=None, max_workers=None, chunk_rows=None, budget=None):
+        self.budget = budget or get_executor_budget()
+        self.requested_workers = max_workers or os.cpu_count() or 1
+        self.curves_key = None
+        self.leased = self.budget.try_acquire_up_to(self.requested_workers - 1)
+        self.max_workers = 1 + self.leased
+        self.chunk_rows = chunk_rows or int(os.getenv("LPVP_PROCESS_POOL_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+        self.shared_curves = SharedCurves(curves) if curves is not None else None
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self.shared_curves.spec if self.shared_curves else None,),
+        )
+        logging.info(f"Process pool started with {self.max_workers} workers (chunk {self.chunk_rows:,} rows)")
+
+    def map_types(self, stage, frames, chunked=True, **options):
+        """
+        Run stage on every non-empty frame of {type_key: df}. Row-wise stages are split
+        into chunk_rows chunks and reassembled in order; chunked=False keeps one task per
+        type (stages whose logic looks at the whole type, e.g. the percentage fix).
+        """
+        tasks = []
+        for type_key, df in frames.items():
+            if df is None or df.empty:
+                continue
+            step = self.chunk_rows if chunked else len(df)
+            for start in range(0, len(df), step):
+                segment, spec = export_frame(df.iloc[start:start + step])
+                future = self.executor.submit(_run_stage_task, stage, type_key, spec, options)
+                tasks.append((type_key, segment, future))
+
+        parts = {}
+        collected = set()
+        try:
+            for index, (type_key, segment, future) in enumerate(tasks):
+                result_spec = future.result()
+                collected.add(index)
+                release_segment(segment)
+                try:
+                    parts.setdefault(type_key, []).append(import_frame(result_spec))
+                finally:
+                    _release_result(result_spec)
+        finally:
+            # After a failed task: cancel what hasn't started, wait for what is running and
+            # unlink every result segment those tasks produced (nobody else will)
+            for _, _, future in tasks:
+                future.cancel()
+            for index, (_, segment, future) in enumerate(tasks):
+                if index not in collected and not future.cancelled() and future.exception() is None:
+                    _release_result(future.result())
+                release_segment(segment)
+
+        results = {}
+        for type_key, df in frames.items():
+            chunks = parts.get(type_key)
+            if not chunks:
+                results[type_key] = pd.DataFrame()
+            else:
+                results[type_key] = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+        return results
+
+    def suspend(self):
+        """Give the budget lease back while the pool sits idle between runs; processes stay up"""
+        self.budget.release(self.leased)
+        self.leased = 0
+
+    def resume(self):
+        """Lease the pool's slots again; False (nothing leased) when the budget can't cover all workers now"""
+        leased = self.budget.try_acquire_up_to(self.max_workers - 1)
+        if leased < self.max_workers - 1:
+            self.budget.release(leased)
+            return False
+        self.leased = leased
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.shared_curves is not None:
+            self.shared_curves.release()
+        self.budget.release(self.leased)
+        self.leased = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# ---------- Warm pool ----------
+# One idle pool is parked between runs so warm invocations skip process start-up and
+# curve sharing. It is reused only for the same curves and worker count, and holds no
+# executor budget while parked.
+_parked = None
+_parked_lock = threading.Lock()
+
+
+def acquire_type_stage_pool(curves, curves_key=None, max_workers=None):
+    """TypeStagePool for a run: the parked pool when it matches, a new one otherwise"""
+    global _parked
+    with _parked_lock:
+        pool, _parked = _parked, None
+    if pool is not None:
+        if (curves_key is not None and pool.curves_key == curves_key
+                and pool.requested_workers == (max_workers or os.cpu_count() or 1) and pool.resume()):
+            logging.info(f"Reusing warm process pool ({pool.max_workers} workers)")
+            return pool
+        pool.close()
+    pool = TypeStagePool(curves, max_workers=max_workers)
+    pool.curves_key = curves_key
+    return pool
+
+
+def release_type_stage_pool(pool, keep=True):
+    """
+    Hand a pool back after the run: parked for the next one (keep, and a curves key to
+    match on), closed otherwise. A pool that saw a failure should not be kept.
+    """
+    global _parked
+    if not keep or pool.curves_key is None:
+        pool.close()
+        return
+    pool.suspend()
+    with _parked_lock:
+        previous, _parked = _parked, pool
+    if previous is not None:
+        previous.close()
+
+
+def close_warm_pool():
+    global _parked
+    with _parked_lock:
+        pool, _parked = _parked, None
+    if pool is not None:
+        pool.close()
+
+
+def _warm_pool_stats():
+    pool = _parked
+    if pool is None:
+        return {"parked": False}
+    return {"parked": True, "workers": pool.max_workers, "curves_key": (pool.curves_key or "")[:12]}
+
+
+atexit.register(close_warm_pool)
+register_warm_cache("process_pool", _warm_pool_stats, close_warm_pool)
@@ -0,0 +1,167 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import tracemalloc
+
+from tools.startup import LazyModule, module_available
+
+# pyinstrument is optional; imported only when a profiled run starts
+HAVE_PYINSTRUMENT = module_available("pyinstrument")
+pyinstrument = LazyModule("pyinstrument")
+
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 30
+TRACEBACK_FRAMES = 15
+
+_active = 0
+_active_lock = threading.Lock()
+
+
+def profiling_requested(flag=None):
+    """Explicit flag (e.g. ?profile=1 on the Function route) wins, otherwise LPVP_PROFILE"""
+    value = flag if flag is not None else os.getenv("LPVP_PROFILE", "")
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def profiling_active():
+    """True while a RunProfiler is capturing; the pipeline then keeps stages on one thread"""
+    return _active > 0
+
+
+class RunProfiler:
+    """
+    Opt-in profiler capture for one run. Disabled, it is a no-op context manager.
+
+    Enabled, it records:
+    - a pyinstrument sampling profile (HTML flame view + text) when pyinstrument is
+      installed, otherwise cProfile (pstats dump + cumulative/tottime text report)
+    - tracemalloc snapshots at start and end: top allocation sites by size, growth
+      during the run, and tracebacks for the largest sites
+
+        profiler = RunProfiler(enabled=profiling_requested(req.params.get("profile")))
+        with profiler:
+            run_pipeline()
+        profiler.write(directory, "Processed_Loans_tape_20250101_120000")
+    """
+
+    def __init__(self, enabled=False, label="run"):
+        self.enabled = enabled
+        self.label = label
+        self._profiler = None
+        self._sampler = None
+        self._start_snapshot = None
+        self._end_snapshot = None
+        self._owns_tracemalloc = False
+        self.paths = []
+
+    def __enter__(self):
+        global _active
+        if not self.enabled:
+            return self
+        with _active_lock:
+            _active += 1
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._owns_tracemalloc = True
+        self._start_snapshot = tracemalloc.take_snapshot()
+
+        if HAVE_PYINSTRUMENT:
+            self._sampler = pyinstrument.Profiler()
+            self._sampler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        logging.info(f"Profiling enabled for {self.label} ({'pyinstrument' if self._sampler else 'cProfile'} + tracemalloc)")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        if not self.enabled:
+            return False
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._profiler is not None:
+            self._profiler.disable()
+        self._end_snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        with _active_lock:
+            _active -= 1
+        return False
+
+    # ---------- Artifacts ----------
+    def artifacts(self):
+        """{suffix: bytes} of every captured report; empty when disabled"""
+        if not self.enabled or self._end_snapshot is None:
+            return {}
+        files = {"_allocations.txt": self._allocation_report().encode("utf-8")}
+        if self._sampler is not None:
+            files["_profile.html"] = self._sampler.output_html().encode("utf-8")
+            files["_profile.txt"] = self._sampler.output_text(unicode=True, color=False).encode("utf-8")
+        if self._profiler is not None:
+            with tempfile.NamedTemporaryFile(suffix=".pstats", delete=False) as fh:
+                dump_path = fh.name
+            try:
+                self._profiler.dump_stats(dump_path)
+                with open(dump_path, "rb") as fh:
+                    files["_profile.pstats"] = fh.read()
+            finally:
+                os.remove(dump_path)
+            files["_profile.txt"] = self._pstats_report().encode("utf-8")
+        return files
+
+    def write(self, directory, base_name):
+        """Write artifacts as <base_name><suffix> into directory; returns the paths"""
+        os.makedirs(directory, exist_ok=True)
+        self.paths = []
+        for suffix, data in self.artifacts().items():
+            path = os.path.join(directory, f"{base_name}{suffix}")
+            with open(path, "wb") as fh:
+                fh.write(data)
+            self.paths.append(path)
+        if self.paths:
+            logging.info(f"Profile artifacts written: {self.paths}")
+        return self.paths
+
+    def upload(self, access_token, site_id, folder_path, base_name):
+        """Upload artifacts next to the run output in a SharePoint folder"""
+        from tools.sharepoint import upload_bytes
+
+        uploaded = []
+        for suffix, data in self.artifacts().items():
+            upload_bytes(access_token, site_id, f"{folder_path}/{base_name}{suffix}", data)
+            uploaded.append(f"{base_name}{suffix}")
+        if uploaded:
+            logging.info(f"Profile artifacts uploaded to {folder_path}: {uploaded}")
+        return uploaded
+
+    def _pstats_report(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=out).strip_dirs()
+        out.write(f"=== {self.label}: top {TOP_FUNCTIONS} by cumulative time ===\n")
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        out.write(f"\n=== {self.label}: top {TOP_FUNCTIONS} by own time ===\n")
+        stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def _allocation_report(self):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        end = self._end_snapshot.filter_traces(ignore)
+        start = self._start_snapshot.filter_traces(ignore)
+
+        lines = [f"=== {self.label}: top {TOP_ALLOCATIONS} allocation sites at end of run ==="]
+        lines += [str(stat) for stat in end.statistics("lineno")[:TOP_ALLOCATIONS]]
+
+        lines += ["", f"=== {self.label}: top {TOP_ALLOCATIONS} allocation growth during the run ==="]
+        lines += [str(stat) for stat in end.compare_to(start, "lineno")[:TOP_ALLOCATIONS]]
+
+        lines += ["", "=== Tracebacks of the 5 largest sites ==="]
+        for stat in end.statistics("traceback")[:5]:
+            lines.append(f"{stat.count} blocks, {stat.size / 1024 ** 2:.1f} MiB")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        return "\n".join(lines) + "\n"
@@ -1,9 +1,72 @@
+import copy
 import requests
 import os
+import threading
+import time
 import pandas as pd
 from io import BytesIO
 from dotenv import load_dotenv
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from tools.startup import register_warm_cache
+from tools.throttle import AdaptiveLimiter, THROTTLE_STATUSES, graph_concurrency, retry_after_seconds
+
+# ---------- Pooled, throttling-aware Graph client ----------
+# Retries of one call answered 429 / 503 before the response is handed back
+GRAPH_MAX_RETRIES = 5
+
+_http = None
+_limiter = None
+_http_lock = threading.Lock()
+
+def graph_http():
+    """The pooled requests.Session of this process: keep-alive connections shared by every thread"""
+    global _http
+    with _http_lock:
+        if _http is None:
+            _http = requests.Session()
+            _http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=graph_concurrency() * 2))
+        return _http
+
+def graph_limiter():
+    """AdaptiveLimiter shared by every Graph call of this process (LPVP_GRAPH_CONCURRENCY at most)"""
+    global _limiter
+    with _http_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(max_limit=graph_concurrency())
+        return _limiter
+
+def graph_request(method, url, **kwargs):
+    """
+    One Graph (or login) call through the pooled client. A 429 / 503 answer lowers the
+    shared concurrency limit, pauses all callers for its Retry-After and is retried, up
+    to GRAPH_MAX_RETRIES times; the last response is returned either way.
+    """
+    limiter = graph_limiter()
+    for attempt in range(GRAPH_MAX_RETRIES + 1):
+        with limiter.slot():
+            response = graph_http().request(method, url, **kwargs)
+        if response.status_code not in THROTTLE_STATUSES:
+            limiter.succeeded()
+            break
+        if attempt < GRAPH_MAX_RETRIES:
+            limiter.throttled(retry_after_seconds(response, attempt))
+    return response
+
+def reset_graph_client():
+    """Close the pooled connections and start over with a fresh limiter"""
+    global _http, _limiter
+    with _http_lock:
+        http, _http, _limiter = _http, None, None
+    if http is not None:
+        http.close()
+
+def _graph_client_stats():
+    limiter = _limiter
+    return {"connected": _http is not None, **(limiter.stats() if limiter is not None else {})}
+
+register_warm_cache("graph_client", _graph_client_stats, reset_graph_client)
 
 def load_env_vars():
     # from scripts.load_secrets import load_secrets_local
@@ -23,6 +86,10 @@ def load_env_vars():
 
 def get_access_token(env_vars):
     """Authenticate and obtain an access token."""
+    return request_access_token(env_vars)[0]
+
+def request_access_token(env_vars):
+    """Authenticate and obtain an access token with its lifetime: (token, expires_in seconds)."""
     print("Authenticating and obtaining access token...")
     auth_url = f"https://login.microsoftonline.com/{env_vars['tenant_id']}/oauth2/v2.0/token"
     payload = {
@@ -31,16 +98,17 @@ def get_access_token(env_vars):
         "client_secret": env_vars['client_secret'],
         "scope": "https://graph.microsoft.com/.default",
     }
-    response = requests.post(auth_url, data=payload)
+    response = graph_request("POST", auth_url, data=payload)
     response.raise_for_status()
     print("Access token obtained successfully.")
-    return response.json().get("access_token")
+    token = response.json()
+    return token.get("access_token"), int(token.get("expires_in", 3600))
 
 def get_site_id(access_token, site_name):
     """Get the site ID for the specified SharePoint site."""
     print(f"Fetching site ID for site: {site_name}...")
     headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(
+    response = graph_request("GET", 
         f"https://graph.microsoft.com/v1.0/sites/{site_name}", headers=headers
     )
     response.raise_for_status()
@@ -51,7 +119,7 @@ def list_files_in_directory(access_token, site_id, directory_path):
     """List all files in a given directory on SharePoint."""
     headers = {"Authorization": f"Bearer {access_token}"}
     url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{directory_path}:/children"
-    response = requests.get(url, headers=headers)
+    response = graph_request("GET", url, headers=headers)
     response.raise_for_status()
     files = response.json().get("value", [])
     return files
@@ -86,7 +154,7 @@ def download_file(access_token, site_id, folder_path, **read_kwargs):
                 # Step 3: Download matching file
                 file_path = f"{folder_path}/{name}"
                 file_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{file_path}:/content"
-                file_resp = requests.get(file_url, headers=headers)
+                file_resp = graph_request("GET", file_url, headers=headers)
                 file_resp.raise_for_status()
 
                 files_bytes = file_resp.content
@@ -176,20 +244,76 @@ def upload_to_directory(df: pd.DataFrame, path: str):
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         }
-        resp = requests.put(url, headers=headers, data=data)
+        resp = graph_request("PUT", url, headers=headers, data=data)
         resp.raise_for_status()
         return resp.json()
 
     # >4MB -> create an upload session (chunked upload)
+    return _upload_session(access_token, site_id, item_path, BytesIO(data), size)
+
+def upload_bytes(access_token, site_id, item_path, data, content_type="application/octet-stream"):
+    """
+    Upload raw bytes to a SharePoint item path (simple upload up to 4MB, upload session above).
+
+    Args:
+        access_token (str): OAuth token
+        site_id (str): SharePoint site ID
+        item_path (str): Full item path relative to the drive root, including the file name
+        data (bytes): File content
+        content_type (str): MIME type used for the simple upload
+
+    Returns:
+        dict: The DriveItem JSON returned by Microsoft Graph for the uploaded file.
+    """
+    size = len(data)
+
+    if size <= 4 * 1024 * 1024:  # <= 4MB -> simple upload
+        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{item_path}:/content"
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": content_type,
+        }
+        resp = graph_request("PUT", url, headers=headers, data=data)
+        resp.raise_for_status()
+        return resp.json()
+
+    return _upload_session(access_token, site_id, item_path, BytesIO(data), size)
+
+def upload_file(access_token, site_id, item_path, local_path, content_type="application/octet-stream"):
+    """
+    Upload a local file to a SharePoint item path, streaming it from disk in 5 MB
+    chunks (simple upload up to 4MB, upload session above), so the file is never
+    held in memory as a whole.
+
+    Returns:
+        dict: The DriveItem JSON returned by Microsoft Graph for the uploaded file.
+    """
+    size = os.path.getsize(local_path)
+
+    if size <= 4 * 1024 * 1024:  # <= 4MB -> simple upload
+        with open(local_path, "rb") as fh:
+            return upload_bytes(access_token, site_id, item_path, fh.read(), content_type)
+
+    with open(local_path, "rb") as fh:
+        return _upload_session(access_token, site_id, item_path, fh, size)
+
+def _upload_session(access_token, site_id, item_path, stream, size):
+    """
+    Upload size bytes read from a binary stream through a Graph upload session, in
+    5 MB chunks (only one chunk is in memory at a time); replaces an existing item.
+
+    Returns:
+        dict: The DriveItem JSON returned by Microsoft Graph for the uploaded file.
+    """
     session_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{item_path}:/createUploadSession"
     session_headers = {"Authorization": f"Bearer {access_token}"}
     session_body = {
         "item": {
             "@microsoft.graph.conflictBehavior": "replace",
-            "name": filename,
+            "name": os.path.basename(item_path),
         }
     }
-    session_resp = requests.post(session_url, headers=session_headers, json=session_body)
+    session_resp = graph_request("POST", session_url, headers=session_headers, json=session_body)
     session_resp.raise_for_status()
     upload_url = session_resp.json().get("uploadUrl")
 
@@ -198,17 +322,144 @@ def upload_to_directory(df: pd.DataFrame, path: str):
     last_resp = None
 
     while start < size:
-        end = min(start + chunk_size, size) - 1
-        chunk = data[start : end + 1]
+        chunk = stream.read(min(chunk_size, size - start))
+        if not chunk:
+            raise IOError(f"Upload of {item_path} ended after {start} of {size} bytes")
+        end = start + len(chunk) - 1
         headers = {
-            "Content-Length": str(end - start + 1),
+            "Content-Length": str(len(chunk)),
             "Content-Range": f"bytes {start}-{end}/{size}",
         }
         # Note: uploadUrl already contains auth; do not add Authorization header
-        put_resp = requests.put(upload_url, headers=headers, data=chunk)
+        put_resp = graph_request("PUT", upload_url, headers=headers, data=chunk)
         put_resp.raise_for_status()
         last_resp = put_resp
         start = end + 1
 
     # When the last chunk is uploaded, Graph returns the DriveItem
     return last_resp.json()
+
+def download_bytes(access_token, site_id, item_path):
+    """
+    Download a single SharePoint item by path.
+
+    Returns:
+        bytes or None: File content, or None when the item does not exist.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{item_path}:/content"
+    resp = graph_request("GET", url, headers=headers)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.content
+
+# Seconds before token expiry at which a warm session is replaced
+SESSION_EXPIRY_MARGIN = 300
+
+class SharePointSession:
+    """
+    One authenticated Graph client for a whole run: environment, access token and site ID
+    are resolved once and shared by every download and upload of the run (template
+    generation and valuation in the same cycle included).
+
+        session = SharePointSession()
+        files = session.list_files("Phase 1", extensions=(".xlsx", ".xls"))
+        data = session.download("Phase 1", files[0]["name"])
+    """
+
+    def __init__(self, env_vars=None, access_token=None, site_id=None):
+        self.env_vars = env_vars or load_env_vars()
+        self.expires_at = None  # unknown for a token handed in
+        if access_token is None:
+            access_token, expires_in = request_access_token(self.env_vars)
+            self.expires_at = time.monotonic() + expires_in
+        self.access_token = access_token
+        self.site_id = site_id or get_site_id(self.access_token, self.env_vars["site_name"])
+        self.created_at = time.monotonic()
+
+    def expired(self, margin=SESSION_EXPIRY_MARGIN):
+        """True once the token is within margin seconds of its expiry"""
+        return self.expires_at is not None and time.monotonic() + margin >= self.expires_at
+
+    @property
+    def base_path(self):
+        return self.env_vars["base_path"]
+
+    def folder(self, phase):
+        """Full folder path of a phase folder, e.g. folder("Phase 2")"""
+        return f"{self.base_path}/{phase}"
+
+    def list_files(self, phase, extensions=None):
+        """File items (Graph DriveItem dicts: name, lastModifiedDateTime, cTag, size, ...) of a phase folder"""
+        items = list_files_in_directory(self.access_token, self.site_id, self.folder(phase))
+        return [
+            item for item in items
+            if item.get("file") and (extensions is None or item.get("name", "").lower().endswith(tuple(extensions)))
+        ]
+
+    def download(self, phase, name):
+        """Bytes of one file in a phase folder, or None when it does not exist"""
+        return download_bytes(self.access_token, self.site_id, f"{self.folder(phase)}/{name}")
+
+    def upload_bytes(self, phase, name, data, content_type="application/octet-stream"):
+        return upload_bytes(self.access_token, self.site_id, f"{self.folder(phase)}/{name}", data, content_type)
+
+    def upload_file(self, phase, name, local_path, content_type="application/octet-stream"):
+        return upload_file(self.access_token, self.site_id, f"{self.folder(phase)}/{name}", local_path, content_type)
+
+    def refreshed(self, margin=SESSION_EXPIRY_MARGIN):
+        """
+        This session while its token has more than margin seconds left, else one with a
+        new token for the same site and base path (the renewed warm session when it runs
+        on the process environment). Long runs call it before uploading their results.
+        """
+        if not self.expired(margin):
+            return self
+        fresh = get_session()
+        if {**fresh.env_vars, "base_path": self.base_path} != self.env_vars:
+            fresh = SharePointSession(dict(self.env_vars), site_id=self.site_id)
+        return fresh.for_project(self.base_path)
+
+    def for_project(self, base_path):
+        """
+        The same authenticated session (token, site, pooled client) rooted at another
+        project's base path: one sign-in serves every project of a batch run.
+        """
+        project = copy.copy(self)
+        project.env_vars = {**self.env_vars, "base_path": base_path.strip("/")}
+        return project
+
+
+# Process-level session reused by warm invocations until its token is about to expire
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    The warm SharePointSession of this process: authenticated once, reused across
+    invocations, and replaced when its token is within SESSION_EXPIRY_MARGIN seconds of
+    expiring. invalidate_session() forces a new one (rotated secrets, 401s).
+    """
+    global _session
+    with _session_lock:
+        if _session is None or _session.expired():
+            _session = SharePointSession()
+        return _session
+
+def invalidate_session():
+    global _session
+    with _session_lock:
+        _session = None
+
+def _session_stats():
+    session = _session
+    if session is None:
+        return {"cached": False}
+    return {
+        "cached": True,
+        "age_seconds": round(time.monotonic() - session.created_at, 1),
+        "expires_in_seconds": None if session.expires_at is None else round(session.expires_at - time.monotonic(), 1),
+    }
+
+register_warm_cache("graph_session", _session_stats, invalidate_session)
@@ -0,0 +1,362 @@
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from tools.executor_budget import get_executor_budget
+from tools.instrumentation import count_rows
+from tools.startup import register_warm_cache
+
+
+class Stage:
+    """
+    A named pipeline stage: fn(*inputs) -> outputs, inputs passed in declared order.
+    fn returns a single value for one declared output, a tuple (in order) for several.
+    version is part of the fingerprint; bump it when the stage logic changes.
+    """
+
+    def __init__(self, name, fn, inputs, outputs, version=1):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.version = version
+
+    def __repr__(self):
+        return f"Stage({self.name}: {self.inputs} -> {self.outputs})"
+
+
+# Fingerprint prefix of run-only values: stages fed by them never hit or fill the cache
+UNCACHEABLE_PREFIX = "uncacheable:"
+
+
+class Uncacheable:
+    """
+    Stage return value to use for this run only, e.g. a degraded fallback after an error:
+    neither it nor anything computed from it is put in the stage cache.
+
+        except Exception:
+            return Uncacheable(unenriched)
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"Uncacheable({type(self.value).__name__})"
+
+
+class StageCache:
+    """
+    Stage outputs keyed by stage fingerprint (stage name, version and the fingerprints
+    of its inputs), keeping the max_entries most recent fingerprints per stage.
+    Hits are returned as shallow DataFrame copies so callers modifying a result do not
+    alter the cached one (copy-on-write pandas).
+    """
+
+    def __init__(self, max_entries=2):
+        self.max_entries = max_entries
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage_name, fingerprint):
+        with self._lock:
+            entries = self._stages.get(stage_name)
+            if not entries or fingerprint not in entries:
+                self.misses += 1
+                return None
+            entries.move_to_end(fingerprint)
+            self.hits += 1
+            return _detach(entries[fingerprint])
+
+    def put(self, stage_name, fingerprint, outputs):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entries = self._stages.setdefault(stage_name, OrderedDict())
+            entries[fingerprint] = _detach(outputs)
+            entries.move_to_end(fingerprint)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, stage_name=None):
+        """Drop one stage's entries, or everything"""
+        with self._lock:
+            if stage_name is None:
+                self._stages.clear()
+            else:
+                self._stages.pop(stage_name, None)
+
+    def stats(self):
+        with self._lock:
+            entries = sum(len(entries) for entries in self._stages.values())
+        return {"entries": entries, "max_entries_per_stage": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class DAGRun:
+    """Outcome of StageDAG.run: values by name plus per-stage status and timings"""
+
+    def __init__(self, values, report, seconds):
+        self.values = values
+        self.report = report
+        self.seconds = seconds
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def summary(self):
+        ran = [name for name, info in self.report.items() if info["status"] == "ran"]
+        cached = [name for name, info in self.report.items() if info["status"] == "cached"]
+        return {"seconds": round(self.seconds, 3), "ran": ran, "cached": cached}
+
+
+class StageDAG:
+    """
+    Pipeline as a DAG of named stages with declared inputs and outputs.
+
+    run() starts every stage as soon as its inputs exist, so independent stages overlap
+    on threads, each borrowing one executor-budget slot while it runs; with no free slot
+    they run inline.
+    Stage outputs are cached by input fingerprint, and any stage can be forced to
+    re-run (with everything downstream of it) while the rest comes from the cache.
+    """
+
+    def __init__(self, stages):
+        self.stages = {}
+        self.producers = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Output '{output}' produced by both {self.producers[output]} and {stage.name}")
+                self.producers[output] = stage.name
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for value in self.stages[name].inputs:
+                if value in self.producers:
+                    visit(self.producers[value], path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def upstream(self, names):
+        """names plus every stage they depend on"""
+        needed, stack = set(), list(names)
+        while stack:
+            name = stack.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            stack.extend(self.producers[value] for value in self.stages[name].inputs if value in self.producers)
+        return needed
+
+    def downstream(self, names):
+        """names plus every stage that depends on them"""
+        affected = set(names)
+        for name in self.order:
+            stage = self.stages[name]
+            if any(self.producers.get(value) in affected for value in stage.inputs):
+                affected.add(name)
+        return affected
+
+    def run(self, seeds, fingerprints=None, targets=None, rerun=(), cache=None, max_parallel=None, budget=None,
+            report=None):
+        """
+        Args:
+            seeds: {name: value} inputs not produced by any stage
+            fingerprints: optional {seed name: fingerprint}; others come from fingerprint_value()
+            targets: stages to compute (default: all); only their upstream runs
+            rerun: stages to recompute regardless of the cache (downstream follows)
+            cache: StageCache, or None for no caching
+            max_parallel: cap on concurrently running stages (default: number of stages)
+            report: optional tools.instrumentation.RunReport recording every stage
+        """
+        started = time.perf_counter()
+        budget = budget or get_executor_budget()
+        fingerprints = dict(fingerprints or {})
+
+        needed = self.upstream(targets or self.stages)
+        forced = self.downstream(rerun) & needed
+        for name in needed:
+            for value in self.stages[name].inputs:
+                if value not in self.producers and value not in seeds:
+                    raise KeyError(f"Stage {name} needs '{value}', which is neither a seed nor a stage output")
+
+        run_report = report
+        values = dict(seeds)
+        value_fps = {name: fingerprints.get(name) or fingerprint_value(value) for name, value in seeds.items()}
+        report = {}
+        pending = [name for name in self.order if name in needed]
+        running = {}
+
+        # Slots are borrowed per stage while it runs, never for the whole DAG: the caller's
+        # thread runs one ready stage itself, and only the others ready at the same time
+        # take a slot each (so a linear DAG borrows nothing and concurrent runs keep moving)
+        max_parallel = max_parallel or len(pending) or 1
+        with ThreadPoolExecutor(max_workers=max(max_parallel - 1, 1)) as executor:
+            while pending or running:
+                ready = [name for name in pending
+                         if all(value in values for value in self.stages[name].inputs)]
+                to_run = []
+                for name in ready:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    stage_fp = self._fingerprint(stage, value_fps)
+                    cached = cache.get(name, stage_fp) if cache is not None and name not in forced else None
+                    if cached is not None:
+                        self._store(stage, cached, stage_fp, values, value_fps)
+                        report[name] = {"status": "cached", "seconds": 0.0}
+                        if run_report is not None:
+                            run_report.skipped(name, rows_out=count_rows(cached))
+                        continue
+                    to_run.append((stage, stage_fp))
+
+                for index, (stage, stage_fp) in enumerate(to_run):
+                    last = index == len(to_run) - 1
+                    if not last and len(running) < max_parallel - 1 and budget.try_acquire_up_to(1):
+                        # Copy of the caller's context: per-run scopes (diagnostics) follow the stage
+                        context = contextvars.copy_context()
+                        future = executor.submit(context.run, self._execute_on_slot, budget, stage, values, run_report)
+                        running[future] = (stage.name, stage_fp)
+                    else:
+                        outputs, seconds, cacheable = self._execute(stage, values, run_report)  # caller runs
+                        self._finish(stage, outputs, seconds, cacheable, stage_fp, values, value_fps, report, cache)
+
+                if not running:
+                    if pending and not ready:
+                        raise RuntimeError(f"Stages cannot be scheduled: {pending}")
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, stage_fp = running.pop(future)
+                    outputs, seconds, cacheable = future.result()
+                    self._finish(self.stages[name], outputs, seconds, cacheable, stage_fp, values, value_fps, report,
+                                 cache)
+
+        dag_run = DAGRun(values, report, time.perf_counter() - started)
+        logging.info(f"Stage DAG finished: {dag_run.summary()}")
+        return dag_run
+
+    # ---------- Internals ----------
+    @staticmethod
+    def _fingerprint(stage, value_fps):
+        digest = hashlib.sha256(f"{stage.name}|v{stage.version}".encode())
+        for value in stage.inputs:
+            digest.update(f"|{value}={value_fps[value]}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _execute(stage, values, run_report=None):
+        start = time.perf_counter()
+        inputs = [values[value] for value in stage.inputs]
+        if run_report is None:
+            outputs = stage.fn(*inputs)
+        else:
+            with run_report.stage(stage.name, rows_in=count_rows(inputs)) as record:
+                outputs = stage.fn(*inputs)
+                record.rows_out = count_rows(outputs.value if isinstance(outputs, Uncacheable) else outputs)
+        cacheable = not isinstance(outputs, Uncacheable)
+        if not cacheable:
+            outputs = outputs.value
+        if len(stage.outputs) == 1:
+            outputs = (outputs,)
+        return tuple(outputs), time.perf_counter() - start, cacheable
+
+    @classmethod
+    def _execute_on_slot(cls, budget, stage, values, run_report=None):
+        try:
+            return cls._execute(stage, values, run_report)
+        finally:
+            budget.release(1)
+
+    def _finish(self, stage, outputs, seconds, cacheable, stage_fp, values, value_fps, report, cache):
+        if len(outputs) != len(stage.outputs):
+            raise ValueError(f"Stage {stage.name} returned {len(outputs)} values for {len(stage.outputs)} outputs")
+        # Whatever was computed from an uncacheable value is run-only as well
+        cacheable = cacheable and not any(value_fps[value].startswith(UNCACHEABLE_PREFIX) for value in stage.inputs)
+        self._store(stage, outputs, stage_fp, values, value_fps, cacheable)
+        if cache is not None and cacheable:
+            cache.put(stage.name, stage_fp, outputs)
+        report[stage.name] = {"status": "ran", "seconds": round(seconds, 4)}
+        if not cacheable:
+            report[stage.name]["cacheable"] = False
+        logging.info(f"Stage '{stage.name}' completed in {seconds:.3f}s")
+
+    @staticmethod
+    def _store(stage, outputs, stage_fp, values, value_fps, cacheable=True):
+        prefix = "" if cacheable else UNCACHEABLE_PREFIX
+        for output, value in zip(stage.outputs, outputs):
+            values[output] = value
+            value_fps[output] = f"{prefix}{stage_fp}:{output}"
+
+
+# ---------- Helpers ----------
+def fingerprint_value(value):
+    """Content fingerprint for a seed value (bytes, strings, frames, objects with a .key)"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    if getattr(value, "key", None):
+        return str(value.key)
+    if isinstance(value, pd.DataFrame):
+        digest = hashlib.sha256("|".join(map(str, value.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return hashlib.sha256(repr(value).encode()).hexdigest()
+    return f"id:{id(value)}"  # unknown objects: identity only, never shared across runs
+
+
+def _detach(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return {key: _detach(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_detach(item) for item in value)
+    return value
+
+
+_stage_cache = None
+
+
+def get_stage_cache():
+    """Process-wide stage cache; LPVP_STAGE_CACHE_ENTRIES per stage (default 2, 0 disables)"""
+    global _stage_cache
+    if _stage_cache is None:
+        _stage_cache = StageCache(int(os.getenv("LPVP_STAGE_CACHE_ENTRIES", "2")))
+    return _stage_cache
+
+
+def _stage_cache_stats():
+    return _stage_cache.stats() if _stage_cache is not None else {"entries": 0}
+
+
+def _invalidate_stage_cache():
+    if _stage_cache is not None:
+        _stage_cache.invalidate()
+
+
+register_warm_cache("stage_cache", _stage_cache_stats, _invalidate_stage_cache)
@@ -0,0 +1,144 @@
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+# Host process start, as seen by the first import of this module (function_app imports it first)
+PROCESS_STARTED = time.time()
+_started = time.perf_counter()
+
+# Modules a valuation needs; prewarm() imports them off the request path
+PREWARM_MODULES = ("pandas", "numpy", "requests", "loan_input", "orchestrator")
+
+_lock = threading.Lock()
+_import_times = {}
+_warm_caches = {}
+_first_request = None
+
+
+def module_available(name):
+    """True when name can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def timed_import(name):
+    """
+    importlib.import_module(name), recording how long the first (cold) import took.
+    Always goes through import_module: a module still being imported by the prewarm
+    thread is in sys.modules half-initialised, and import_module waits on its lock
+    (the thread that started the import records it).
+    """
+    loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if loaded:
+        return module
+    with _lock:
+        _import_times.setdefault(name, {
+            "seconds": round(time.perf_counter() - start, 4),
+            "at_uptime_seconds": round(start - _started, 3),
+            "thread": threading.current_thread().name,
+        })
+    return module
+
+
+class LazyModule:
+    """
+    Module proxy imported on first attribute access (through timed_import).
+
+        pq = LazyModule("pyarrow.parquet")   # nothing imported yet
+        pq.write_table(table, path)          # pyarrow imported here, once
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(timed_import(self._name), attr)
+
+    def __repr__(self):
+        return f"LazyModule({self._name!r}, loaded={self._name in sys.modules})"
+
+
+def prewarm(modules=PREWARM_MODULES, background=True):
+    """
+    Import the heavy modules ahead of the first request (LPVP_PREWARM, on by default):
+    on a background thread at host start-up, so indexing the Function app stays fast and
+    a request arriving early only waits for what is still loading (import locks).
+    """
+    def run():
+        for name in modules:
+            try:
+                timed_import(name)
+            except Exception as e:
+                logging.warning(f"Prewarm import of {name} failed: {e}")
+        logging.info(f"Prewarm finished at {time.perf_counter() - _started:.2f}s uptime")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="lpvp-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def prewarm_enabled():
+    return os.getenv("LPVP_PREWARM", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def mark_request(route):
+    """Note the first request of this process; returns True for that (cold) request"""
+    global _first_request
+    with _lock:
+        if _first_request is not None:
+            return False
+        _first_request = {"route": route, "at_uptime_seconds": round(time.perf_counter() - _started, 3)}
+        return True
+
+
+# ---------- Warm process-level caches ----------
+def register_warm_cache(name, stats, invalidate):
+    """
+    Make a process-level cache visible in startup_report() and clearable through
+    invalidate_warm_caches(). stats() -> JSON-able dict; invalidate() drops the cache.
+    """
+    with _lock:
+        _warm_caches[name] = (stats, invalidate)
+
+
+def invalidate_warm_caches(names=None):
+    """Drop the named caches (all when names is None); returns the names dropped"""
+    with _lock:
+        selected = dict(_warm_caches) if names is None else {name: _warm_caches[name] for name in names if name in _warm_caches}
+    for name, (_, invalidate) in selected.items():
+        invalidate()
+        logging.info(f"Warm cache invalidated: {name}")
+    return sorted(selected)
+
+
+def startup_report():
+    """Uptime, first request, cold import timings and the state of every warm cache"""
+    with _lock:
+        imports = dict(_import_times)
+        caches = dict(_warm_caches)
+        first_request = _first_request
+    cache_stats = {}
+    for name, (stats, _) in caches.items():
+        try:
+            cache_stats[name] = stats()
+        except Exception as e:
+            cache_stats[name] = {"error": str(e)}
+    return {
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.perf_counter() - _started, 3),
+        "first_request": first_request,
+        "imports": dict(sorted(imports.items(), key=lambda item: -item[1]["seconds"])),
+        "import_seconds": round(sum(entry["seconds"] for entry in imports.values()), 4),
+        "warm_caches": cache_stats,
+    }
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Responses that mean "slow down": Graph throttling (429) and overloaded service (503)
+THROTTLE_STATUSES = (429, 503)
+
+
+def retry_after_seconds(response, attempt=0, cap=120.0):
+    """
+    Seconds to wait before retrying a throttled response: its Retry-After header (delta
+    seconds or HTTP date), else exponential backoff 2 ** attempt; never more than cap.
+    """
+    value = (response.headers or {}).get("Retry-After")
+    if value:
+        try:
+            return min(max(float(value), 0.0), cap)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0), cap)
+            except (TypeError, ValueError):
+                pass
+    return min(2.0 ** attempt, cap)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for calls to a throttling service, adapted to what it answers
+    (additive increase, multiplicative decrease):
+
+    - a call holds one slot (slot()); at most `limit` calls are in flight
+    - a throttled response (throttled(retry_after)) halves the limit and pauses every
+      new call until Retry-After has passed, so all callers back off together
+    - every `increase_after` successful calls in a row raise the limit by one again,
+      up to max_limit
+
+    stats() reports the current / lowest limit, throttled responses and time spent paused.
+    """
+
+    def __init__(self, max_limit=8, min_limit=1, initial=None, increase_after=20):
+        self.max_limit = max(int(max_limit), 1)
+        self.min_limit = min(max(int(min_limit), 1), self.max_limit)
+        self.limit = min(max(int(initial or self.max_limit), self.min_limit), self.max_limit)
+        self.increase_after = max(int(increase_after), 1)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._lowest_limit = self.limit
+        self._peak_in_flight = 0
+        self._calls = 0
+        self._throttled = 0
+        self._wait_seconds = 0.0
+        self._pause_seconds = 0.0
+
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight slot for the duration of a call (waits out pauses and a full limit)"""
+        waited = time.monotonic()
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= self.limit:
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            self._calls += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._wait_seconds += time.monotonic() - waited
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def succeeded(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def throttled(self, retry_after=0.0):
+        """A throttled response: halve the limit and pause new calls for retry_after seconds"""
+        with self._cond:
+            self._throttled += 1
+            self._successes = 0
+            previous = self.limit
+            self.limit = max(self.limit // 2, self.min_limit)
+            self._lowest_limit = min(self._lowest_limit, self.limit)
+            until = time.monotonic() + max(retry_after, 0.0)
+            if until > self._paused_until:
+                self._pause_seconds += until - max(self._paused_until, time.monotonic())
+                self._paused_until = until
+            current = self.limit
+        logging.warning(f"Throttled: concurrency limit {previous} -> {current}, pausing {retry_after:.1f}s")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "max_limit": self.max_limit,
+                "lowest_limit": self._lowest_limit,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "calls": self._calls,
+                "throttled": self._throttled,
+                "wait_seconds": round(self._wait_seconds, 3),
+                "pause_seconds": round(self._pause_seconds, 3),
+            }
+
+
+def graph_concurrency():
+    """Upper bound of concurrent Graph calls in this process (LPVP_GRAPH_CONCURRENCY, default 8)"""
+    try:
+        return max(int(os.getenv("LPVP_GRAPH_CONCURRENCY", 8)), 1)
+    except ValueError:
+        logging.warning(f"Ignoring LPVP_GRAPH_CONCURRENCY={os.getenv('LPVP_GRAPH_CONCURRENCY')!r}: not an integer, using 8")
+        return 8
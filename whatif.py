@@ -0,0 +1,160 @@
+import json
+import logging
+import time
+from io import BytesIO
+
+from tools.startup import module_available, register_warm_cache
+
+# -------------------------------
+# What-if runs: uploaded tape / assumption overrides -> pipeline in memory -> JSON or Parquet
+# -------------------------------
+WHATIF_OUTPUTS = ("json", "parquet")
+OUTPUT_CONTENT_TYPES = {"json": "application/json", "parquet": "application/vnd.apache.parquet"}
+
+
+class WhatIfError(ValueError):
+    """Bad what-if input (unknown format, override or assumptions key): the caller's fault"""
+
+
+# Tape cache key and assumptions key the no-input fallbacks fetched from the default project
+# (BASE_PATH). Only these are reused: uploads and other projects' runs share the process
+# caches but never become the input of a run that didn't ask for them.
+_defaults = {}
+
+register_warm_cache(
+    "whatif_defaults",
+    lambda: {"tape": _defaults.get("tape", (None,))[0], "assumptions": _defaults.get("assumptions")},
+    _defaults.clear,
+)
+
+
+def resolve_tape(data=None, name=None, fmt=None):
+    """
+    LoanTape of a what-if run: the uploaded bytes (xlsx / csv / parquet / json), else the
+    latest Phase 1 tape of the default project (downloaded once, then cached). Uploaded
+    tapes are cached by content, so a repeat upload is not parsed again.
+    """
+    from input_data.loan_tape import cached_loan_tape, fetch_latest_loan_tape, lookup_loan_tape
+
+    if data:
+        try:
+            # Parsed here: an unreadable upload is a bad request, not a pipeline failure
+            return cached_loan_tape(data, name, fmt)
+        except Exception as e:
+            raise WhatIfError(f"Could not read uploaded tape: {e}") from e
+
+    tape = lookup_loan_tape(_defaults["tape"]) if "tape" in _defaults else None
+    if tape is None:
+        from tools.sharepoint import get_session
+        tape = fetch_latest_loan_tape(get_session())
+        if tape is None:
+            raise WhatIfError("No tape uploaded and no data tape found in Phase 1")
+        tape = cached_loan_tape(tape.data, tape.name, tape.fmt)
+        _defaults["tape"] = (tape.key, tape.fmt)
+    return tape
+
+
+def resolve_assumptions(workbook=None, key=None, overrides=None):
+    """
+    CompiledAssumptions of a what-if run: an uploaded assumptions workbook, else the
+    compiled assumptions stored under key, else the latest Phase 2 workbook of the default
+    project (compiled once, then cached). overrides (see apply_assumption_overrides) are
+    applied on top.
+    """
+    from input_data.compiled_assumptions import (
+        apply_assumption_overrides, compiled_assumptions_for_key, load_compiled_assumptions,
+    )
+
+    if workbook:
+        compiled = load_compiled_assumptions(bytes(workbook))
+    elif key:
+        compiled = compiled_assumptions_for_key(key)
+        if compiled is None:
+            raise WhatIfError(f"Unknown assumptions key: {key}")
+    else:
+        compiled = compiled_assumptions_for_key(_defaults["assumptions"]) if "assumptions" in _defaults else None
+        if compiled is None:
+            from tools.sharepoint import get_session
+            from loan_input import fetch_latest_assumptions
+            stream, _ = fetch_latest_assumptions(get_session())
+            if stream is None:
+                raise WhatIfError("No assumptions uploaded and no assumptions workbook found in Phase 2")
+            compiled = load_compiled_assumptions(stream.getvalue())
+            _defaults["assumptions"] = compiled.key
+
+    try:
+        return apply_assumption_overrides(compiled, overrides)
+    except ValueError as e:
+        raise WhatIfError(str(e)) from e
+
+
+def run_whatif(tape=None, tape_name=None, tape_format=None, assumptions=None, assumptions_key=None,
+               overrides=None, output="json", curves=False, diagnostics=None):
+    """
+    Run the pipeline on an uploaded tape and/or assumption overrides without touching
+    SharePoint (beyond a one-off fetch when nothing is cached yet) and encode the results.
+
+    tape / assumptions: raw bytes of the upload (tape in any TAPE_FORMATS, assumptions
+    as the xlsx workbook); overrides: JSON-style dict of assumption overrides.
+    output: 'json' or 'parquet' (one table, loan_type_group column per row).
+    curves: keep the per-loan total_rates / risk_rates columns (large; off by default).
+
+    Returns (payload bytes, content type, summary dict). Raises WhatIfError on bad input.
+    """
+    from loan_input import main_processing_pipeline_from_streams
+
+    output = (output or "json").strip().lower()
+    if output not in WHATIF_OUTPUTS:
+        raise WhatIfError(f"Unknown output: {output!r} (expected one of {list(WHATIF_OUTPUTS)})")
+    if output == "parquet" and not module_available("pyarrow"):
+        raise WhatIfError("Parquet output needs pyarrow (pip install pyarrow); use output=json")
+
+    started = time.perf_counter()
+    loan_tape = resolve_tape(tape, tape_name, tape_format)
+    compiled = resolve_assumptions(assumptions, assumptions_key, overrides)
+
+    results, compiled, _ = main_processing_pipeline_from_streams(loan_tape, compiled, loan_tape.name,
+                                                                 diagnostics=diagnostics)
+    if results is None:
+        raise RuntimeError("Processing pipeline failed")
+
+    frames = {type_key: _output_frame(df, curves) for type_key, df in results.items() if not df.empty}
+    summary = {
+        "status": "success",
+        "tape": loan_tape.name,
+        "tape_key": loan_tape.key[:12],
+        "assumptions_key": compiled.key,
+        "rows": {type_key: len(df) for type_key, df in frames.items()},
+        "run_context": compiled.run_context.as_dict(),
+    }
+    payload = _encode_json(frames, summary) if output == "json" else _encode_parquet(frames)
+    summary["seconds"] = round(time.perf_counter() - started, 4)
+    logging.info(f"What-if run on {loan_tape.name}: {sum(summary['rows'].values())} rows in {summary['seconds']}s")
+    return payload, OUTPUT_CONTENT_TYPES[output], summary
+
+
+def _output_frame(df, curves):
+    from output_data.phase3_writers import CURVE_COLUMNS
+
+    if curves:
+        return df
+    return df.drop(columns=[col for col in CURVE_COLUMNS if col in df.columns])
+
+
+def _encode_json(frames, summary):
+    # Frames go through pandas' encoder (dates as ISO, NaN as null); the envelope through json
+    results = ", ".join(f"{json.dumps(type_key)}: {df.to_json(orient='records', date_format='iso')}"
+                        for type_key, df in frames.items())
+    envelope = json.dumps(summary, default=str)
+    return f'{envelope[:-1]}, "results": {{{results}}}}}'.encode("utf-8")
+
+
+def _encode_parquet(frames):
+    import pandas as pd
+    from output_data.phase3_writers import _parquet_safe, pa, pq
+
+    parts = [df.assign(loan_type_group=type_key) for type_key, df in frames.items()]
+    combined = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    buffer = BytesIO()
+    pq.write_table(pa.Table.from_pandas(_parquet_safe(combined), preserve_index=False), buffer, compression="zstd")
+    return buffer.getvalue()